@@ -1,22 +1,962 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g, Response, stream_with_context, send_from_directory, has_request_context, has_app_context
 import sqlite3
-from datetime import datetime, date
+import base64
+import calendar
+import click
+import csv
+import hashlib
+import heapq
+import html
+import io
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta, timezone
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: WRITER_LOCK_FILE is ignored and writers from several
+    # processes fall back on SQLite's busy_timeout
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:
+    # /api/analytics/rent-roll answers 501 without it
+    np = None
 
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
 
 DATABASE = 'emall.db'
 
+# Default settings, can be overridden with FLASK_* environment variables
+# (e.g. FLASK_DB_POOL_SIZE=10)
+app.config.update(
+    DATABASE=DATABASE,
+    DB_POOL_SIZE=5,
+    DB_POOL_TIMEOUT=5.0,
+    DB_POOL_HEALTH_CHECK_INTERVAL=30.0,
+    # Seconds between background lease expiry runs, 0 disables the job
+    LEASE_EXPIRY_INTERVAL=3600,
+    # Seconds a cached aggregate (e.g. the dashboard summary) stays valid
+    # when nothing has been written in between
+    QUERY_CACHE_TTL=30,
+    # Largest page a list endpoint will return with ?limit=
+    LIST_MAX_LIMIT=500,
+    # Rows fetched per batch when a list is streamed with ?stream=json|ndjson
+    STREAM_BATCH_SIZE=500,
+    # Rows validated and inserted per transaction by the bulk import API
+    BULK_CHUNK_SIZE=5000,
+    # Per-row errors included in a bulk import report
+    BULK_MAX_ERRORS=1000,
+    # Changed leases listed in a /api/leases/batch diff
+    BATCH_DIFF_LIMIT=1000,
+    # Where snapshots created by /api/export/snapshot are written
+    SNAPSHOT_DIR='snapshots',
+    # Pages copied per backup step, -1 copies everything in one step. In WAL mode a
+    # single step doesn't block writers; smaller steps are for rollback-journal
+    # databases, but restart whenever another connection writes in between.
+    SNAPSHOT_PAGES_PER_STEP=-1,
+    # Seconds to sleep between backup steps
+    SNAPSHOT_STEP_SLEEP=0.05,
+    # Statements taking at least this many milliseconds (execute plus fetch)
+    # are written to the slow-query log with their query plan
+    SLOW_QUERY_MS=100,
+    # File the slow-query log is appended to as JSON lines, empty to only log a warning
+    SLOW_QUERY_LOG='slow_queries.log',
+    # Recent request profiles kept for /api/_debug/profile
+    PROFILE_HISTORY=200,
+    # Rows kept in change_log for /api/events clients to resume from
+    CHANGE_LOG_MAX_ROWS=100000,
+    # Seconds between change_log pruning runs, 0 disables the job
+    CHANGE_LOG_PRUNE_INTERVAL=600,
+    # Longest an /api/events stream waits between change_log checks; writes
+    # made through this process wake it up straight away
+    EVENTS_POLL_INTERVAL=1.0,
+    # Seconds of silence before an /api/events stream sends a keepalive comment
+    EVENTS_HEARTBEAT=15,
+    # Seconds before an /api/events stream is closed; the browser reconnects
+    # with Last-Event-ID and carries on where it left off
+    EVENTS_STREAM_TIMEOUT=300,
+    # Most rows and tombstones one /api/sync response carries, full copies included
+    SYNC_MAX_LIMIT=5000,
+    # Days a delete tombstone is kept; clients that last synced before the
+    # oldest pruned tombstone get a full resync
+    SYNC_TOMBSTONE_DAYS=30,
+    # Seconds between tombstone pruning runs, 0 disables the job
+    SYNC_TOMBSTONE_PRUNE_INTERVAL=3600,
+    # Most results /api/search returns with ?limit=
+    SEARCH_MAX_LIMIT=100,
+    # Worker threads asgi.py runs requests on. Writes get their own small
+    # pool so requests waiting for the writer slot never hold up reads, and
+    # long-lived event streams get theirs so they can't use up either one.
+    ASGI_READ_THREADS=8,
+    ASGI_WRITE_THREADS=2,
+    ASGI_STREAM_THREADS=32,
+    # File writers lock with flock() so that only one process at a time
+    # writes, instead of all of them retrying on busy_timeout. Empty means
+    # only writers in this process queue up. `flask serve` sets it for
+    # its workers. {database} is replaced with the database path, so each
+    # mall gets its own lock.
+    WRITER_LOCK_FILE='',
+    # Directory of per-mall databases (<mall_id>.db). When set, requests to
+    # /malls/<mall_id>/... or with a MALL_HEADER header use that mall's
+    # database; everything else still uses DATABASE.
+    MALLS_DIR='',
+    MALL_HEADER='X-Mall-Id',
+    # Threads the /api/portfolio endpoints query the malls' databases on
+    PORTFOLIO_WORKERS=8,
+    # Longest projection /api/analytics/rent-roll returns with ?months=
+    RENT_ROLL_MAX_MONTHS=120,
+    # Leases (by id range) a billing run invoices per transaction; progress
+    # is saved after each one, so a run that stops resumes from there
+    BILLING_CHUNK_SIZE=50000,
+    # Days after the first of the month that a period's invoices are due
+    BILLING_DUE_DAYS=14,
+    # Seconds a technician's claim on a maintenance ticket lasts unless it
+    # is claimed again; expired claims go back to the dispatch queue
+    DISPATCH_CLAIM_TIMEOUT=1800,
+    # Seconds between runs of the job that requeues expired claims, 0 disables it
+    DISPATCH_CLAIM_CHECK_INTERVAL=60,
+    # Most change_log entries the dispatch queue catches up on one by one;
+    # further behind, it reloads the pending tickets instead
+    DISPATCH_MAX_CATCH_UP=10000,
+    # Journal mode is stored in the database file, so init_db() sets it once
+    DB_JOURNAL_MODE='WAL',
+    # PRAGMAs applied once when a pooled connection is opened
+    DB_PRAGMAS={
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'cache_size': -8000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+)
+app.config.from_prefixed_env()
+
+class PoolTimeoutError(Exception):
+    pass
+
+class QueryArgumentError(ValueError):
+    pass
+
+# In-process cache for expensive aggregate queries.
+# Entries expire after ttl seconds and are all dropped whenever a writer finishes.
+class ResultCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+        }
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+            generation = self._generation
+        
+        value = compute()
+        
+        with self._lock:
+            # Don't store a result computed while a write was being committed
+            if generation == self._generation:
+                self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.stats['invalidations'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        return stats
+
+# FIFO lock that lets only one writer at a time into a database.
+# Readers never take it, so with WAL they keep running while a write is in progress.
+class WriterQueue:
+    def __init__(self, on_release=None, lock_path=None):
+        self.on_release = on_release
+        self.lock_path = lock_path if fcntl is not None else None
+        self._lock_file = None
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self.stats = {
+            'writes': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_queue_depth': 0,
+            'lock_wait_time': 0.0,
+        }
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            depth = self._next_ticket - self._serving - 1
+            if depth > self.stats['max_queue_depth']:
+                self.stats['max_queue_depth'] = depth
+            if ticket != self._serving:
+                self.stats['waits'] += 1
+                while ticket != self._serving:
+                    self._cond.wait()
+            self.stats['writes'] += 1
+            self.stats['wait_time'] += time.monotonic() - started
+        
+        if self.lock_path:
+            # Only the thread holding the slot gets here, so one open file
+            # per process is enough; other processes queue on the flock()
+            locked = time.monotonic()
+            try:
+                if self._lock_file is None:
+                    self._lock_file = open(self.lock_path, 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            except BaseException:
+                self._advance()
+                raise
+            self.stats['lock_wait_time'] += time.monotonic() - locked
+
+    def release(self):
+        if self.on_release is not None:
+            self.on_release()
+        if self.lock_path:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._advance()
+
+    def _advance(self):
+        with self._cond:
+            self._serving += 1
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats['queue_depth'] = self._next_ticket - self._serving
+        stats['wait_time'] = round(stats['wait_time'], 6)
+        stats['lock_wait_time'] = round(stats['lock_wait_time'], 6)
+        return stats
+
+# Counters and histograms for /metrics, kept in memory and rendered in the
+# Prometheus text exposition format
+class Metrics:
+    def __init__(self, definitions, buckets):
+        self.definitions = definitions
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    # Render every recorded metric, plus the gauges passed in as
+    # {name: [(labels, value), ...]}
+    def render(self, gauges=None):
+        with self._lock:
+            samples = {}
+            for (name, labels), value in self._counters.items():
+                samples.setdefault(name, []).append((name, labels, value))
+            for (name, labels), (counts, total, count) in self._histograms.items():
+                lines = samples.setdefault(name, [])
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append((f'{name}_bucket', labels + (('le', format_metric_value(bound)),), bucket_count))
+                lines.append((f'{name}_bucket', labels + (('le', '+Inf'),), count))
+                lines.append((f'{name}_sum', labels, total))
+                lines.append((f'{name}_count', labels, count))
+        for name, values in (gauges or {}).items():
+            samples[name] = [(name, tuple(sorted(labels.items())), value) for labels, value in values]
+        
+        output = []
+        for name, (metric_type, help_text) in self.definitions.items():
+            if name not in samples:
+                continue
+            output.append(f'# HELP {name} {help_text}')
+            output.append(f'# TYPE {name} {metric_type}')
+            # Group samples by label set, keeping histogram buckets in order
+            for sample_name, labels, value in sorted(samples[name], key=lambda sample: [l for l in sample[1] if l[0] != 'le']):
+                label_text = ','.join(f'{key}="{escape_label_value(label)}"' for key, label in labels)
+                output.append(f"{sample_name}{'{' + label_text + '}' if label_text else ''} {format_metric_value(value)}")
+        return '\n'.join(output) + '\n'
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_metric_value(value):
+    if isinstance(value, float):
+        return repr(value) if not value.is_integer() else str(int(value))
+    return str(value)
+
+METRIC_DEFINITIONS = {
+    'emall_http_requests_total': ('counter', 'HTTP requests by method, route and status code.'),
+    'emall_http_request_duration_seconds': ('histogram', 'HTTP request latency by method and route.'),
+    'emall_http_request_db_seconds_total': ('counter', 'Time spent in SQLite statements by method and route.'),
+    'emall_http_request_statements_total': ('counter', 'SQL statements run by method and route.'),
+    'emall_db_rollbacks_total': ('counter', 'Transactions rolled back, by route (none outside a request).'),
+    'emall_db_busy_errors_total': ('counter', 'Statements that failed with database is locked/busy after busy_timeout.'),
+    'emall_db_size_bytes': ('gauge', 'Size of the SQLite database file.'),
+    'emall_db_wal_size_bytes': ('gauge', 'Size of the SQLite write-ahead log.'),
+    'emall_pool_connections': ('gauge', 'Open pooled connections by state.'),
+    'emall_pool_checkouts_total': ('counter', 'Connection checkouts by result (hit, miss, wait).'),
+    'emall_pool_wait_seconds_total': ('counter', 'Time spent waiting for a free pooled connection.'),
+    'emall_pool_timeouts_total': ('counter', 'Connection checkouts that timed out.'),
+    'emall_writer_acquisitions_total': ('counter', 'Times the writer slot was taken.'),
+    'emall_writer_waits_total': ('counter', 'Writer slot acquisitions that had to queue behind another writer.'),
+    'emall_writer_wait_seconds_total': ('counter', 'Time spent queueing for the writer slot.'),
+    'emall_writer_queue_depth': ('gauge', 'Writers holding or queued for the writer slot.'),
+    'emall_writer_lock_wait_seconds_total': ('counter', 'Time spent waiting for other processes to release WRITER_LOCK_FILE.'),
+    'emall_cache_lookups_total': ('counter', 'Query cache lookups by result (hit, miss).'),
+    'emall_cache_invalidations_total': ('counter', 'Query cache invalidations.'),
+    'emall_cache_entries': ('gauge', 'Entries in the query cache.'),
+}
+
+metrics = Metrics(
+    METRIC_DEFINITIONS,
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+)
+
+# Route template of the current request, used as a metric label
+def current_route():
+    if not has_request_context():
+        return 'none'
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+# Statements run on one connection checkout, with their latency and row counts
+class QueryProfile:
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+
+    def add(self, sql, parameters, duration):
+        query = {'sql': sql, 'parameters': parameters, 'duration': duration, 'rows': 0}
+        self.queries.append(query)
+        self.db_time += duration
+        return query
+
+    def add_fetch(self, query, rows, duration):
+        query['rows'] += rows
+        query['duration'] += duration
+        self.db_time += duration
+
+# Cursor that times every statement (and the fetches that step through its
+# results) into the connection's current QueryProfile, if it has one
+class ProfilingCursor(sqlite3.Cursor):
+    _profile = None
+    _query = None
+
+    def _run(self, method, sql, parameters):
+        if sql.lstrip()[:8].upper() == 'ROLLBACK' and self.connection.in_transaction:
+            metrics.inc('emall_db_rollbacks_total', route=current_route())
+        profile = self._profile = self.connection.profile
+        started = time.perf_counter()
+        try:
+            return method(sql) if parameters is None else method(sql, parameters)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                metrics.inc('emall_db_busy_errors_total')
+            raise
+        finally:
+            if profile is None:
+                self._query = None
+            else:
+                self._query = profile.add(sql, parameters, time.perf_counter() - started)
+                # Statements that don't return rows count the rows they changed
+                if self.description is None and self.rowcount > 0:
+                    self._query['rows'] = self.rowcount
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Keep the first set of parameters for EXPLAIN QUERY PLAN
+        seq_of_parameters = iter(seq_of_parameters)
+        first = next(seq_of_parameters, None)
+        if first is None:
+            return self._run(super().executemany, sql, [])
+        result = self._run(super().executemany, sql, itertools.chain([first], seq_of_parameters))
+        if self._query is not None:
+            self._query['parameters'] = first
+        return result
+
+    def executescript(self, sql_script):
+        return self._run(super().executescript, sql_script, None)
+
+    def _fetch(self, method, *args):
+        if self._query is None:
+            return method(*args)
+        started = time.perf_counter()
+        rows = method(*args)
+        count = len(rows) if isinstance(rows, list) else int(rows is not None)
+        self._profile.add_fetch(self._query, count, time.perf_counter() - started)
+        return rows
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._query is None:
+            return super().__next__()
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._profile.add_fetch(self._query, 0, time.perf_counter() - started)
+            raise
+        self._profile.add_fetch(self._query, 1, time.perf_counter() - started)
+        return row
+
+# sqlite3.Connection subclass so the pool can keep bookkeeping on each connection
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    last_used = 0.0
+    profile = None
+
+    # Connection.execute() and friends don't go through cursor(), so route
+    # them through it to get a ProfilingCursor
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def rollback(self):
+        if self.in_transaction:
+            metrics.inc('emall_db_rollbacks_total', route=current_route())
+        super().rollback()
+
+# Bounded pool of SQLite connections shared by all request threads
+class ConnectionPool:
+    def __init__(self, database, size=5, timeout=5.0, health_check_interval=30.0, pragmas=None, cache_ttl=30,
+                 writer_lock=None):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pragmas = dict(pragmas or {})
+        self.cache = ResultCache(cache_ttl)
+        self.writer = WriterQueue(on_release=self._writer_released, lock_path=writer_lock)
+        self.dispatch = DispatchQueue()
+        # Bumped every time a writer finishes, for /api/events streams to wait on
+        self.write_count = 0
+        self._write_done = threading.Condition()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        return conn
+
+    def _is_healthy(self, conn):
+        # Only ping connections that have been idle for a while
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _writer_released(self):
+        self.cache.invalidate()
+        with self._write_done:
+            self.write_count += 1
+            self._write_done.notify_all()
+
+    # Wait until a writer finishes after write_count was last seen as seen_count
+    def wait_for_write(self, seen_count, timeout):
+        with self._write_done:
+            return self._write_done.wait_for(lambda: self.write_count != seen_count, timeout)
+
+    def acquire(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+                hit = True
+            except queue.Empty:
+                conn = None
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        conn = self._connect()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    with self._lock:
+                        self.stats['misses'] += 1
+                    return conn
+                # Pool exhausted, wait for another request to release a connection
+                started = time.monotonic()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.stats['timeouts'] += 1
+                    raise PoolTimeoutError('Timed out waiting for a database connection')
+                finally:
+                    with self._lock:
+                        self.stats['waits'] += 1
+                        self.stats['wait_time'] += time.monotonic() - started
+                hit = False
+
+            if not self._is_healthy(conn):
+                with self._lock:
+                    self.stats['health_check_failures'] += 1
+                self._discard(conn)
+                continue
+
+            if hit:
+                with self._lock:
+                    self.stats['hits'] += 1
+            return conn
+
+    def release(self, conn):
+        try:
+            # Undo anything a request may have left behind on the connection
+            if conn.in_transaction:
+                conn.rollback()
+            conn.isolation_level = ''
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA foreign_keys = OFF')
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        conn.last_used = time.monotonic()
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            created = self._created
+        idle = self._idle.qsize()
+        lookups = stats['hits'] + stats['misses'] + stats['waits']
+        stats.update({
+            'database': self.database,
+            'size': self.size,
+            'open_connections': created,
+            'idle_connections': idle,
+            'in_use_connections': created - idle,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0,
+            'wait_time': round(stats['wait_time'], 6),
+            'writer': self.writer.snapshot(),
+            'cache': self.cache.snapshot(),
+        })
+        return stats
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Get (or lazily create) the pool for a database, by default the current mall's
+def get_pool(database=None):
+    database = database or current_database()
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            writer_lock = app.config['WRITER_LOCK_FILE']
+            pool = ConnectionPool(
+                database,
+                size=app.config['DB_POOL_SIZE'],
+                timeout=app.config['DB_POOL_TIMEOUT'],
+                health_check_interval=app.config['DB_POOL_HEALTH_CHECK_INTERVAL'],
+                pragmas=app.config['DB_PRAGMAS'],
+                cache_ttl=app.config['QUERY_CACHE_TTL'],
+                writer_lock=writer_lock.format(database=database) if writer_lock else None,
+            )
+            _pools[database] = pool
+        return pool
+
+# Close every idle pooled connection and forget the pools, e.g. before
+# starting worker processes that open their own
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+DEFAULT_MALL = 'default'
+MALL_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+MALL_PATH_PATTERN = re.compile(r'^/malls/([^/]+)(/.*)?$')
+
+# Mall id -> database file for every mall: the <mall_id>.db files in
+# MALLS_DIR, or just DATABASE when there are no per-mall databases
+def mall_databases():
+    malls_dir = app.config['MALLS_DIR']
+    if not malls_dir:
+        return {DEFAULT_MALL: app.config['DATABASE']}
+    if not os.path.isdir(malls_dir):
+        return {}
+    return {
+        name[:-3]: os.path.join(malls_dir, name)
+        for name in sorted(os.listdir(malls_dir))
+        if name.endswith('.db') and MALL_ID_PATTERN.match(name[:-3])
+    }
+
+# Database file of a mall, or None if there's no such mall
+def mall_database(mall_id):
+    malls_dir = app.config['MALLS_DIR']
+    if not malls_dir or not MALL_ID_PATTERN.match(mall_id):
+        return None
+    path = os.path.join(malls_dir, f'{mall_id}.db')
+    return path if os.path.isfile(path) else None
+
+# DATABASE plus every mall's database, for migrations and background jobs
+def all_databases():
+    databases = [app.config['DATABASE']]
+    for database in mall_databases().values():
+        if database not in databases:
+            databases.append(database)
+    return databases
+
+# Database of the mall the current request (or job) was routed to
+def current_database():
+    if has_app_context() and 'database' in g:
+        return g.database
+    return app.config['DATABASE']
+
+# Serve /malls/<mall_id>/... with the app's normal routes: the prefix moves
+# to SCRIPT_NAME and select_mall() picks the mall's database
+class MallPathMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        match = MALL_PATH_PATTERN.match(environ.get('PATH_INFO', ''))
+        if match:
+            mall_id = match.group(1)
+            environ['emall.mall_id'] = mall_id
+            environ['SCRIPT_NAME'] = f"{environ.get('SCRIPT_NAME', '')}/malls/{mall_id}"
+            environ['PATH_INFO'] = match.group(2) or '/'
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = MallPathMiddleware(app.wsgi_app)
+
 # Helper function to get database connection
+# The connection is checked out of the pool once per app context and
+# returned to it in close_db() when the context is torn down
 def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+        g.db.profile = QueryProfile()
+    return g.db
+
+# Mark a POST/PUT/PATCH/DELETE view that doesn't write to the database,
+# so it doesn't wait for (or hold up) the writer slot
+def read_only(view):
+    view.read_only = True
+    return view
+
+# Route the request to a mall's database by URL prefix or MALL_HEADER;
+# requests naming neither use DATABASE. Runs before anything opens a connection.
+@app.before_request
+def select_mall():
+    mall_id = request.environ.get('emall.mall_id') or request.headers.get(app.config['MALL_HEADER'])
+    if not mall_id:
+        return
+    database = mall_database(mall_id)
+    if database is None:
+        return jsonify({'error': f"Unknown mall '{mall_id}'"}), 404
+    g.mall_id = mall_id
+    g.database = database
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+# Mark a GET view with the tables it reads, so its responses get an ETag and
+# Last-Modified from those tables' versions and can be answered with a 304
+def depends_on(*tables):
+    def decorate(view):
+        view.tables = tables
+        return view
+    return decorate
+
+# Answer conditional GETs from the table versions alone, before the view reads any rows
+@app.before_request
+def check_conditional_get():
+    if request.method not in ('GET', 'HEAD'):
+        return
+    view = app.view_functions.get(request.endpoint)
+    tables = getattr(view, 'tables', None)
+    if not tables:
+        return
+    
+    rows = get_db().execute('SELECT name, version, modified_at FROM table_versions').fetchall()
+    versions = {row['name']: row for row in rows if row['name'] in tables}
+    g.table_versions = tuple((name, versions[name]['version']) for name in sorted(versions))
+    
+    # The same URL can be served as JSON or NDJSON, and for another mall when it's
+    # picked by header, so the Accept header and database are part of the tag
+    tag = f"{current_database()}|{request.full_path}|{request.headers.get('Accept', '')}|{g.table_versions}"
+    g.etag = hashlib.sha1(tag.encode()).hexdigest()[:24]
+    g.last_modified = max(
+        (datetime.strptime(row['modified_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+         for row in versions.values()),
+        default=None
+    )
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(g.etag)
+    else:
+        not_modified = (request.if_modified_since is not None and g.last_modified is not None
+                        and g.last_modified <= request.if_modified_since)
+    if not_modified:
+        return Response(status=304)
+
+@app.after_request
+def add_cache_headers(response):
+    if 'etag' in g and response.status_code in (200, 304):
+        response.set_etag(g.etag)
+        response.last_modified = g.last_modified
+        # Let clients keep the response but revalidate it every time
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept')
+        if app.config['MALLS_DIR']:
+            response.vary.add(app.config['MALL_HEADER'])
+    return response
+
+# Requests that modify data queue up for the database's single writer slot
+@app.before_request
+def acquire_writer():
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, 'read_only', False):
+            return
+        writer = get_pool().writer
+        started = time.perf_counter()
+        writer.acquire()
+        g.writer_wait = time.perf_counter() - started
+        g.writer = writer
+
+# Report database time so far (streamed responses keep querying after this)
+@app.after_request
+def add_timing_headers(response):
+    conn = g.get('db')
+    db_time = conn.profile.db_time * 1000 if conn is not None and conn.profile else 0.0
+    statements = len(conn.profile.queries) if conn is not None and conn.profile else 0
+    timings = [f'db;dur={db_time:.3f};desc="{statements} queries"']
+    if 'writer_wait' in g:
+        timings.append(f"writer;dur={g.writer_wait * 1000:.3f}")
+    if 'request_started' in g:
+        timings.append(f"total;dur={(time.perf_counter() - g.request_started) * 1000:.3f}")
+    response.headers['X-DB-Time'] = f'{db_time:.3f}'
+    response.headers['Server-Timing'] = ', '.join(timings)
+    g.response_status = response.status_code
+    return response
+
+profile_history = deque(maxlen=app.config['PROFILE_HISTORY'])
+route_profiles = {}
+_profiles_lock = threading.Lock()
+_slow_query_lock = threading.Lock()
+
+def explain_query(conn, sql, parameters):
+    # Scripts can't be explained as one statement
+    if parameters is None:
+        return None
+    try:
+        return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)]
+    except sqlite3.Error:
+        return None
+
+def log_slow_query(conn, query):
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'duration_ms': round(query['duration'] * 1000, 3),
+        'rows': query['rows'],
+        'sql': ' '.join(query['sql'].split()),
+        'plan': explain_query(conn, query['sql'], query['parameters']),
+    }
+    if has_request_context():
+        entry['method'] = request.method
+        entry['path'] = request.path
+    app.logger.warning('Slow query (%.1f ms): %s', entry['duration_ms'], entry['sql'][:200])
+    path = app.config['SLOW_QUERY_LOG']
+    if path:
+        with _slow_query_lock, open(path, 'a') as log:
+            log.write(json.dumps(entry) + '\n')
+
+# Add a finished request's profile to the history and its route's totals
+def record_request_profile(profile):
+    rule = request.url_rule.rule if request.url_rule else request.path
+    route = f'{request.method} {rule}'
+    duration = time.perf_counter() - g.request_started if 'request_started' in g else 0.0
+    entry = {
+        'at': datetime.now().isoformat(timespec='milliseconds'),
+        'route': route,
+        'path': request.full_path.rstrip('?'),
+        'status': g.get('response_status'),
+        'duration_ms': round(duration * 1000, 3),
+        'db_time_ms': round(profile.db_time * 1000, 3),
+        'statement_count': len(profile.queries),
+        'statements': [{
+            'sql': ' '.join(query['sql'].split()),
+            'duration_ms': round(query['duration'] * 1000, 3),
+            'rows': query['rows'],
+        } for query in profile.queries],
+    }
+    with _profiles_lock:
+        profile_history.append(entry)
+        totals = route_profiles.setdefault(route, {
+            'requests': 0,
+            'duration': 0.0,
+            'db_time': 0.0,
+            'max_db_time': 0.0,
+            'statements': 0,
+            'max_statements': 0,
+        })
+        totals['requests'] += 1
+        totals['duration'] += duration
+        totals['db_time'] += profile.db_time
+        totals['max_db_time'] = max(totals['max_db_time'], profile.db_time)
+        totals['statements'] += len(profile.queries)
+        totals['max_statements'] = max(totals['max_statements'], len(profile.queries))
+
+# Log the slow statements of a connection checkout and, for requests, keep its profile
+def finish_profile(conn):
+    profile = conn.profile
+    conn.profile = None
+    if profile is None:
+        return
+    threshold = app.config['SLOW_QUERY_MS'] / 1000
+    for query in profile.queries:
+        if query['duration'] >= threshold:
+            log_slow_query(conn, query)
+    if has_request_context():
+        record_request_profile(profile)
+
+# Finish the profile and request metrics while the request is still around to label them
+@app.teardown_request
+def finish_request(exception=None):
+    conn = g.get('db')
+    profile = conn.profile if conn is not None else None
+    if conn is not None:
+        finish_profile(conn)
+    
+    route = current_route()
+    status = g.get('response_status', 500)
+    metrics.inc('emall_http_requests_total', method=request.method, route=route, status=status)
+    if 'request_started' in g:
+        metrics.observe('emall_http_request_duration_seconds', time.perf_counter() - g.request_started,
+                        method=request.method, route=route)
+    if profile is not None:
+        metrics.inc('emall_http_request_db_seconds_total', profile.db_time, method=request.method, route=route)
+        metrics.inc('emall_http_request_statements_total', len(profile.queries), method=request.method, route=route)
+
+@app.teardown_appcontext
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        finish_profile(conn)
+        conn.pool.release(conn)
+    writer = g.pop('writer', None)
+    if writer is not None:
+        writer.release()
+
+@app.errorhandler(PoolTimeoutError)
+def handle_pool_timeout(e):
+    return jsonify({'error': str(e)}), 503
+
+@app.errorhandler(QueryArgumentError)
+def handle_query_argument_error(e):
+    return jsonify({'error': str(e)}), 400
 
 # Initialize database tables
 def init_db():
     conn = get_db()
     cursor = conn.cursor()
     
+    # WAL lets readers carry on while a write transaction is open
+    cursor.execute(f"PRAGMA journal_mode = {app.config['DB_JOURNAL_MODE']}")
+    
     # Create tables
     cursor.executescript('''
     CREATE TABLE IF NOT EXISTS shop (
@@ -62,16 +1002,37 @@ def init_db():
         FOREIGN KEY (shop_id) REFERENCES shop (id)
     );
     
+    -- Counter tables, kept up to date by the counter_* triggers below
+    CREATE TABLE IF NOT EXISTS shop_counters (
+        shop_id INTEGER PRIMARY KEY,
+        open_maintenance_count INTEGER NOT NULL DEFAULT 0
+    );
+    
+    CREATE TABLE IF NOT EXISTS tenant_counters (
+        tenant_id INTEGER PRIMARY KEY,
+        active_lease_count INTEGER NOT NULL DEFAULT 0
+    );
+    
+    CREATE TABLE IF NOT EXISTS mall_counters (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_shops INTEGER NOT NULL DEFAULT 0,
+        occupied_shops INTEGER NOT NULL DEFAULT 0,
+        total_tenants INTEGER NOT NULL DEFAULT 0,
+        pending_maintenance INTEGER NOT NULL DEFAULT 0,
+        tenants_with_leases INTEGER NOT NULL DEFAULT 0
+    );
+    
+    INSERT OR IGNORE INTO mall_counters (id) VALUES (1);
+    
     -- Create views
     DROP VIEW IF EXISTS shop_summary;
     CREATE VIEW shop_summary AS
     SELECT s.id, s.name, s.location, s.size, s.rent, s.status,
            t.name as tenant_name, t.id as tenant_id,
-           COUNT(m.id) as maintenance_count
+           COALESCE(c.open_maintenance_count, 0) as maintenance_count
     FROM shop s
-    LEFT JOIN tenant t ON s.id = t.shop_id
-    LEFT JOIN maintenance m ON s.id = m.shop_id AND (m.status = 'Pending' OR m.status = 'In Progress')
-    GROUP BY s.id;
+    LEFT JOIN tenant t ON t.id = (SELECT id FROM tenant WHERE shop_id = s.id ORDER BY id LIMIT 1)
+    LEFT JOIN shop_counters c ON c.shop_id = s.id;
     
     DROP VIEW IF EXISTS tenant_lease_view;
     CREATE VIEW tenant_lease_view AS
@@ -88,7 +1049,14 @@ def init_db():
            t.name as tenant_name, t.contact as tenant_contact
     FROM maintenance m
     JOIN shop s ON m.shop_id = s.id
-    LEFT JOIN tenant t ON s.id = t.shop_id;
+    LEFT JOIN tenant t ON t.id = (SELECT id FROM tenant WHERE shop_id = s.id ORDER BY id LIMIT 1);
+    
+    DROP VIEW IF EXISTS lease_details;
+    CREATE VIEW lease_details AS
+    SELECT l.*, t.name as tenant_name, s.name as shop_name
+    FROM lease l
+    JOIN tenant t ON l.tenant_id = t.id
+    JOIN shop s ON l.shop_id = s.id;
     
     -- Triggers for maintaining shop status
     DROP TRIGGER IF EXISTS update_shop_status_on_tenant_insert;
@@ -102,7 +1070,7 @@ def init_db():
     
     DROP TRIGGER IF EXISTS update_shop_status_on_tenant_update;
     CREATE TRIGGER update_shop_status_on_tenant_update
-    AFTER UPDATE ON tenant
+    AFTER UPDATE OF shop_id ON tenant
     WHEN OLD.shop_id != NEW.shop_id
     BEGIN
         -- Set new shop to occupied
@@ -130,7 +1098,7 @@ def init_db():
     
     DROP TRIGGER IF EXISTS update_maintenance_resolved_date;
     CREATE TRIGGER update_maintenance_resolved_date
-    AFTER UPDATE ON maintenance
+    AFTER UPDATE OF status ON maintenance
     WHEN NEW.status = 'Completed' AND OLD.status != 'Completed' AND NEW.resolved_date IS NULL
     BEGIN
         UPDATE maintenance
@@ -147,6 +1115,158 @@ def init_db():
         SET status = 'Maintenance'
         WHERE id = NEW.shop_id;
     END;
+    
+    -- Triggers for maintaining the counter tables
+    DROP TRIGGER IF EXISTS counter_shop_insert;
+    CREATE TRIGGER counter_shop_insert
+    AFTER INSERT ON shop
+    BEGIN
+        INSERT OR IGNORE INTO shop_counters (shop_id) VALUES (NEW.id);
+        UPDATE mall_counters
+        SET total_shops = total_shops + 1,
+            occupied_shops = occupied_shops + (NEW.status IS 'Occupied');
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_shop_update;
+    CREATE TRIGGER counter_shop_update
+    AFTER UPDATE OF status ON shop
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE mall_counters
+        SET occupied_shops = occupied_shops + (NEW.status IS 'Occupied') - (OLD.status IS 'Occupied');
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_shop_delete;
+    CREATE TRIGGER counter_shop_delete
+    AFTER DELETE ON shop
+    BEGIN
+        DELETE FROM shop_counters WHERE shop_id = OLD.id;
+        UPDATE mall_counters
+        SET total_shops = total_shops - 1,
+            occupied_shops = occupied_shops - (OLD.status IS 'Occupied');
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_tenant_insert;
+    CREATE TRIGGER counter_tenant_insert
+    AFTER INSERT ON tenant
+    BEGIN
+        INSERT OR IGNORE INTO tenant_counters (tenant_id) VALUES (NEW.id);
+        UPDATE mall_counters SET total_tenants = total_tenants + 1;
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_tenant_delete;
+    CREATE TRIGGER counter_tenant_delete
+    AFTER DELETE ON tenant
+    BEGIN
+        UPDATE mall_counters
+        SET total_tenants = total_tenants - 1,
+            tenants_with_leases = tenants_with_leases - EXISTS (
+                SELECT 1 FROM tenant_counters
+                WHERE tenant_id = OLD.id AND active_lease_count > 0
+            );
+        DELETE FROM tenant_counters WHERE tenant_id = OLD.id;
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_lease_insert;
+    CREATE TRIGGER counter_lease_insert
+    AFTER INSERT ON lease
+    WHEN NEW.status = 'Active'
+    BEGIN
+        -- The tenant's first active lease makes them a tenant with a lease
+        UPDATE mall_counters
+        SET tenants_with_leases = tenants_with_leases + 1
+        WHERE EXISTS (
+            SELECT 1 FROM tenant_counters
+            WHERE tenant_id = NEW.tenant_id AND active_lease_count = 0
+        );
+        UPDATE tenant_counters
+        SET active_lease_count = active_lease_count + 1
+        WHERE tenant_id = NEW.tenant_id;
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_lease_update;
+    CREATE TRIGGER counter_lease_update
+    AFTER UPDATE OF tenant_id, status ON lease
+    WHEN OLD.status IS NOT NEW.status OR OLD.tenant_id IS NOT NEW.tenant_id
+    BEGIN
+        -- Take the old row out of the counts...
+        UPDATE tenant_counters
+        SET active_lease_count = active_lease_count - 1
+        WHERE tenant_id = OLD.tenant_id AND OLD.status = 'Active';
+        UPDATE mall_counters
+        SET tenants_with_leases = tenants_with_leases - 1
+        WHERE OLD.status = 'Active' AND EXISTS (
+            SELECT 1 FROM tenant_counters
+            WHERE tenant_id = OLD.tenant_id AND active_lease_count = 0
+        );
+        
+        -- ...then add the new one
+        UPDATE mall_counters
+        SET tenants_with_leases = tenants_with_leases + 1
+        WHERE NEW.status = 'Active' AND EXISTS (
+            SELECT 1 FROM tenant_counters
+            WHERE tenant_id = NEW.tenant_id AND active_lease_count = 0
+        );
+        UPDATE tenant_counters
+        SET active_lease_count = active_lease_count + 1
+        WHERE tenant_id = NEW.tenant_id AND NEW.status = 'Active';
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_lease_delete;
+    CREATE TRIGGER counter_lease_delete
+    AFTER DELETE ON lease
+    WHEN OLD.status = 'Active'
+    BEGIN
+        UPDATE tenant_counters
+        SET active_lease_count = active_lease_count - 1
+        WHERE tenant_id = OLD.tenant_id;
+        UPDATE mall_counters
+        SET tenants_with_leases = tenants_with_leases - 1
+        WHERE EXISTS (
+            SELECT 1 FROM tenant_counters
+            WHERE tenant_id = OLD.tenant_id AND active_lease_count = 0
+        );
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_maintenance_insert;
+    CREATE TRIGGER counter_maintenance_insert
+    AFTER INSERT ON maintenance
+    WHEN NEW.status IN ('Pending', 'In Progress')
+    BEGIN
+        UPDATE shop_counters
+        SET open_maintenance_count = open_maintenance_count + 1
+        WHERE shop_id = NEW.shop_id;
+        UPDATE mall_counters SET pending_maintenance = pending_maintenance + 1;
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_maintenance_update;
+    CREATE TRIGGER counter_maintenance_update
+    AFTER UPDATE OF shop_id, status ON maintenance
+    WHEN IFNULL(OLD.status IN ('Pending', 'In Progress'), 0) != IFNULL(NEW.status IN ('Pending', 'In Progress'), 0)
+         OR OLD.shop_id IS NOT NEW.shop_id
+    BEGIN
+        UPDATE shop_counters
+        SET open_maintenance_count = open_maintenance_count - 1
+        WHERE shop_id = OLD.shop_id AND OLD.status IN ('Pending', 'In Progress');
+        UPDATE shop_counters
+        SET open_maintenance_count = open_maintenance_count + 1
+        WHERE shop_id = NEW.shop_id AND NEW.status IN ('Pending', 'In Progress');
+        UPDATE mall_counters
+        SET pending_maintenance = pending_maintenance
+            + IFNULL(NEW.status IN ('Pending', 'In Progress'), 0)
+            - IFNULL(OLD.status IN ('Pending', 'In Progress'), 0);
+    END;
+    
+    DROP TRIGGER IF EXISTS counter_maintenance_delete;
+    CREATE TRIGGER counter_maintenance_delete
+    AFTER DELETE ON maintenance
+    WHEN OLD.status IN ('Pending', 'In Progress')
+    BEGIN
+        UPDATE shop_counters
+        SET open_maintenance_count = open_maintenance_count - 1
+        WHERE shop_id = OLD.shop_id;
+        UPDATE mall_counters SET pending_maintenance = pending_maintenance - 1;
+    END;
     ''')
     
     # Check if data exists
@@ -194,7 +1314,639 @@ def init_db():
     ''')
     
     conn.commit()
-    conn.close()
+    
+    # Bring existing databases up to the current schema version
+    return migrate_db(conn)
+
+# Recompute every counter table from the base tables
+COUNTER_REBUILD_STATEMENTS = [
+    'DELETE FROM shop_counters',
+    '''
+    INSERT INTO shop_counters (shop_id, open_maintenance_count)
+    SELECT s.id, COUNT(m.id)
+    FROM shop s
+    LEFT JOIN maintenance m ON m.shop_id = s.id AND m.status IN ('Pending', 'In Progress')
+    GROUP BY s.id
+    ''',
+    'DELETE FROM tenant_counters',
+    '''
+    INSERT INTO tenant_counters (tenant_id, active_lease_count)
+    SELECT t.id, COUNT(l.id)
+    FROM tenant t
+    LEFT JOIN lease l ON l.tenant_id = t.id AND l.status = 'Active'
+    GROUP BY t.id
+    ''',
+    '''
+    INSERT OR REPLACE INTO mall_counters
+        (id, total_shops, occupied_shops, total_tenants, pending_maintenance, tenants_with_leases)
+    SELECT 1,
+        (SELECT COUNT(*) FROM shop),
+        (SELECT COUNT(*) FROM shop WHERE status = 'Occupied'),
+        (SELECT COUNT(*) FROM tenant),
+        (SELECT COUNT(*) FROM maintenance WHERE status IN ('Pending', 'In Progress')),
+        (SELECT COUNT(*) FROM tenant_counters WHERE active_lease_count > 0)
+    ''',
+]
+
+# For each counter table, the stored values and the values they should have
+COUNTER_CHECKS = [
+    ('shop_counters', '''
+    SELECT s.id AS key, COALESCE(c.open_maintenance_count, 0) AS stored, COUNT(m.id) AS expected
+    FROM shop s
+    LEFT JOIN shop_counters c ON c.shop_id = s.id
+    LEFT JOIN maintenance m ON m.shop_id = s.id AND m.status IN ('Pending', 'In Progress')
+    GROUP BY s.id
+    HAVING c.shop_id IS NULL OR stored != expected
+    '''),
+    ('tenant_counters', '''
+    SELECT t.id AS key, COALESCE(c.active_lease_count, 0) AS stored, COUNT(l.id) AS expected
+    FROM tenant t
+    LEFT JOIN tenant_counters c ON c.tenant_id = t.id
+    LEFT JOIN lease l ON l.tenant_id = t.id AND l.status = 'Active'
+    GROUP BY t.id
+    HAVING c.tenant_id IS NULL OR stored != expected
+    '''),
+    ('mall_counters', '''
+    SELECT key, stored, expected FROM (
+        SELECT 'total_shops' AS key, total_shops AS stored,
+               (SELECT COUNT(*) FROM shop) AS expected FROM mall_counters
+        UNION ALL
+        SELECT 'occupied_shops', occupied_shops,
+               (SELECT COUNT(*) FROM shop WHERE status = 'Occupied') FROM mall_counters
+        UNION ALL
+        SELECT 'total_tenants', total_tenants,
+               (SELECT COUNT(*) FROM tenant) FROM mall_counters
+        UNION ALL
+        SELECT 'pending_maintenance', pending_maintenance,
+               (SELECT COUNT(*) FROM maintenance WHERE status IN ('Pending', 'In Progress')) FROM mall_counters
+        UNION ALL
+        SELECT 'tenants_with_leases', tenants_with_leases,
+               (SELECT COUNT(DISTINCT t.id) FROM tenant t
+                JOIN lease l ON t.id = l.tenant_id
+                WHERE l.status = 'Active') FROM mall_counters
+    )
+    WHERE stored != expected
+    '''),
+]
+
+def check_counters(conn):
+    problems = []
+    for table, sql in COUNTER_CHECKS:
+        for row in conn.execute(sql):
+            problems.append(f"{table}[{row['key']}]: stored {row['stored']}, expected {row['expected']}")
+    return problems
+
+def rebuild_counters(conn):
+    for statement in COUNTER_REBUILD_STATEMENTS:
+        conn.execute(statement)
+    conn.commit()
+
+# Tables whose changes are tracked in table_versions
+VERSIONED_TABLES = ['shop', 'tenant', 'lease', 'maintenance']
+
+# A version counter per table, bumped by a trigger on every row written.
+# GET responses derive their ETag from the versions of the tables they read.
+TABLE_VERSION_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        modified_at TEXT NOT NULL
+    )
+    ''',
+] + [
+    f"INSERT OR IGNORE INTO table_versions (name, modified_at) VALUES ('{table}', datetime('now'))"
+    for table in VERSIONED_TABLES
+] + [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS version_{table}_{event.lower()}
+    AFTER {event} ON {table}
+    BEGIN
+        UPDATE table_versions
+        SET version = version + 1, modified_at = datetime('now')
+        WHERE name = '{table}';
+    END
+    '''
+    for table in VERSIONED_TABLES
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+# Columns each table's change_log triggers record as the row's new values
+CHANGE_LOG_COLUMNS = {
+    'shop': ['id', 'name', 'location', 'size', 'rent', 'status'],
+    'tenant': ['id', 'name', 'contact', 'email', 'business_type', 'shop_id'],
+    'lease': ['id', 'tenant_id', 'shop_id', 'start_date', 'end_date', 'rent_amount', 'status'],
+    'maintenance': ['id', 'shop_id', 'description', 'reported_date', 'status', 'priority',
+                    'resolved_date', 'resolution_notes'],
+}
+
+# Row-level change log written by triggers, read by /api/events.
+# AUTOINCREMENT so ids keep increasing after old entries are pruned.
+CHANGE_LOG_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS change_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        data TEXT,
+        changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )
+    ''',
+] + [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS change_log_{table}_{event.lower()}
+    AFTER {event} ON {table}
+    BEGIN
+        INSERT INTO change_log (table_name, row_id, op, data)
+        VALUES ('{table}', {row}.id, '{event.lower()}', {data});
+    END
+    '''
+    for table, columns in CHANGE_LOG_COLUMNS.items()
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'))
+    for data in [
+        'NULL' if event == 'DELETE'
+        else 'json_object(' + ', '.join(f"'{column}', NEW.{column}" for column in columns) + ')'
+    ]
+]
+
+# Row versions for /api/sync. Every write stamps the row with the next value
+# of a single sequence, and deletes leave a tombstone with their own version,
+# so "everything after version N" is one indexed range scan per table.
+SYNC_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS sync_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0,
+        pruned_version INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    # Starts at 1 so existing rows, at row_version 0, sort before any sync
+    "INSERT OR IGNORE INTO sync_state (id, version) VALUES (1, 1)",
+    '''
+    CREATE TABLE IF NOT EXISTS sync_tombstone (
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        deleted_at TEXT NOT NULL DEFAULT (datetime('now')),
+        PRIMARY KEY (table_name, row_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_sync_tombstone_version ON sync_tombstone (version)',
+] + [
+    statement
+    for table in CHANGE_LOG_COLUMNS
+    for statement in (
+        f'ALTER TABLE {table} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0',
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_row_version ON {table} (row_version)',
+    )
+] + [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS sync_{table}_{event.lower()}
+    AFTER {event}{columns} ON {table}
+    BEGIN
+        UPDATE sync_state SET version = version + 1;
+        UPDATE {table} SET row_version = (SELECT version FROM sync_state) WHERE id = NEW.id;
+    END
+    '''
+    for table, table_columns in CHANGE_LOG_COLUMNS.items()
+    # UPDATE OF the data columns, so the row_version stamp doesn't fire it
+    for event, columns in (('INSERT', ''), ('UPDATE', ' OF ' + ', '.join(table_columns)))
+] + [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS sync_{table}_delete
+    AFTER DELETE ON {table}
+    BEGIN
+        UPDATE sync_state SET version = version + 1;
+        INSERT OR REPLACE INTO sync_tombstone (table_name, row_id, version)
+        VALUES ('{table}', OLD.id, (SELECT version FROM sync_state));
+    END
+    '''
+    for table in CHANGE_LOG_COLUMNS
+] + [
+    # The row_version stamp is not a change of its own, so the table version
+    # and change log update triggers are recreated to skip it
+    statement
+    for table, columns in CHANGE_LOG_COLUMNS.items()
+    for statement in (
+        f'DROP TRIGGER IF EXISTS version_{table}_update',
+        f'''
+        CREATE TRIGGER version_{table}_update
+        AFTER UPDATE ON {table}
+        WHEN OLD.row_version IS NEW.row_version
+        BEGIN
+            UPDATE table_versions
+            SET version = version + 1, modified_at = datetime('now')
+            WHERE name = '{table}';
+        END
+        ''',
+        f'DROP TRIGGER IF EXISTS change_log_{table}_update',
+        f'''
+        CREATE TRIGGER change_log_{table}_update
+        AFTER UPDATE ON {table}
+        WHEN OLD.row_version IS NEW.row_version
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, op, data)
+            VALUES ('{table}', NEW.id, 'update', json_object({', '.join(f"'{column}', NEW.{column}" for column in columns)}));
+        END
+        ''',
+    )
+]
+
+# Update triggers from before versioned migrations, still found in older
+# databases like the shipped emall.db. They fired on the row_version stamp
+# as well (auto_expire_leases expired a lease that had already ended as soon
+# as it was inserted), so where they exist they get the same guard.
+LEGACY_UPDATE_TRIGGERS = {
+    'update_shop_status_on_lease_update': '''
+    CREATE TRIGGER update_shop_status_on_lease_update
+    AFTER UPDATE ON lease
+    WHEN OLD.row_version IS NEW.row_version AND OLD.status != 'Active' AND NEW.status = 'Active'
+    BEGIN
+        UPDATE shop SET status = 'Occupied' WHERE id = NEW.shop_id;
+    END
+    ''',
+    'check_lease_status_change': '''
+    CREATE TRIGGER check_lease_status_change
+    AFTER UPDATE ON lease
+    WHEN OLD.row_version IS NEW.row_version AND OLD.status = 'Active' AND NEW.status != 'Active'
+    BEGIN
+        UPDATE shop
+        SET status = 'Vacant'
+        WHERE id = OLD.shop_id AND
+              (SELECT COUNT(*) FROM lease WHERE shop_id = OLD.shop_id AND status = 'Active') = 0;
+    END
+    ''',
+    'auto_expire_leases': '''
+    CREATE TRIGGER auto_expire_leases
+    AFTER UPDATE ON lease
+    WHEN OLD.row_version IS NEW.row_version AND NEW.end_date < date('now') AND NEW.status = 'Active'
+    BEGIN
+        UPDATE lease SET status = 'Expired' WHERE id = NEW.id;
+    END
+    ''',
+}
+
+def guard_legacy_update_triggers(conn):
+    for name, sql in LEGACY_UPDATE_TRIGGERS.items():
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone():
+            conn.execute(f'DROP TRIGGER {name}')
+            conn.execute(sql)
+
+# Columns indexed for /api/search in each table's external-content FTS5 table
+SEARCH_COLUMNS = {
+    'tenant': ['name', 'email', 'business_type'],
+    'shop': ['name', 'location'],
+    'maintenance': ['description', 'resolution_notes'],
+}
+
+# FTS5 indexes that read their text from the base tables and are kept in
+# step by triggers. prefix='2 3' indexes short prefixes so "ac*" stays cheap.
+SEARCH_STATEMENTS = [
+    statement
+    for table, columns in SEARCH_COLUMNS.items()
+    for statement in (
+        f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+            {', '.join(columns)},
+            content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')",
+        f'''
+        CREATE TRIGGER IF NOT EXISTS search_{table}_insert
+        AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {table}_fts (rowid, {', '.join(columns)})
+            VALUES (NEW.id, {', '.join(f'NEW.{column}' for column in columns)});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS search_{table}_delete
+        AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, {', '.join(columns)})
+            VALUES ('delete', OLD.id, {', '.join(f'OLD.{column}' for column in columns)});
+        END
+        ''',
+        # Only when an indexed column changes, so status edits and the
+        # row_version stamp don't touch the index
+        f'''
+        CREATE TRIGGER IF NOT EXISTS search_{table}_update
+        AFTER UPDATE OF {', '.join(columns)} ON {table}
+        BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, {', '.join(columns)})
+            VALUES ('delete', OLD.id, {', '.join(f'OLD.{column}' for column in columns)});
+            INSERT INTO {table}_fts (rowid, {', '.join(columns)})
+            VALUES (NEW.id, {', '.join(f'NEW.{column}' for column in columns)});
+        END
+        ''',
+    )
+]
+
+# Day number of a lease date; + 0.5 makes a date and any time on it the same day
+def lease_day(expression):
+    return f'CAST(julianday({expression}) + 0.5 AS INTEGER)'
+
+LEASE_OVERLAP_ERROR = 'Lease dates overlap another active lease of the same shop'
+
+# Active leases as (shop, shop) x (start day, end day) boxes in an R*Tree, so
+# overlapping leases and leased shops in a date range are found in O(log n).
+# Triggers keep it in step and refuse an active lease that overlaps another.
+LEASE_INTERVAL_STATEMENTS = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS lease_interval USING rtree_i32(
+        id, shop_from, shop_to, start_day, end_day
+    )
+    ''',
+    f'''
+    INSERT INTO lease_interval (id, shop_from, shop_to, start_day, end_day)
+    SELECT id, shop_id, shop_id, {lease_day('start_date')}, {lease_day('end_date')}
+    FROM lease
+    WHERE status = 'Active' AND julianday(end_date) >= julianday(start_date)
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS lease_overlap_insert
+    BEFORE INSERT ON lease
+    WHEN NEW.status = 'Active' AND EXISTS (
+        SELECT 1 FROM lease_interval
+        WHERE shop_from <= NEW.shop_id AND shop_to >= NEW.shop_id
+          AND start_day <= {lease_day('NEW.end_date')} AND end_day >= {lease_day('NEW.start_date')}
+    )
+    BEGIN
+        SELECT RAISE(ABORT, '{LEASE_OVERLAP_ERROR}');
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS lease_overlap_update
+    BEFORE UPDATE OF shop_id, start_date, end_date, status ON lease
+    WHEN NEW.status = 'Active' AND EXISTS (
+        SELECT 1 FROM lease_interval
+        WHERE shop_from <= NEW.shop_id AND shop_to >= NEW.shop_id
+          AND start_day <= {lease_day('NEW.end_date')} AND end_day >= {lease_day('NEW.start_date')}
+          AND id != OLD.id
+    )
+    BEGIN
+        SELECT RAISE(ABORT, '{LEASE_OVERLAP_ERROR}');
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS lease_interval_insert
+    AFTER INSERT ON lease
+    WHEN NEW.status = 'Active' AND julianday(NEW.end_date) >= julianday(NEW.start_date)
+    BEGIN
+        INSERT INTO lease_interval (id, shop_from, shop_to, start_day, end_day)
+        VALUES (NEW.id, NEW.shop_id, NEW.shop_id, {lease_day('NEW.start_date')}, {lease_day('NEW.end_date')});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS lease_interval_update
+    AFTER UPDATE OF shop_id, start_date, end_date, status ON lease
+    BEGIN
+        DELETE FROM lease_interval WHERE id = OLD.id;
+        INSERT INTO lease_interval (id, shop_from, shop_to, start_day, end_day)
+        SELECT NEW.id, NEW.shop_id, NEW.shop_id, {lease_day('NEW.start_date')}, {lease_day('NEW.end_date')}
+        WHERE NEW.status = 'Active' AND julianday(NEW.end_date) >= julianday(NEW.start_date);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS lease_interval_delete
+    AFTER DELETE ON lease
+    BEGIN
+        DELETE FROM lease_interval WHERE id = OLD.id;
+    END
+    ''',
+]
+
+# Rent invoices, one per lease per billing period (YYYY-MM), written by
+# billing runs. The UNIQUE key makes a run idempotent: invoices that already
+# exist are skipped. No foreign key on lease_id, so invoices outlive their lease.
+# billing_run records each run's progress; last_lease_id is committed with
+# every chunk of invoices, so a run that stopped half way resumes from there.
+BILLING_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS billing_run (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        period TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'Running',
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        last_lease_id INTEGER NOT NULL DEFAULT 0,
+        chunks INTEGER NOT NULL DEFAULT 0,
+        invoices_created INTEGER NOT NULL DEFAULT 0,
+        invoices_total INTEGER,
+        resumed INTEGER NOT NULL DEFAULT 0,
+        duration_ms REAL NOT NULL DEFAULT 0
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_billing_run_period_status ON billing_run (period, status)',
+    '''
+    CREATE TABLE IF NOT EXISTS invoice (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id INTEGER NOT NULL,
+        lease_id INTEGER NOT NULL,
+        tenant_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        period TEXT NOT NULL,
+        days INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        due_date TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        UNIQUE (lease_id, period)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_invoice_period ON invoice (period)',
+    'CREATE INDEX IF NOT EXISTS idx_invoice_tenant_period ON invoice (tenant_id, period)',
+    # Billing runs bump the invoice version once per chunk instead of a trigger per row
+    "INSERT OR IGNORE INTO table_versions (name, modified_at) VALUES ('invoice', datetime('now'))",
+]
+
+# Technicians and their claims on maintenance tickets. A claimed ticket is
+# 'In Progress' until the claim is released or expires; the triggers drop
+# the claim when the ticket moves on to any other status or is deleted.
+DISPATCH_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS technician (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        contact TEXT,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS maintenance_claim (
+        maintenance_id INTEGER PRIMARY KEY,
+        technician_id INTEGER NOT NULL,
+        claimed_at TEXT NOT NULL,
+        expires_at TEXT NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_maintenance_claim_expires_at ON maintenance_claim (expires_at)',
+    'CREATE INDEX IF NOT EXISTS idx_maintenance_claim_technician ON maintenance_claim (technician_id)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS maintenance_claim_status
+    AFTER UPDATE OF status ON maintenance
+    WHEN NEW.status IS NOT 'In Progress'
+    BEGIN
+        DELETE FROM maintenance_claim WHERE maintenance_id = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS maintenance_claim_delete
+    AFTER DELETE ON maintenance
+    BEGIN
+        DELETE FROM maintenance_claim WHERE maintenance_id = OLD.id;
+    END
+    ''',
+]
+
+# Schema migrations, applied in order by migrate_db().
+# Never change a migration once it has shipped, append a new one instead.
+MIGRATIONS = [
+    (1, 'Add foreign key indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_tenant_shop ON tenant (shop_id)',
+        'CREATE INDEX IF NOT EXISTS idx_lease_shop_status ON lease (shop_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_lease_tenant_status ON lease (tenant_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_maintenance_shop_status ON maintenance (shop_id, status)',
+    ]),
+    (2, 'Add status indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_lease_status_end_date ON lease (status, end_date)',
+        'CREATE INDEX IF NOT EXISTS idx_maintenance_status ON maintenance (status)',
+        'CREATE INDEX IF NOT EXISTS idx_shop_status ON shop (status)',
+    ]),
+    (3, 'Add job status table', [
+        '''
+        CREATE TABLE IF NOT EXISTS job_status (
+            name TEXT PRIMARY KEY,
+            last_run_at TEXT NOT NULL,
+            rows_affected INTEGER NOT NULL,
+            duration_ms REAL NOT NULL
+        )
+        ''',
+    ]),
+    (4, 'Populate counter tables', COUNTER_REBUILD_STATEMENTS),
+    (5, 'Add list filter and sort indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_shop_name ON shop (name)',
+        'CREATE INDEX IF NOT EXISTS idx_tenant_name ON tenant (name)',
+        'CREATE INDEX IF NOT EXISTS idx_lease_start_date ON lease (start_date)',
+        'CREATE INDEX IF NOT EXISTS idx_lease_end_date ON lease (end_date)',
+        'CREATE INDEX IF NOT EXISTS idx_maintenance_priority ON maintenance (priority)',
+        "CREATE INDEX IF NOT EXISTS idx_maintenance_reported_date ON maintenance (IFNULL(reported_date, ''))",
+    ]),
+    (6, 'Add table version counters', TABLE_VERSION_STATEMENTS),
+    (7, 'Add change log', CHANGE_LOG_STATEMENTS),
+    (8, 'Add row versions and tombstones for sync', SYNC_STATEMENTS + [guard_legacy_update_triggers]),
+    (9, 'Add full-text search indexes', SEARCH_STATEMENTS),
+    (10, 'Add lease interval index', LEASE_INTERVAL_STATEMENTS),
+    (11, 'Add invoices and billing runs', BILLING_STATEMENTS),
+    (12, 'Add technicians and maintenance claims', DISPATCH_STATEMENTS),
+]
+
+def migrate_db(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    ''')
+    
+    applied = []
+    conn.isolation_level = None
+    try:
+        # IMMEDIATE so two processes starting at once don't both run the same step
+        conn.execute('BEGIN IMMEDIATE')
+        current = conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+        
+        for version, name, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                # Steps SQL alone can't express are functions of the connection
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute('''
+            INSERT INTO schema_version (version, name, applied_at)
+            VALUES (?, ?, datetime('now'))
+            ''', (version, name))
+            applied.append((version, name))
+        
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.isolation_level = ''
+    
+    return applied
+
+# Queries that run on every request. check_query_plans() fails if any of them
+# reads a whole table, except that an unpaginated list may scan the table it
+# lists (the driving table, named by its alias) as the outermost loop.
+HOT_QUERIES = [
+    ('shop_summary', 'SELECT * FROM shop_summary', (), 's'),
+    ('tenant_lease_view', 'SELECT * FROM tenant_lease_view', (), 't'),
+    ('maintenance_details', 'SELECT * FROM maintenance_details ORDER BY id DESC', (), 'm'),
+    ('shop_by_id', 'SELECT * FROM shop WHERE id = ?', (1,), None),
+    ('occupied_shops', 'SELECT COUNT(*) FROM shop WHERE status = "Occupied"', (), None),
+    ('pending_maintenance',
+     'SELECT COUNT(*) FROM maintenance WHERE status = "Pending" OR status = "In Progress"', (), None),
+    ('tenants_with_leases', '''
+     SELECT COUNT(DISTINCT t.id)
+     FROM tenant t
+     JOIN lease l ON t.id = l.tenant_id
+     WHERE l.status = 'Active'
+     ''', (), None),
+    ('active_lease_for_shop',
+     "SELECT id FROM lease WHERE shop_id = ? AND status = 'Active' AND id != ?", (1, 0), None),
+    ('active_leases_for_tenant', '''
+     SELECT l.id, l.shop_id, s.name as shop_name, l.start_date, l.end_date, l.rent_amount
+     FROM lease l
+     JOIN shop s ON l.shop_id = s.id
+     WHERE l.tenant_id = ? AND l.status = 'Active'
+     ''', (1,), None),
+    ('expire_leases',
+     "UPDATE lease SET status = 'Expired' WHERE status = 'Active' AND end_date < ?", ('2024-01-01',), None),
+    ('tenants_in_shop', 'SELECT COUNT(*) FROM tenant WHERE shop_id = ?', (1,), None),
+    ('open_maintenance_for_shop',
+     "SELECT COUNT(*) FROM maintenance WHERE shop_id = ? AND status != 'Completed'", (1,), None),
+    ('leases_for_tenant', 'SELECT id FROM lease WHERE tenant_id = ? LIMIT 1', (1,), None),
+    ('maintenance_page',
+     'SELECT *, id FROM maintenance_details WHERE (id) < (?) ORDER BY id DESC LIMIT 51', (100,), None),
+    ('shops_page_by_name',
+     'SELECT *, name, id FROM shop_summary WHERE (name, id) > (?, ?) ORDER BY name ASC, id ASC LIMIT 51',
+     ('', 0), None),
+    ('tenants_page', '''
+     SELECT *, id, IFNULL(lease_id, 0) FROM tenant_lease_view
+     WHERE (id, IFNULL(lease_id, 0)) > (?, ?) ORDER BY id ASC, IFNULL(lease_id, 0) ASC LIMIT 51
+     ''', (0, 0), None),
+    ('full_sync_page',
+     'SELECT id, row_version FROM maintenance WHERE (row_version, id) > (?, ?) ORDER BY row_version, id LIMIT 5001',
+     (-1, 0), None),
+]
+
+def check_query_plans(conn):
+    problems = []
+    for name, sql, params, driving_table in HOT_QUERIES:
+        loops = 0
+        coroutines = set()
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+            detail = row[3]
+            # A grouped view runs as a co-routine, reading its rows back isn't a table scan
+            if detail.startswith('CO-ROUTINE '):
+                coroutines.add(detail.split()[1])
+            if not detail.startswith(('SCAN ', 'SEARCH ')) or detail.split()[1] in coroutines:
+                continue
+            loops += 1
+            # "SCAN x USING [COVERING] INDEX" walks an index, plain "SCAN x" reads the whole table
+            if not detail.startswith('SCAN ') or ' USING ' in detail:
+                continue
+            if loops > 1 or detail != f'SCAN {driving_table}':
+                problems.append(f'{name}: {detail}')
+    return problems
 
 # Stored procedure implementations
 def update_tenant_shop(tenant_id, shop_id):
@@ -205,7 +1957,6 @@ def update_tenant_shop(tenant_id, shop_id):
     cursor.execute('SELECT shop_id FROM tenant WHERE id = ?', (tenant_id,))
     tenant = cursor.fetchone()
     if not tenant:
-        conn.close()
         return False, "Tenant not found"
     
     old_shop_id = tenant['shop_id']
@@ -223,7 +1974,6 @@ def update_tenant_shop(tenant_id, shop_id):
         cursor.execute('UPDATE shop SET status = ? WHERE id = ?', ('Occupied', shop_id))
     
     conn.commit()
-    conn.close()
     
     return True, "Tenant shop updated successfully"
 
@@ -235,7 +1985,6 @@ def complete_maintenance(maintenance_id, resolution_notes):
     cursor.execute('SELECT id, shop_id FROM maintenance WHERE id = ?', (maintenance_id,))
     maintenance = cursor.fetchone()
     if not maintenance:
-        conn.close()
         return False, "Maintenance request not found"
     
     # Update maintenance request
@@ -270,7 +2019,6 @@ def complete_maintenance(maintenance_id, resolution_notes):
                 cursor.execute('UPDATE shop SET status = ? WHERE id = ?', ('Vacant', shop_id))
     
     conn.commit()
-    conn.close()
     
     return True, "Maintenance request completed successfully"
 
@@ -278,102 +2026,484 @@ def expire_leases():
     conn = get_db()
     cursor = conn.cursor()
     
+    started = time.monotonic()
     today = datetime.now().strftime('%Y-%m-%d')
     
-    # Find leases that have passed their end date
+    # Expire every lease past its end date in one statement (uses idx_lease_status_end_date)
     cursor.execute('''
-    SELECT l.id, l.shop_id, l.tenant_id
-    FROM lease l
-    WHERE l.end_date < ? AND l.status = 'Active'
+    UPDATE lease SET status = 'Expired'
+    WHERE status = 'Active' AND end_date < ?
     ''', (today,))
     
-    expired_leases = cursor.fetchall()
-    updated_count = 0
-    
-    for lease in expired_leases:
-        # Update lease status
-        cursor.execute('UPDATE lease SET status = ? WHERE id = ?', ('Expired', lease['id']))
-        updated_count += 1
+    updated_count = cursor.rowcount
+    record_job_run(conn, 'expire_leases', updated_count, time.monotonic() - started)
     
     conn.commit()
-    conn.close()
     
     return True, f"Updated {updated_count} expired leases"
 
-# Routes for web pages
-@app.route('/')
-def home():
-    return app.send_static_file('index.html')
+# Save when a background job last ran and how many rows it touched
+def record_job_run(conn, name, rows_affected, duration):
+    conn.execute('''
+    INSERT INTO job_status (name, last_run_at, rows_affected, duration_ms)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (name) DO UPDATE SET
+        last_run_at = excluded.last_run_at,
+        rows_affected = excluded.rows_affected,
+        duration_ms = excluded.duration_ms
+    ''', (name, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), rows_affected, round(duration * 1000, 3)))
 
-# API Routes
-@app.route('/api/dashboard')
-def dashboard_data():
+# Runs func every interval seconds on a daemon thread.
+# Each run gets its own app context and waits for the writer slot like a request would.
+class PeriodicJob:
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not self.interval:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # Run the job once against each mall's database in turn
+    def run_once(self):
+        results = {}
+        for database in all_databases():
+            try:
+                with app.app_context():
+                    g.database = database
+                    with get_pool().writer:
+                        results[database] = self.func()
+            except Exception:
+                app.logger.exception('Background job %s failed on %s', self.name, database)
+        return results
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+# Drop change_log entries beyond the newest CHANGE_LOG_MAX_ROWS
+def prune_change_log():
     conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) FROM shop')
-    total_shops = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(*) FROM shop WHERE status = "Occupied"')
-    occupied_shops = cursor.fetchone()[0]
+    started = time.monotonic()
     
-    cursor.execute('SELECT COUNT(*) FROM tenant')
-    total_tenants = cursor.fetchone()[0]
+    cursor = conn.execute('''
+    DELETE FROM change_log
+    WHERE id <= (SELECT MAX(id) FROM change_log) - ?
+    ''', (app.config['CHANGE_LOG_MAX_ROWS'],))
     
-    cursor.execute('SELECT COUNT(*) FROM maintenance WHERE status = "Pending" OR status = "In Progress"')
-    pending_maintenance = cursor.fetchone()[0]
+    deleted_count = cursor.rowcount
+    record_job_run(conn, 'prune_change_log', deleted_count, time.monotonic() - started)
     
-    # Expire any leases that have passed their end date
-    expire_leases()
-    
-    conn.close()
+    conn.commit()
     
-    return jsonify({
-        'total_shops': total_shops,
-        'occupied_shops': occupied_shops,
-        'total_tenants': total_tenants,
-        'pending_maintenance': pending_maintenance
-    })
+    return True, f"Pruned {deleted_count} change log entries"
 
-@app.route('/api/shops', methods=['GET'])
-def get_shops():
+# Drop tombstones older than SYNC_TOMBSTONE_DAYS and remember the newest
+# version dropped, below which /api/sync can only answer with a full resync
+def prune_sync_tombstones():
     conn = get_db()
-    cursor = conn.cursor()
+    started = time.monotonic()
     
-    # Use the shop_summary view for more detailed information
-    cursor.execute('SELECT * FROM shop_summary')
-    shops = cursor.fetchall()
+    cutoff = conn.execute('''
+    SELECT MAX(version) FROM sync_tombstone WHERE deleted_at < datetime('now', ?)
+    ''', (f"-{app.config['SYNC_TOMBSTONE_DAYS']} days",)).fetchone()[0]
     
-    conn.close()
+    deleted_count = 0
+    if cutoff is not None:
+        deleted_count = conn.execute('DELETE FROM sync_tombstone WHERE version <= ?', (cutoff,)).rowcount
+        conn.execute('UPDATE sync_state SET pruned_version = MAX(pruned_version, ?)', (cutoff,))
+    record_job_run(conn, 'prune_sync_tombstones', deleted_count, time.monotonic() - started)
     
-    return jsonify([{
-        'id': shop['id'],
-        'name': shop['name'],
-        'location': shop['location'],
-        'size': shop['size'],
-        'rent': shop['rent'],
-        'status': shop['status'],
-        'tenant_name': shop['tenant_name'],
-        'tenant_id': shop['tenant_id'],
-        'maintenance_count': shop['maintenance_count']
-    } for shop in shops])
+    conn.commit()
+    
+    return True, f"Pruned {deleted_count} sync tombstones"
 
-@app.route('/api/shops', methods=['POST'])
-def create_shop():
-    data = request.json
+# Put tickets whose claim has expired back in the queue, inside the caller's transaction
+def release_expired_claims(conn):
+    cursor = conn.execute('''
+    UPDATE maintenance SET status = 'Pending'
+    WHERE id IN (SELECT maintenance_id FROM maintenance_claim WHERE expires_at <= datetime('now'))
+      AND status = 'In Progress'
+    ''')
+    # Claims on tickets that aren't in progress any more are dropped by the
+    # trigger; this catches any left behind
+    conn.execute("DELETE FROM maintenance_claim WHERE expires_at <= datetime('now')")
+    return cursor.rowcount
+
+def requeue_expired_claims():
+    conn = get_db()
+    started = time.monotonic()
     
-    if not data:
-        return jsonify({'error': 'No data provided'}), 400
+    requeued_count = release_expired_claims(conn)
+    record_job_run(conn, 'requeue_expired_claims', requeued_count, time.monotonic() - started)
     
-    # Extract shop data from request
-    name = data.get('name')
-    location = data.get('location')
-    size = data.get('size')
-    rent = data.get('rent')
-    status = data.get('status', 'Vacant')  # Default status is Vacant
+    conn.commit()
     
-    # Validate required fields
-    if not name:
+    return True, f"Requeued {requeued_count} tickets with expired claims"
+
+background_jobs = [
+    PeriodicJob('expire_leases', app.config['LEASE_EXPIRY_INTERVAL'], expire_leases),
+    PeriodicJob('prune_change_log', app.config['CHANGE_LOG_PRUNE_INTERVAL'], prune_change_log),
+    PeriodicJob('prune_sync_tombstones', app.config['SYNC_TOMBSTONE_PRUNE_INTERVAL'], prune_sync_tombstones),
+    PeriodicJob('requeue_expired_claims', app.config['DISPATCH_CLAIM_CHECK_INTERVAL'], requeue_expired_claims),
+]
+
+def start_background_jobs():
+    for job in background_jobs:
+        job.start()
+
+def stop_background_jobs():
+    for job in background_jobs:
+        job.stop()
+
+# Source view, filters and sort keys for each list endpoint.
+# Every filter and sort key is backed by an index on the underlying table.
+LIST_QUERIES = {
+    'shops': {
+        'source': 'shop_summary',
+        'filters': {
+            'id': 'id = ?',
+            'tenant_id': 'tenant_id = ?',
+            'status': 'status = ?',
+            'location': 'location = ?',
+            'min_rent': 'rent >= ?',
+            'max_rent': 'rent <= ?',
+        },
+        'sorts': {'id': 'id', 'name': 'name'},
+        'default_sort': 'id',
+    },
+    'tenants': {
+        'source': 'tenant_lease_view',
+        'filters': {
+            'id': 'id = ?',
+            'shop_id': 'shop_id = ?',
+            'business_type': 'business_type = ?',
+        },
+        'sorts': {'id': 'id', 'name': 'name'},
+        'default_sort': 'id',
+        # A tenant with several active leases appears once per lease
+        'tiebreak': 'IFNULL(lease_id, 0)',
+    },
+    'leases': {
+        'source': 'lease_details',
+        'filters': {
+            'id': 'id = ?',
+            'status': 'status = ?',
+            'tenant_id': 'tenant_id = ?',
+            'shop_id': 'shop_id = ?',
+            'start_from': 'start_date >= ?',
+            'start_to': 'start_date <= ?',
+            'end_from': 'end_date >= ?',
+            'end_to': 'end_date <= ?',
+        },
+        'sorts': {'id': 'id', 'start_date': 'start_date', 'end_date': 'end_date'},
+        'default_sort': 'id',
+    },
+    'maintenance': {
+        'source': 'maintenance_details',
+        'filters': {
+            'id': 'id = ?',
+            'status': 'status = ?',
+            'priority': 'priority = ?',
+            'shop_id': 'shop_id = ?',
+            'reported_from': "IFNULL(reported_date, '') >= ?",
+            'reported_to': "IFNULL(reported_date, '') < date(?, '+1 day')",
+        },
+        'sorts': {'id': 'id', 'reported_date': "IFNULL(reported_date, '')"},
+        'default_sort': '-id',
+    },
+    'invoices': {
+        'source': 'invoice',
+        'filters': {
+            'id': 'id = ?',
+            'period': 'period = ?',
+            'lease_id': 'lease_id = ?',
+            'tenant_id': 'tenant_id = ?',
+        },
+        'sorts': {'id': 'id', 'period': 'period'},
+        'default_sort': '-id',
+    },
+    'billing_runs': {
+        'source': 'billing_run',
+        'filters': {
+            'id': 'id = ?',
+            'period': 'period = ?',
+        },
+        'sorts': {'id': 'id'},
+        'default_sort': '-id',
+    },
+}
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise QueryArgumentError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise QueryArgumentError('Invalid cursor')
+    return values
+
+# List requests are paginated when the client passes ?limit= or ?after=
+def is_paginated():
+    return 'limit' in request.args or 'after' in request.args
+
+# Build a list query from the filters, sort and keyset cursor in the query string,
+# plus any (clause, params) conditions the route adds itself.
+# Returns the SQL, its parameters, the page size (None for no limit) and the keyset columns.
+def build_list_query(name, conditions=()):
+    spec = LIST_QUERIES[name]
+    args = request.args
+    
+    where = [clause for clause, _ in conditions]
+    params = [param for _, clause_params in conditions for param in clause_params]
+    for arg, clause in spec['filters'].items():
+        value = args.get(arg)
+        if value:
+            where.append(clause)
+            params.append(value)
+    
+    sort = args.get('sort', spec['default_sort'])
+    descending = sort.startswith('-')
+    sort_key = sort.lstrip('-')
+    if sort_key not in spec['sorts']:
+        raise QueryArgumentError(f"Cannot sort by '{sort_key}', use one of: {', '.join(spec['sorts'])}")
+    
+    # Keyset columns: the sort key, then id (and any tiebreak) so every row has a unique position
+    keys = [spec['sorts'][sort_key]]
+    if keys[0] != 'id':
+        keys.append('id')
+    if 'tiebreak' in spec:
+        keys.append(spec['tiebreak'])
+    key_list = ', '.join(keys)
+    
+    if args.get('after'):
+        cursor_values = decode_cursor(args['after'], len(keys))
+        placeholders = ', '.join('?' * len(keys))
+        where.append(f"({key_list}) {'<' if descending else '>'} ({placeholders})")
+        params.extend(cursor_values)
+    
+    limit = None
+    # Streamed responses are only limited when the client asks for it
+    if 'limit' in args or ('after' in args and not stream_format()):
+        try:
+            limit = int(args.get('limit', app.config['LIST_MAX_LIMIT']))
+        except ValueError:
+            raise QueryArgumentError('limit must be a number')
+        limit = max(1, min(limit, app.config['LIST_MAX_LIMIT']))
+    
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT *, {key_list} FROM {spec['source']}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ' + ', '.join(f'{key} {direction}' for key in keys)
+    
+    return sql, params, limit, keys
+
+# Run a list query and return one page of rows plus the cursor for the
+# next page (None on the last page)
+def fetch_list(name, conditions=()):
+    sql, params, limit, keys = build_list_query(name, conditions)
+    if limit is not None:
+        # Fetch one extra row to find out whether there is another page
+        sql += f' LIMIT {limit + 1}'
+    
+    cursor = get_db().cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last[column] for column in range(len(last) - len(keys), len(last))])
+    
+    return rows, next_cursor
+
+def list_response(items, next_cursor):
+    if is_paginated():
+        return jsonify({'items': items, 'next_cursor': next_cursor})
+    return jsonify(items)
+
+# 'json' or 'ndjson' when the client asked for a streamed response, else None
+def stream_format():
+    stream = request.args.get('stream')
+    if stream in ('json', 'ndjson'):
+        return stream
+    if stream:
+        raise QueryArgumentError("stream must be 'json' or 'ndjson'")
+    if request.accept_mimetypes.best == 'application/x-ndjson':
+        return 'ndjson'
+    return None
+
+# Stream a list query straight from the cursor, fetchmany() batch by batch,
+# so memory use doesn't grow with the size of the table
+def stream_list(name, to_dict, stream, conditions=()):
+    sql, params, limit, keys = build_list_query(name, conditions)
+    if limit is not None:
+        sql += f' LIMIT {limit}'
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    
+    def encode(row):
+        # Same compact encoding jsonify() uses
+        return app.json.dumps(to_dict(row), separators=(',', ':'))
+    
+    def generate():
+        cursor = get_db().cursor()
+        cursor.execute(sql, params)
+        
+        if stream == 'json':
+            yield '['
+        first = True
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if stream == 'ndjson':
+                yield ''.join(encode(row) + '\n' for row in rows)
+            else:
+                chunk = ','.join(encode(row) for row in rows)
+                yield chunk if first else ',' + chunk
+            first = False
+        if stream == 'json':
+            yield ']'
+    
+    mimetype = 'application/x-ndjson' if stream == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+# Shared body of the GET list endpoints
+def list_endpoint(name, to_dict, conditions=()):
+    stream = stream_format()
+    if stream:
+        return stream_list(name, to_dict, stream, conditions)
+    
+    rows, next_cursor = fetch_list(name, conditions)
+    return list_response([to_dict(row) for row in rows], next_cursor)
+
+# Routes for web pages
+@app.route('/')
+def home():
+    return app.send_static_file('index.html')
+
+# API Routes
+# All dashboard counters in one lookup, cached until the next write
+def get_dashboard_summary():
+    def compute():
+        cursor = get_db().cursor()
+        # Counters are maintained by triggers, so this is a single-row lookup
+        cursor.execute('SELECT * FROM mall_counters WHERE id = 1')
+        row = cursor.fetchone()
+        
+        total_tenants = row['total_tenants']
+        tenants_with_leases = row['tenants_with_leases']
+        
+        return {
+            'total_shops': row['total_shops'],
+            'occupied_shops': row['occupied_shops'],
+            'total_tenants': total_tenants,
+            'pending_maintenance': row['pending_maintenance'],
+            'tenants_with_leases': tenants_with_leases,
+            'tenants_without_leases': total_tenants - tenants_with_leases,
+            'lease_coverage_percent': round((tenants_with_leases / total_tenants * 100) if total_tenants > 0 else 0, 1)
+        }
+    
+    # Keyed on the table versions when known, so a conditional GET never pairs a
+    # new ETag with a summary cached before the write that changed it
+    return get_pool().cache.get_or_compute(('dashboard_summary', g.get('table_versions')), compute)
+
+@app.route('/api/dashboard')
+@depends_on('shop', 'tenant', 'lease', 'maintenance')
+def dashboard_data():
+    summary = get_dashboard_summary()
+    
+    return jsonify({
+        'total_shops': summary['total_shops'],
+        'occupied_shops': summary['occupied_shops'],
+        'total_tenants': summary['total_tenants'],
+        'pending_maintenance': summary['pending_maintenance']
+    })
+
+@app.route('/api/dashboard/summary')
+@depends_on('shop', 'tenant', 'lease', 'maintenance')
+def dashboard_summary():
+    return jsonify(get_dashboard_summary())
+
+def shop_summary_to_dict(shop):
+    return {
+        'id': shop['id'],
+        'name': shop['name'],
+        'location': shop['location'],
+        'size': shop['size'],
+        'rent': shop['rent'],
+        'status': shop['status'],
+        'tenant_name': shop['tenant_name'],
+        'tenant_id': shop['tenant_id'],
+        'maintenance_count': shop['maintenance_count']
+    }
+
+@app.route('/api/shops', methods=['GET'])
+@depends_on('shop', 'tenant', 'maintenance')
+def get_shops():
+    # Use the shop_summary view for more detailed information
+    return list_endpoint('shops', shop_summary_to_dict)
+
+# Shops with no active lease overlapping ?from= to ?to= (inclusive). The
+# leased shops come from one range query on the lease_interval R*Tree; the
+# /api/shops filters, sorts and pagination apply as usual.
+@app.route('/api/shops/availability', methods=['GET'])
+@depends_on('shop', 'tenant', 'lease', 'maintenance')
+def get_shop_availability():
+    start_date = request.args.get('from')
+    end_date = request.args.get('to') or start_date
+    if not start_date:
+        raise QueryArgumentError('from is required, e.g. ?from=2025-01-01&to=2025-12-31')
+    date_error = check_lease_dates(start_date, end_date)
+    if date_error:
+        raise QueryArgumentError(date_error)
+    
+    leased = (f'''
+    id NOT IN (
+        SELECT shop_from FROM lease_interval
+        WHERE start_day <= {lease_day('?')} AND end_day >= {lease_day('?')}
+    )
+    ''', (end_date, start_date))
+    return list_endpoint('shops', shop_summary_to_dict, [leased])
+
+@app.route('/api/shops', methods=['POST'])
+def create_shop():
+    data = request.json
+    
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    # Extract shop data from request
+    name = data.get('name')
+    location = data.get('location')
+    size = data.get('size')
+    rent = data.get('rent')
+    status = data.get('status', 'Vacant')  # Default status is Vacant
+    
+    # Validate required fields
+    if not name:
         return jsonify({'error': 'Shop name is required'}), 400
     
     conn = get_db()
@@ -388,7 +2518,6 @@ def create_shop():
     shop_id = cursor.lastrowid
     
     conn.commit()
-    conn.close()
     
     return jsonify({
         'message': 'Shop created successfully',
@@ -396,6 +2525,7 @@ def create_shop():
     }), 201
 
 @app.route('/api/shops/<int:shop_id>', methods=['GET'])
+@depends_on('shop')
 def get_shop(shop_id):
     conn = get_db()
     cursor = conn.cursor()
@@ -404,11 +2534,8 @@ def get_shop(shop_id):
     shop = cursor.fetchone()
     
     if not shop:
-        conn.close()
         return jsonify({'error': 'Shop not found'}), 404
     
-    conn.close()
-    
     return jsonify({
         'id': shop['id'],
         'name': shop['name'],
@@ -442,7 +2569,6 @@ def update_shop(shop_id):
     # Check if shop exists
     cursor.execute('SELECT id FROM shop WHERE id = ?', (shop_id,))
     if not cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Shop not found'}), 404
     
     # Update shop
@@ -457,7 +2583,6 @@ def update_shop(shop_id):
     ''', (name, location, size, rent, status, shop_id))
     
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Shop updated successfully', 'id': shop_id})
 
@@ -469,7 +2594,6 @@ def delete_shop(shop_id):
     # Check if shop exists
     cursor.execute('SELECT id FROM shop WHERE id = ?', (shop_id,))
     if not cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Shop not found'}), 404
     
     # Option to cascade delete all associated records
@@ -493,46 +2617,31 @@ def delete_shop(shop_id):
         cursor.execute('DELETE FROM shop WHERE id = ?', (shop_id,))
         
         conn.commit()
-        conn.close()
         
         return jsonify({'message': 'Shop and all associated records deleted successfully'})
     else:
         # Check if shop has related records
         cursor.execute('SELECT id FROM tenant WHERE shop_id = ? LIMIT 1', (shop_id,))
         if cursor.fetchone():
-            conn.close()
             return jsonify({'error': 'Cannot delete shop with related tenants. Remove tenants first or use cascade delete option.'}), 400
         
         cursor.execute('SELECT id FROM lease WHERE shop_id = ? LIMIT 1', (shop_id,))
         if cursor.fetchone():
-            conn.close()
             return jsonify({'error': 'Cannot delete shop with related leases. Remove leases first or use cascade delete option.'}), 400
         
         cursor.execute('SELECT id FROM maintenance WHERE shop_id = ? LIMIT 1', (shop_id,))
         if cursor.fetchone():
-            conn.close()
             return jsonify({'error': 'Cannot delete shop with related maintenance requests. Remove maintenance requests first or use cascade delete option.'}), 400
         
         # Delete shop
         cursor.execute('DELETE FROM shop WHERE id = ?', (shop_id,))
         
         conn.commit()
-        conn.close()
         
         return jsonify({'message': 'Shop deleted successfully'})
 
-@app.route('/api/tenants', methods=['GET'])
-def get_tenants():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Use the tenant_lease_view to get comprehensive tenant info
-    cursor.execute('SELECT * FROM tenant_lease_view')
-    tenants = cursor.fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
+def tenant_lease_to_dict(tenant):
+    return {
         'id': tenant['id'],
         'name': tenant['name'],
         'contact': tenant['contact'],
@@ -546,7 +2655,13 @@ def get_tenants():
         'lease_end': tenant['end_date'],
         'lease_rent': tenant['rent_amount'],
         'lease_status': tenant['lease_status']
-    } for tenant in tenants])
+    }
+
+@app.route('/api/tenants', methods=['GET'])
+@depends_on('tenant', 'shop', 'lease')
+def get_tenants():
+    # Use the tenant_lease_view to get comprehensive tenant info
+    return list_endpoint('tenants', tenant_lease_to_dict)
 
 @app.route('/api/tenants', methods=['POST'])
 def create_tenant():
@@ -573,7 +2688,6 @@ def create_tenant():
     if shop_id:
         cursor.execute('SELECT id FROM shop WHERE id = ?', (shop_id,))
         if not cursor.fetchone():
-            conn.close()
             return jsonify({'error': 'Shop not found'}), 404
     
     # Insert new tenant
@@ -592,7 +2706,6 @@ def create_tenant():
             cursor.execute('UPDATE shop SET status = ? WHERE id = ?', ('Occupied', shop_id))
     
     conn.commit()
-    conn.close()
     
     return jsonify({
         'message': 'Tenant created successfully',
@@ -600,6 +2713,7 @@ def create_tenant():
     }), 201
 
 @app.route('/api/tenants/<int:tenant_id>', methods=['GET'])
+@depends_on('tenant', 'shop', 'lease')
 def get_tenant(tenant_id):
     conn = get_db()
     cursor = conn.cursor()
@@ -613,7 +2727,6 @@ def get_tenant(tenant_id):
     tenant = cursor.fetchone()
     
     if not tenant:
-        conn.close()
         return jsonify({'error': 'Tenant not found'}), 404
     
     # Get active leases for this tenant
@@ -626,8 +2739,6 @@ def get_tenant(tenant_id):
     
     leases = cursor.fetchall()
     
-    conn.close()
-    
     return jsonify({
         'id': tenant['id'],
         'name': tenant['name'],
@@ -671,7 +2782,6 @@ def update_tenant(tenant_id):
     cursor.execute('SELECT shop_id FROM tenant WHERE id = ?', (tenant_id,))
     tenant = cursor.fetchone()
     if not tenant:
-        conn.close()
         return jsonify({'error': 'Tenant not found'}), 404
     
     old_shop_id = tenant['shop_id']
@@ -689,7 +2799,6 @@ def update_tenant(tenant_id):
     # If shop assignment has changed, use the stored procedure
     if old_shop_id != shop_id:
         conn.commit()  # Commit the basic info changes
-        conn.close()   # Close this connection
         
         # Use the stored procedure to handle shop assignment
         success, message = update_tenant_shop(tenant_id, shop_id)
@@ -698,7 +2807,6 @@ def update_tenant(tenant_id):
             return jsonify({'error': message}), 400
     else:
         conn.commit()
-        conn.close()
     
     return jsonify({'message': 'Tenant updated successfully', 'id': tenant_id})
 
@@ -711,7 +2819,6 @@ def delete_tenant(tenant_id):
     cursor.execute('SELECT shop_id FROM tenant WHERE id = ?', (tenant_id,))
     tenant = cursor.fetchone()
     if not tenant:
-        conn.close()
         return jsonify({'error': 'Tenant not found'}), 404
     
     # Option to cascade delete associated leases
@@ -725,40 +2832,23 @@ def delete_tenant(tenant_id):
         cursor.execute('DELETE FROM tenant WHERE id = ?', (tenant_id,))
         
         conn.commit()
-        conn.close()
         
         return jsonify({'message': 'Tenant and associated leases deleted successfully'})
     else:
         # Check if tenant has related leases
         cursor.execute('SELECT id FROM lease WHERE tenant_id = ? LIMIT 1', (tenant_id,))
         if cursor.fetchone():
-            conn.close()
             return jsonify({'error': 'Cannot delete tenant with associated leases. Remove leases first or use cascade delete option.'}), 400
         
         # Delete tenant - shop status will be updated by trigger
         cursor.execute('DELETE FROM tenant WHERE id = ?', (tenant_id,))
         
         conn.commit()
-        conn.close()
         
         return jsonify({'message': 'Tenant deleted successfully'})
 
-@app.route('/api/leases', methods=['GET'])
-def get_leases():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT l.*, t.name as tenant_name, s.name as shop_name
-    FROM lease l
-    JOIN tenant t ON l.tenant_id = t.id
-    JOIN shop s ON l.shop_id = s.id
-    ''')
-    leases = cursor.fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
+def lease_details_to_dict(lease):
+    return {
         'id': lease['id'],
         'tenant_id': lease['tenant_id'],
         'tenant_name': lease['tenant_name'],
@@ -768,7 +2858,57 @@ def get_leases():
         'end_date': lease['end_date'],
         'rent_amount': lease['rent_amount'],
         'status': lease['status']
-    } for lease in leases])
+    }
+
+@app.route('/api/leases', methods=['GET'])
+@depends_on('lease', 'tenant', 'shop')
+def get_leases():
+    # Use the lease_details view for tenant and shop names
+    return list_endpoint('leases', lease_details_to_dict)
+
+# Another active lease of the shop whose dates overlap start_date..end_date,
+# looked up in the lease_interval R*Tree
+def overlapping_lease(conn, shop_id, start_date, end_date, exclude_id=0):
+    return conn.execute(f'''
+    SELECT l.id, l.start_date, l.end_date
+    FROM lease_interval li
+    JOIN lease l ON l.id = li.id
+    WHERE li.shop_from <= ? AND li.shop_to >= ?
+      AND li.start_day <= {lease_day('?')} AND li.end_day >= {lease_day('?')}
+      AND li.id != ?
+    LIMIT 1
+    ''', (shop_id, shop_id, end_date, start_date, exclude_id)).fetchone()
+
+def overlap_error(lease):
+    return f"Shop already has an active lease from {lease['start_date']} to {lease['end_date']} (lease {lease['id']})"
+
+# Error message for a lease write the lease_overlap_* triggers aborted, e.g.
+# one that raced another writer past the check, or None for other errors
+def trigger_overlap_error(conn, error, shop_id, start_date, end_date, exclude_id=0):
+    if LEASE_OVERLAP_ERROR not in str(error):
+        return None
+    conflict = overlapping_lease(conn, shop_id, start_date, end_date, exclude_id)
+    return overlap_error(conflict) if conflict else LEASE_OVERLAP_ERROR
+
+# A YYYY-MM-DD string as a date, None for anything else. strptime alone
+# also takes single-digit months and days.
+def parse_lease_date(value):
+    if not isinstance(value, str) or len(value) != 10:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+# Validate a lease's dates; returns an error message or None
+def check_lease_dates(start_date, end_date):
+    start = parse_lease_date(start_date)
+    end = parse_lease_date(end_date)
+    if start is None or end is None:
+        return 'Dates must be YYYY-MM-DD'
+    if end < start:
+        return 'End date must not be before the start date'
+    return None
 
 @app.route('/api/leases', methods=['POST'])
 def create_lease():
@@ -796,6 +2936,9 @@ def create_lease():
         return jsonify({'error': 'End date is required'}), 400
     if not rent_amount:
         return jsonify({'error': 'Rent amount is required'}), 400
+    date_error = check_lease_dates(start_date, end_date)
+    if date_error:
+        return jsonify({'error': date_error}), 400
     
     conn = get_db()
     cursor = conn.cursor()
@@ -803,31 +2946,31 @@ def create_lease():
     # Check if tenant and shop exist
     cursor.execute('SELECT id FROM tenant WHERE id = ?', (tenant_id,))
     if not cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Tenant not found'}), 404
     
     cursor.execute('SELECT id, status FROM shop WHERE id = ?', (shop_id,))
     shop = cursor.fetchone()
     if not shop:
-        conn.close()
         return jsonify({'error': 'Shop not found'}), 404
     
-    # Check for conflicting leases (active leases for the same shop)
+    # Check for conflicting leases (active leases of the same shop with overlapping dates)
     if status == 'Active':
-        cursor.execute('''
-        SELECT id FROM lease 
-        WHERE shop_id = ? AND status = 'Active' AND id != ?
-        ''', (shop_id, data.get('id', 0)))
-        
-        if cursor.fetchone():
-            conn.close()
-            return jsonify({'error': 'Shop already has an active lease'}), 400
+        conflict = overlapping_lease(conn, shop_id, start_date, end_date)
+        if conflict:
+            return jsonify({'error': overlap_error(conflict)}), 400
     
     # Insert new lease
-    cursor.execute('''
-    INSERT INTO lease (tenant_id, shop_id, start_date, end_date, rent_amount, status)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ''', (tenant_id, shop_id, start_date, end_date, rent_amount, status))
+    try:
+        cursor.execute('''
+        INSERT INTO lease (tenant_id, shop_id, start_date, end_date, rent_amount, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (tenant_id, shop_id, start_date, end_date, rent_amount, status))
+    except sqlite3.IntegrityError as e:
+        message = trigger_overlap_error(conn, e, shop_id, start_date, end_date)
+        conn.rollback()
+        if not message:
+            raise
+        return jsonify({'error': message}), 400
     
     lease_id = cursor.lastrowid
     
@@ -840,7 +2983,6 @@ def create_lease():
                   (shop_id, tenant_id, shop_id))
     
     conn.commit()
-    conn.close()
     
     return jsonify({
         'message': 'Lease created successfully',
@@ -848,6 +2990,7 @@ def create_lease():
     }), 201
 
 @app.route('/api/leases/<int:lease_id>', methods=['GET'])
+@depends_on('lease', 'tenant', 'shop')
 def get_lease(lease_id):
     conn = get_db()
     cursor = conn.cursor()
@@ -862,11 +3005,8 @@ def get_lease(lease_id):
     lease = cursor.fetchone()
     
     if not lease:
-        conn.close()
         return jsonify({'error': 'Lease not found'}), 404
     
-    conn.close()
-    
     return jsonify({
         'id': lease['id'],
         'tenant_id': lease['tenant_id'],
@@ -913,6 +3053,9 @@ def update_lease(lease_id):
         rent_amount = float(rent_amount)
     except (ValueError, TypeError):
         return jsonify({'error': 'Invalid ID or rent amount format'}), 400
+    date_error = check_lease_dates(start_date, end_date)
+    if date_error:
+        return jsonify({'error': date_error}), 400
     
     conn = get_db()
     # Enable foreign key constraints
@@ -925,14 +3068,12 @@ def update_lease(lease_id):
         cursor.execute('BEGIN TRANSACTION')
         
         # Check if lease exists and get current information
-        cursor.execute('SELECT shop_id, tenant_id, status FROM lease WHERE id = ?', (lease_id,))
+        cursor.execute('SELECT tenant_id, status FROM lease WHERE id = ?', (lease_id,))
         lease = cursor.fetchone()
         if not lease:
             cursor.execute('ROLLBACK')
-            conn.close()
             return jsonify({'error': 'Lease not found'}), 404
         
-        old_shop_id = lease['shop_id']
         old_tenant_id = lease['tenant_id']
         old_status = lease['status']
         
@@ -940,26 +3081,19 @@ def update_lease(lease_id):
         cursor.execute('SELECT id FROM tenant WHERE id = ?', (tenant_id,))
         if not cursor.fetchone():
             cursor.execute('ROLLBACK')
-            conn.close()
             return jsonify({'error': 'Tenant not found'}), 404
         
         cursor.execute('SELECT id FROM shop WHERE id = ?', (shop_id,))
         if not cursor.fetchone():
             cursor.execute('ROLLBACK')
-            conn.close()
             return jsonify({'error': 'Shop not found'}), 404
         
-        # Check for conflicting leases (active leases for the same shop)
-        if status == 'Active' and int(shop_id) != int(old_shop_id):
-            cursor.execute('''
-            SELECT id FROM lease 
-            WHERE shop_id = ? AND status = 'Active' AND id != ?
-            ''', (shop_id, lease_id))
-            
-            if cursor.fetchone():
+        # Check for conflicting leases (active leases of the same shop with overlapping dates)
+        if status == 'Active':
+            conflict = overlapping_lease(conn, shop_id, start_date, end_date, lease_id)
+            if conflict:
                 cursor.execute('ROLLBACK')
-                conn.close()
-                return jsonify({'error': 'Shop already has an active lease'}), 400
+                return jsonify({'error': overlap_error(conflict)}), 400
         
         # Update lease
         cursor.execute('''
@@ -999,13 +3133,17 @@ def update_lease(lease_id):
                 cursor.execute('UPDATE tenant SET shop_id = NULL WHERE id = ?', (old_tenant_id,))
         
         cursor.execute('COMMIT')
-        conn.close()
         
         return jsonify({'message': 'Lease updated successfully', 'id': lease_id})
     
+    except sqlite3.IntegrityError as e:
+        message = trigger_overlap_error(conn, e, shop_id, start_date, end_date, lease_id)
+        cursor.execute('ROLLBACK')
+        if not message:
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
+        return jsonify({'error': message}), 400
     except Exception as e:
         cursor.execute('ROLLBACK')
-        conn.close()
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
 @app.route('/api/leases/<int:lease_id>', methods=['DELETE'])
@@ -1017,7 +3155,6 @@ def delete_lease(lease_id):
     cursor.execute('SELECT shop_id, tenant_id, status FROM lease WHERE id = ?', (lease_id,))
     lease = cursor.fetchone()
     if not lease:
-        conn.close()
         return jsonify({'error': 'Lease not found'}), 404
     
     tenant_id = lease['tenant_id']
@@ -1046,22 +3183,11 @@ def delete_lease(lease_id):
             update_tenant_shop(tenant_id, None)
     
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Lease deleted successfully'})
 
-@app.route('/api/maintenance', methods=['GET'])
-def get_maintenance_requests():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Use the maintenance_details view
-    cursor.execute('SELECT * FROM maintenance_details ORDER BY id DESC')
-    maintenance = cursor.fetchall()
-    
-    conn.close()
-    
-    return jsonify([{
+def maintenance_details_to_dict(req):
+    return {
         'id': req['id'],
         'shop_id': req['shop_id'],
         'shop_name': req['shop_name'],
@@ -1073,7 +3199,13 @@ def get_maintenance_requests():
         'resolution_notes': req['resolution_notes'],
         'tenant_name': req['tenant_name'],
         'tenant_contact': req['tenant_contact']
-    } for req in maintenance])
+    }
+
+@app.route('/api/maintenance', methods=['GET'])
+@depends_on('maintenance', 'shop', 'tenant')
+def get_maintenance_requests():
+    # Use the maintenance_details view, newest first unless ?sort= says otherwise
+    return list_endpoint('maintenance', maintenance_details_to_dict)
 
 @app.route('/api/maintenance', methods=['POST'])
 def create_maintenance_request():
@@ -1101,7 +3233,6 @@ def create_maintenance_request():
     # Check if shop exists
     cursor.execute('SELECT id FROM shop WHERE id = ?', (shop_id,))
     if not cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Shop not found'}), 404
     
     # Insert new maintenance request
@@ -1113,7 +3244,6 @@ def create_maintenance_request():
     maintenance_id = cursor.lastrowid
     
     conn.commit()
-    conn.close()
     
     return jsonify({
         'message': 'Maintenance request created successfully',
@@ -1121,6 +3251,7 @@ def create_maintenance_request():
     }), 201
 
 @app.route('/api/maintenance/<int:maintenance_id>', methods=['GET'])
+@depends_on('maintenance', 'shop')
 def get_maintenance_request(maintenance_id):
     conn = get_db()
     cursor = conn.cursor()
@@ -1134,11 +3265,8 @@ def get_maintenance_request(maintenance_id):
     request = cursor.fetchone()
     
     if not request:
-        conn.close()
         return jsonify({'error': 'Maintenance request not found'}), 404
     
-    conn.close()
-    
     return jsonify({
         'id': request['id'],
         'shop_id': request['shop_id'],
@@ -1179,13 +3307,11 @@ def update_maintenance_request(maintenance_id):
     # Check if maintenance request exists
     cursor.execute('SELECT id FROM maintenance WHERE id = ?', (maintenance_id,))
     if not cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Maintenance request not found'}), 404
     
     # Check if shop exists
     cursor.execute('SELECT id FROM shop WHERE id = ?', (shop_id,))
     if not cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Shop not found'}), 404
     
     # Set resolved_date automatically if status changed to Resolved
@@ -1207,7 +3333,6 @@ def update_maintenance_request(maintenance_id):
           resolved_date, resolution_notes, maintenance_id))
     
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Maintenance request updated successfully', 'id': maintenance_id})
 
@@ -1219,14 +3344,12 @@ def delete_maintenance_request(maintenance_id):
     # Check if maintenance request exists
     cursor.execute('SELECT id FROM maintenance WHERE id = ?', (maintenance_id,))
     if not cursor.fetchone():
-        conn.close()
         return jsonify({'error': 'Maintenance request not found'}), 404
     
     # Delete maintenance request
     cursor.execute('DELETE FROM maintenance WHERE id = ?', (maintenance_id,))
     
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Maintenance request deleted successfully'})
 
@@ -1279,33 +3402,15 @@ def check_expired_leases():
     return jsonify({'message': message})
 
 @app.route('/api/dashboard/tenant-stats', methods=['GET'])
+@depends_on('shop', 'tenant', 'lease', 'maintenance')
 def tenant_lease_stats():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get total tenants
-    cursor.execute('SELECT COUNT(*) FROM tenant')
-    total_tenants = cursor.fetchone()[0]
-    
-    # Get tenants with active leases
-    cursor.execute('''
-    SELECT COUNT(DISTINCT t.id)
-    FROM tenant t
-    JOIN lease l ON t.id = l.tenant_id
-    WHERE l.status = 'Active'
-    ''')
-    tenants_with_leases = cursor.fetchone()[0]
-    
-    # Get tenants without leases
-    tenants_without_leases = total_tenants - tenants_with_leases
-    
-    conn.close()
+    summary = get_dashboard_summary()
     
     return jsonify({
-        'total_tenants': total_tenants,
-        'tenants_with_leases': tenants_with_leases,
-        'tenants_without_leases': tenants_without_leases,
-        'lease_coverage_percent': round((tenants_with_leases / total_tenants * 100) if total_tenants > 0 else 0, 1)
+        'total_tenants': summary['total_tenants'],
+        'tenants_with_leases': summary['tenants_with_leases'],
+        'tenants_without_leases': summary['tenants_without_leases'],
+        'lease_coverage_percent': summary['lease_coverage_percent']
     })
 
 @app.route('/api/tenant-with-lease', methods=['POST'])
@@ -1348,10 +3453,15 @@ def tenant_with_lease(tenant_id=None):
     
     if not rent_amount:
         return jsonify({'error': 'Lease rent amount is required'}), 400
+    date_error = check_lease_dates(start_date, end_date)
+    if date_error:
+        return jsonify({'error': date_error}), 400
+    status = lease_data.get('status', 'Active')
     
     conn = get_db()
     conn.isolation_level = None  # Enable autocommit mode
     cursor = conn.cursor()
+    existing_lease = None
     
     try:
         cursor.execute('BEGIN TRANSACTION')
@@ -1405,6 +3515,13 @@ def tenant_with_lease(tenant_id=None):
         
         existing_lease = cursor.fetchone()
         
+        # Check for conflicting leases (active leases of the same shop with overlapping dates)
+        if status == 'Active':
+            conflict = overlapping_lease(conn, shop_id, start_date, end_date,
+                                         existing_lease['id'] if existing_lease else 0)
+            if conflict:
+                raise ValueError(overlap_error(conflict))
+        
         if existing_lease:
             # Update existing lease
             cursor.execute('''
@@ -1416,22 +3533,12 @@ def tenant_with_lease(tenant_id=None):
                 start_date,
                 end_date,
                 rent_amount,
-                lease_data.get('status', 'Active'),
+                status,
                 existing_lease['id']
             ))
             
             lease_id = existing_lease['id']
         else:
-            # Check for active lease on this shop
-            cursor.execute('''
-            SELECT id FROM lease 
-            WHERE shop_id = ? AND status = 'Active'
-            ''', (shop_id,))
-            
-            shop_lease = cursor.fetchone()
-            if shop_lease:
-                raise ValueError('Shop already has an active lease')
-            
             # Create new lease
             cursor.execute('''
             INSERT INTO lease (tenant_id, shop_id, start_date, end_date, rent_amount, status)
@@ -1442,7 +3549,7 @@ def tenant_with_lease(tenant_id=None):
                 start_date,
                 end_date,
                 rent_amount,
-                lease_data.get('status', 'Active')
+                status
             ))
             
             lease_id = cursor.lastrowid
@@ -1462,11 +3569,16 @@ def tenant_with_lease(tenant_id=None):
     except ValueError as e:
         cursor.execute('ROLLBACK')
         return jsonify({'error': str(e)}), 400
+    except sqlite3.IntegrityError as e:
+        message = trigger_overlap_error(conn, e, shop_id, start_date, end_date,
+                                        existing_lease['id'] if existing_lease else 0)
+        cursor.execute('ROLLBACK')
+        if not message:
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
+        return jsonify({'error': message}), 400
     except Exception as e:
         cursor.execute('ROLLBACK')
         return jsonify({'error': f'Database error: {str(e)}'}), 500
-    finally:
-        conn.close()
 
 @app.route('/api/tenant-simple', methods=['POST'])
 def create_tenant_with_default_lease():
@@ -1512,10 +3624,18 @@ def create_tenant_with_default_lease():
         if not shop:
             raise ValueError(f'Shop not found with ID: {shop_id}')
         
-        # Check for active lease on this shop
-        cursor.execute('SELECT id FROM lease WHERE shop_id = ? AND status = "Active"', (shop_id,))
-        if cursor.fetchone():
-            raise ValueError(f'Shop {shop_id} already has an active lease. Please select another shop.')
+        # Create default lease (1 year from today)
+        start_date = datetime.now().strftime('%Y-%m-%d')
+        end_date = datetime(
+            datetime.now().year + 1, 
+            datetime.now().month,
+            datetime.now().day
+        ).strftime('%Y-%m-%d')
+        
+        # Check for conflicting leases (active leases of the same shop with overlapping dates)
+        conflict = overlapping_lease(conn, shop_id, start_date, end_date)
+        if conflict:
+            raise ValueError(overlap_error(conflict))
         
         # Create new tenant
         cursor.execute('''
@@ -1525,14 +3645,6 @@ def create_tenant_with_default_lease():
         
         tenant_id = cursor.lastrowid
         
-        # Create default lease (1 year from today)
-        start_date = datetime.now().strftime('%Y-%m-%d')
-        end_date = datetime(
-            datetime.now().year + 1, 
-            datetime.now().month,
-            datetime.now().day
-        ).strftime('%Y-%m-%d')
-        
         # Use shop's rent as default rent amount
         shop_rent = shop['rent']
         if not shop_rent:
@@ -1566,14 +3678,1942 @@ def create_tenant_with_default_lease():
     except ValueError as e:
         cursor.execute('ROLLBACK')
         return jsonify({'error': str(e)}), 400
+    except sqlite3.IntegrityError as e:
+        message = trigger_overlap_error(conn, e, shop_id, start_date, end_date)
+        cursor.execute('ROLLBACK')
+        if not message:
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
+        return jsonify({'error': message}), 400
     except Exception as e:
         cursor.execute('ROLLBACK')
         return jsonify({'error': f'Database error: {str(e)}'}), 500
+
+# Bulk import
+# Field converters turn CSV strings / NDJSON values into column values and
+# raise ValueError with a message for the per-row error report
+def text_field(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def int_field(value):
+    value = text_field(value)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a whole number")
+
+def float_field(value):
+    value = text_field(value)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a number")
+
+def date_field(value):
+    value = text_field(value)
+    if value is None:
+        return None
+    try:
+        datetime.strptime(value[:10], '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"'{value}' is not a YYYY-MM-DD date")
+    return value
+
+# Existing ids in table out of ids, in one query
+def existing_ids(conn, table, ids):
+    cursor = conn.execute(
+        f'SELECT id FROM {table} WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(list(ids)),)
+    )
+    return {row[0] for row in cursor}
+
+# Reject active leases whose dates overlap another active lease of the same
+# shop, stored or earlier in the import, like create_lease does
+def check_bulk_leases(conn, rows):
+    accepted = []
+    rejected = []
+    imported = {}
+    for row_number, values in rows:
+        if values['status'] == 'Active':
+            start, end = values['start_date'][:10], values['end_date'][:10]
+            if end < start:
+                rejected.append((row_number, 'End date must not be before the start date'))
+                continue
+            intervals = imported.setdefault(values['shop_id'], [])
+            conflict = overlapping_lease(conn, values['shop_id'], start, end)
+            if conflict:
+                rejected.append((row_number, overlap_error(conflict)))
+                continue
+            if any(other_start <= end and other_end >= start for other_start, other_end in intervals):
+                rejected.append((row_number, 'Overlaps an active lease of the same shop earlier in the import'))
+                continue
+            intervals.append((start, end))
+        accepted.append((row_number, values))
+    return accepted, rejected
+
+# Mark shops with new tenants as occupied, like create_tenant does
+def after_bulk_tenants(conn, rows):
+    shop_ids = {values['shop_id'] for _, values in rows if values['shop_id']}
+    conn.execute(
+        "UPDATE shop SET status = 'Occupied' WHERE status != 'Occupied' AND id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(shop_ids)),)
+    )
+
+# Occupy shops with active leases and move tenants to their leased shop, like create_lease does
+def after_bulk_leases(conn, rows):
+    shop_ids = {values['shop_id'] for _, values in rows if values['status'] == 'Active'}
+    conn.execute(
+        "UPDATE shop SET status = 'Occupied' WHERE status != 'Occupied' AND id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(shop_ids)),)
+    )
+    conn.executemany(
+        'UPDATE tenant SET shop_id = ? WHERE id = ? AND (shop_id IS NULL OR shop_id != ?)',
+        [(values['shop_id'], values['tenant_id'], values['shop_id']) for _, values in rows]
+    )
+
+# Table, fields (name, converter, required, default), foreign keys and
+# extra checks / side effects for each entity /api/bulk/<entity> accepts.
+# A callable default is evaluated once per chunk.
+BULK_ENTITIES = {
+    'shops': {
+        'table': 'shop',
+        'fields': [
+            ('name', text_field, True, None),
+            ('location', text_field, False, None),
+            ('size', float_field, False, None),
+            ('rent', float_field, False, None),
+            ('status', text_field, False, 'Vacant'),
+        ],
+        'foreign_keys': {},
+    },
+    'tenants': {
+        'table': 'tenant',
+        'fields': [
+            ('name', text_field, True, None),
+            ('contact', text_field, False, None),
+            ('email', text_field, False, None),
+            ('business_type', text_field, False, None),
+            ('shop_id', int_field, False, None),
+        ],
+        'foreign_keys': {'shop_id': 'shop'},
+        'after_insert': after_bulk_tenants,
+    },
+    'leases': {
+        'table': 'lease',
+        'fields': [
+            ('tenant_id', int_field, True, None),
+            ('shop_id', int_field, True, None),
+            ('start_date', date_field, True, None),
+            ('end_date', date_field, True, None),
+            ('rent_amount', float_field, True, None),
+            ('status', text_field, False, 'Active'),
+        ],
+        'foreign_keys': {'tenant_id': 'tenant', 'shop_id': 'shop'},
+        'check': check_bulk_leases,
+        'after_insert': after_bulk_leases,
+    },
+    'maintenance': {
+        'table': 'maintenance',
+        'fields': [
+            ('shop_id', int_field, True, None),
+            ('description', text_field, True, None),
+            ('reported_date', text_field, False, lambda: datetime.now().strftime('%Y-%m-%d')),
+            ('status', text_field, False, 'Pending'),
+            ('priority', text_field, False, 'Medium'),
+        ],
+        'foreign_keys': {'shop_id': 'shop'},
+    },
+}
+
+# Yield (record, error) for each CSV row or NDJSON line in a binary stream
+def read_bulk_records(stream, data_format):
+    if data_format == 'csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        for record in csv.DictReader(text):
+            yield record, None
+    else:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield None, 'Invalid JSON'
+                continue
+            if not isinstance(record, dict):
+                yield None, 'Each line must be a JSON object'
+                continue
+            yield record, None
+
+def validate_bulk_record(fields, defaults, record):
+    values = {}
+    for name, convert, required, _ in fields:
+        try:
+            value = convert(record.get(name))
+        except ValueError as e:
+            raise ValueError(f'{name}: {e}')
+        if value is None:
+            if required:
+                raise ValueError(f'{name} is required')
+            value = defaults[name]
+        values[name] = value
+    return values
+
+def add_bulk_error(result, row_number, message):
+    result['failed'] += 1
+    if len(result['errors']) < app.config['BULK_MAX_ERRORS']:
+        result['errors'].append({'row': row_number, 'error': message})
+
+# Validate one chunk, then insert the valid rows with executemany in a single transaction
+def import_bulk_chunk(conn, spec, chunk, result):
+    # Callable defaults (e.g. today's date) are evaluated once per chunk
+    fields = spec['fields']
+    defaults = {name: default() if callable(default) else default for name, _, _, default in fields}
+    
+    rows = []
+    for row_number, record, error in chunk:
+        if error:
+            add_bulk_error(result, row_number, error)
+            continue
+        try:
+            rows.append((row_number, validate_bulk_record(fields, defaults, record)))
+        except ValueError as e:
+            add_bulk_error(result, row_number, str(e))
+    
+    # Foreign keys are checked for the whole chunk with one query per referenced table
+    for column, table in spec['foreign_keys'].items():
+        ids = {values[column] for _, values in rows if values[column] is not None}
+        found = existing_ids(conn, table, ids) if ids else set()
+        valid_rows = []
+        for row_number, values in rows:
+            if values[column] is not None and values[column] not in found:
+                add_bulk_error(result, row_number, f'{column} {values[column]} not found')
+            else:
+                valid_rows.append((row_number, values))
+        rows = valid_rows
+    
+    if 'check' in spec:
+        rows, rejected = spec['check'](conn, rows)
+        for row_number, message in rejected:
+            add_bulk_error(result, row_number, message)
+    
+    if not rows:
+        return
+    
+    columns = [name for name, _, _, _ in spec['fields']]
+    sql = f"INSERT INTO {spec['table']} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    try:
+        conn.executemany(sql, [tuple(values[column] for column in columns) for _, values in rows])
+        if 'after_insert' in spec:
+            spec['after_insert'](conn, rows)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        for row_number, _ in rows:
+            add_bulk_error(result, row_number, f'Database error: {e}')
+        return
+    
+    result['inserted'] += len(rows)
+
+def bulk_import(entity, records):
+    spec = BULK_ENTITIES[entity]
+    conn = get_db()
+    chunk_size = app.config['BULK_CHUNK_SIZE']
+    started = time.monotonic()
+    
+    result = {'entity': entity, 'inserted': 0, 'failed': 0, 'errors': []}
+    chunk = []
+    for row_number, (record, error) in enumerate(records, 1):
+        chunk.append((row_number, record, error))
+        if len(chunk) >= chunk_size:
+            import_bulk_chunk(conn, spec, chunk, result)
+            chunk = []
+    if chunk:
+        import_bulk_chunk(conn, spec, chunk, result)
+    
+    result['errors'].sort(key=lambda error: error['row'])
+    duration = time.monotonic() - started
+    total = result['inserted'] + result['failed']
+    result['duration_ms'] = round(duration * 1000, 1)
+    result['rows_per_second'] = round(total / duration) if duration > 0 else total
+    return result
+
+@app.route('/api/bulk/<entity>', methods=['POST'])
+def bulk_import_endpoint(entity):
+    if entity not in BULK_ENTITIES:
+        return jsonify({'error': f"Unknown entity '{entity}', use one of: {', '.join(BULK_ENTITIES)}"}), 404
+    
+    # Accept a multipart upload in 'file' or the raw request body
+    upload = request.files.get('file')
+    # The raw body stream reads line by line very slowly, so buffer it
+    stream = upload.stream if upload else io.BufferedReader(request.stream, 1 << 16)
+    filename = upload.filename if upload else ''
+    mimetype = upload.mimetype if upload else request.mimetype
+    
+    data_format = request.args.get('format')
+    if not data_format:
+        if mimetype == 'text/csv' or filename.endswith('.csv'):
+            data_format = 'csv'
+        elif mimetype == 'application/x-ndjson' or filename.endswith(('.ndjson', '.jsonl')):
+            data_format = 'ndjson'
+    if data_format not in ('csv', 'ndjson'):
+        return jsonify({'error': "Send text/csv or application/x-ndjson data, or pass ?format=csv|ndjson"}), 400
+    
+    # Chunks read before the undecodable bytes are already committed
+    try:
+        result = bulk_import(entity, read_bulk_records(stream, data_format))
+    except UnicodeDecodeError:
+        return jsonify({'error': 'CSV data must be UTF-8 encoded'}), 400
+    
+    return jsonify(result)
+
+# Batch lease operations
+# Filters a batch can select leases by, the same ones GET /api/leases accepts
+BATCH_LEASE_FILTERS = dict(LIST_QUERIES['leases']['filters'], ids='id IN (SELECT value FROM json_each(?))')
+
+LEASE_STATUSES = ('Active', 'Expired', 'Terminated')
+
+# Turn the filter and changes of a batch request into a WHERE clause and the
+# SET expressions for each changed column, with their parameters
+def build_lease_batch(data):
+    filters = data.get('filter')
+    if not isinstance(filters, dict):
+        raise QueryArgumentError("filter is required, pass {} to select every lease")
+    
+    where = []
+    where_params = []
+    for name, value in filters.items():
+        if name not in BATCH_LEASE_FILTERS:
+            raise QueryArgumentError(f"Cannot filter by '{name}', use one of: {', '.join(BATCH_LEASE_FILTERS)}")
+        if name == 'ids':
+            if not isinstance(value, list):
+                raise QueryArgumentError('ids must be a list')
+            value = json.dumps(value)
+        where.append(BATCH_LEASE_FILTERS[name])
+        where_params.append(value)
+    
+    changes = data.get('changes') or {}
+    unknown = set(changes) - {'extend_months', 'rent_increase_pct', 'status'}
+    if unknown:
+        raise QueryArgumentError(f"Unknown change '{sorted(unknown)[0]}', use extend_months, rent_increase_pct or status")
+    
+    # column -> (expression computing the new value, its parameter)
+    updates = {}
+    if 'extend_months' in changes:
+        months = changes['extend_months']
+        if not isinstance(months, int) or isinstance(months, bool) or months == 0:
+            raise QueryArgumentError('extend_months must be a non-zero whole number')
+        updates['end_date'] = ('date(end_date, ?)', f'{months:+d} months')
+    if 'rent_increase_pct' in changes:
+        pct = changes['rent_increase_pct']
+        if not isinstance(pct, (int, float)) or isinstance(pct, bool) or pct <= -100:
+            raise QueryArgumentError('rent_increase_pct must be a number above -100')
+        updates['rent_amount'] = ('round(rent_amount * ?, 2)', 1 + pct / 100)
+    if 'status' in changes:
+        if changes['status'] not in LEASE_STATUSES:
+            raise QueryArgumentError(f"status must be one of: {', '.join(LEASE_STATUSES)}")
+        updates['status'] = ('?', changes['status'])
+    if not updates:
+        raise QueryArgumentError('changes must include extend_months, rent_increase_pct or status')
+    
+    where_sql = ' WHERE ' + ' AND '.join(where) if where else ''
+    return where_sql, where_params, updates
+
+# Shops where the leases matching a batch, with the batch's changes applied,
+# would overlap each other or another active lease
+def batch_overlap_shops(conn, where_sql, where_params, updates):
+    end_date, end_params = ('end_date', [])
+    if 'end_date' in updates:
+        end_date, end_params = updates['end_date'][0], [updates['end_date'][1]]
+    status, status_params = ('status', [])
+    if 'status' in updates:
+        status, status_params = updates['status'][0], [updates['status'][1]]
+    active_sql = f"{where_sql} AND {status} = 'Active'" if where_sql else f" WHERE {status} = 'Active'"
+    
+    return [row[0] for row in conn.execute(f'''
+    WITH changed AS (
+        SELECT id, shop_id, {lease_day('start_date')} AS start_day, {lease_day(end_date)} AS end_day
+        FROM lease{active_sql}
+    )
+    SELECT DISTINCT c.shop_id
+    FROM changed c
+    WHERE EXISTS (
+        SELECT 1 FROM lease_interval li
+        WHERE li.shop_from <= c.shop_id AND li.shop_to >= c.shop_id
+          AND li.start_day <= c.end_day AND li.end_day >= c.start_day
+          AND li.id NOT IN (SELECT id FROM lease{where_sql})
+    ) OR EXISTS (
+        SELECT 1 FROM changed o
+        WHERE o.shop_id = c.shop_id AND o.id != c.id AND o.start_day <= c.end_day AND o.end_day >= c.start_day
+    )
+    ORDER BY c.shop_id
+    ''', end_params + where_params + status_params + where_params)]
+
+# A tenant's shop after a batch changed the status of some of their leases, as
+# update_lease() assigns it: the shop of a lease the batch made active, else
+# the tenant's current shop if they still lease it, else another shop they
+# lease, else none
+BATCH_TENANT_SHOP_UPDATE = '''
+UPDATE tenant
+SET shop_id = COALESCE(
+    (SELECT l.shop_id FROM lease l
+     WHERE l.tenant_id = tenant.id AND l.status = 'Active' AND l.id IN (SELECT value FROM json_each(:changed))
+     ORDER BY l.id LIMIT 1),
+    (SELECT l.shop_id FROM lease l
+     WHERE l.tenant_id = tenant.id AND l.status = 'Active' AND l.shop_id = tenant.shop_id LIMIT 1),
+    (SELECT l.shop_id FROM lease l
+     WHERE l.tenant_id = tenant.id AND l.status = 'Active' ORDER BY l.id LIMIT 1)
+)
+WHERE id IN (SELECT tenant_id FROM lease WHERE id IN (SELECT value FROM json_each(:changed)))
+'''
+
+# Apply one set of changes to every lease matching the filter, in a single
+# transaction with one SELECT for the diff and one UPDATE for all rows (and
+# one for their tenants' shops when the status changes).
+# A dry run does the same work and rolls it back.
+def run_lease_batch(data, dry_run):
+    where_sql, where_params, updates = build_lease_batch(data)
+    columns = list(updates)
+    set_params = [updates[column][1] for column in columns]
+    diff_limit = app.config['BATCH_DIFF_LIMIT']
+    
+    conn = get_db()
+    started = time.monotonic()
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        
+        # Old and new value of each changed column, computed with the same
+        # expressions the UPDATE uses
+        selected = ', '.join(f'{column}, {updates[column][0]}' for column in columns)
+        cursor = conn.execute(
+            f'SELECT id, tenant_id, shop_id, {selected} FROM lease{where_sql} ORDER BY id',
+            set_params + where_params
+        )
+        matched = 0
+        diff = []
+        status_changed = []
+        status_index = 3 + 2 * columns.index('status') if 'status' in updates else None
+        for row in cursor:
+            matched += 1
+            if status_index is not None and row[status_index] != row[status_index + 1]:
+                status_changed.append(row['id'])
+            if len(diff) < diff_limit:
+                diff.append({
+                    'id': row['id'],
+                    'tenant_id': row['tenant_id'],
+                    'shop_id': row['shop_id'],
+                    'changes': {
+                        column: {'old': row[3 + 2 * i], 'new': row[4 + 2 * i]}
+                        for i, column in enumerate(columns)
+                        if row[3 + 2 * i] != row[4 + 2 * i]
+                    },
+                })
+        
+        # The lease_overlap_update trigger aborts the UPDATE if an active
+        # lease would overlap another one of the same shop
+        assignments = ', '.join(f'{column} = {updates[column][0]}' for column in columns)
+        conflicts = []
+        try:
+            cursor = conn.execute(f'UPDATE lease SET {assignments}{where_sql}', set_params + where_params)
+            updated = cursor.rowcount
+            if status_changed:
+                conn.execute(BATCH_TENANT_SHOP_UPDATE, {'changed': json.dumps(status_changed)})
+        except sqlite3.IntegrityError as e:
+            if LEASE_OVERLAP_ERROR not in str(e):
+                raise
+            updated = 0
+            conflicts = batch_overlap_shops(conn, where_sql, where_params, updates)
+        
+        if dry_run or conflicts:
+            conn.execute('ROLLBACK')
+        else:
+            conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.isolation_level = ''
+    
+    result = {
+        'dry_run': dry_run,
+        'matched': matched,
+        'updated': 0 if dry_run or conflicts else updated,
+        'diff': diff,
+        'diff_truncated': matched > len(diff),
+        'duration_ms': round((time.monotonic() - started) * 1000, 3),
+    }
+    if conflicts:
+        result['error'] = 'Active leases would overlap other active leases of the same shops'
+        result['conflicting_shop_ids'] = conflicts
+    return result
+
+@app.route('/api/leases/batch', methods=['POST'])
+def lease_batch():
+    data = request.json
+    
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    dry_run = data.get('dry_run', False)
+    if request.args.get('dry_run'):
+        dry_run = request.args['dry_run'].lower() in ('1', 'true', 'yes')
+    
+    try:
+        result = run_lease_batch(data, bool(dry_run))
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    
+    if 'error' in result:
+        return jsonify(result), 409
+    return jsonify(result)
+
+# Change feed
+def format_change_event(row):
+    change = {
+        'table': row['table_name'],
+        'op': row['op'],
+        'id': row['row_id'],
+        'row': json.loads(row['data']) if row['data'] else None,
+        'at': row['changed_at'],
+    }
+    return f"id: {row['id']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+
+# Yield change_log entries after last_id as Server-Sent Events until the
+# stream times out. Checks out a pooled connection only while querying.
+def generate_change_events(pool, last_id, tables, reset):
+    config = app.config
+    sql = 'SELECT * FROM change_log WHERE id > ?'
+    if tables:
+        sql += f" AND table_name IN ({', '.join('?' * len(tables))})"
+    sql += ' ORDER BY id LIMIT 500'
+    
+    yield 'retry: 2000\n\n'
+    if reset:
+        # The client's position has been pruned, it has to reload everything
+        yield f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+    
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < config['EVENTS_STREAM_TIMEOUT']:
+        seen_writes = pool.write_count
+        conn = pool.acquire()
+        try:
+            rows = conn.execute(sql, [last_id] + tables).fetchall()
+        finally:
+            pool.release(conn)
+        
+        for row in rows:
+            yield format_change_event(row)
+            last_id = row['id']
+        if rows:
+            last_sent = time.monotonic()
+            if len(rows) == 500:
+                continue
+        elif time.monotonic() - last_sent >= config['EVENTS_HEARTBEAT']:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+        
+        pool.wait_for_write(seen_writes, config['EVENTS_POLL_INTERVAL'])
+
+# Tables named in ?tables=a,b (empty for all of them)
+def requested_tables():
+    tables = [table for table in request.args.get('tables', '').split(',') if table]
+    unknown = set(tables) - set(CHANGE_LOG_COLUMNS)
+    if unknown:
+        raise QueryArgumentError(f"Unknown table '{sorted(unknown)[0]}', use any of: {', '.join(CHANGE_LOG_COLUMNS)}")
+    return tables
+
+@app.route('/api/events')
+def change_events():
+    tables = requested_tables()
+    
+    # Browsers send Last-Event-ID when they reconnect; ?last_event_id= lets
+    # a new client start from a known position
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    conn = get_db()
+    oldest, newest = conn.execute('SELECT MIN(id), MAX(id) FROM change_log').fetchone()
+    reset = False
+    if last_id is None:
+        # New clients only get changes from now on
+        last_id = newest or 0
+    else:
+        try:
+            last_id = int(last_id)
+        except ValueError:
+            return jsonify({'error': 'Last-Event-ID must be a number'}), 400
+        if oldest is not None and last_id < oldest - 1:
+            reset = True
+            last_id = newest
+    
+    response = Response(
+        generate_change_events(get_pool(), last_id, tables, reset),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop proxies such as nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Delta sync
+# Changed rows and tombstones for /api/sync, read in one transaction so the
+# response is a consistent snapshot at the version it reports
+def read_sync_delta(conn, tables, since, limit, after=None):
+    version, pruned_version = conn.execute('SELECT version, pruned_version FROM sync_state').fetchone()
+    # since=0 asks for a full sync, as do positions whose tombstones are gone
+    if after is not None or since == 0 or since < pruned_version:
+        return read_full_sync(conn, tables, version, limit, after)
+    
+    # Versions are unique, so stopping just before the (limit + 1)th
+    # changed version never splits a version across two responses
+    placeholders = ', '.join('?' * len(tables))
+    versions = ' UNION ALL '.join(
+        [f'SELECT row_version AS version FROM {table} WHERE row_version > ?' for table in tables]
+        + [f'SELECT version FROM sync_tombstone WHERE version > ? AND table_name IN ({placeholders})']
+    )
+    next_version = conn.execute(
+        f'SELECT version FROM ({versions}) ORDER BY version LIMIT 1 OFFSET ?',
+        [since] * len(tables) + [since] + tables + [limit]
+    ).fetchone()
+    has_more = False
+    if next_version:
+        version = next_version[0] - 1
+        has_more = True
+    
+    changes = {}
+    for table in tables:
+        columns = CHANGE_LOG_COLUMNS[table]
+        rows = conn.execute(f'''
+        SELECT {', '.join(columns)} FROM {table}
+        WHERE row_version > ? AND row_version <= ?
+        ORDER BY row_version
+        ''', (since, version)).fetchall()
+        deleted = [row[0] for row in conn.execute('''
+        SELECT row_id FROM sync_tombstone
+        WHERE table_name = ? AND version > ? AND version <= ?
+        ORDER BY version
+        ''', (table, since, version))]
+        changes[table] = {
+            'columns': columns,
+            'rows': [list(row) for row in rows],
+            'deleted': deleted,
+        }
+    
+    return {'version': version, 'full': False, 'has_more': has_more, 'next_cursor': None, 'tables': changes}
+
+# A full copy of the tables, `limit` rows at a time in (table, row_version, id)
+# order. Every page reports the version the first page was read at, and
+# next_cursor carries it along with the position to continue from. Rows
+# changed while the pages are fetched move to the end of their table and may
+# come twice; anything changed after that version, deletes included, comes
+# with the delta from it once the last page is in.
+def read_full_sync(conn, tables, version, limit, after):
+    if after is None:
+        table_index, row_version, row_id = 0, -1, 0
+    else:
+        version, table, row_version, row_id = decode_cursor(after, 4)
+        if table not in tables or not all(isinstance(value, int) for value in (version, row_version, row_id)):
+            raise QueryArgumentError('Invalid cursor')
+        table_index = tables.index(table)
+    
+    changes = {table: {'columns': CHANGE_LOG_COLUMNS[table], 'rows': [], 'deleted': []} for table in tables}
+    next_cursor = None
+    remaining = limit
+    for table in tables[table_index:]:
+        columns = CHANGE_LOG_COLUMNS[table]
+        rows = conn.execute(f'''
+        SELECT {', '.join(columns)}, row_version FROM {table}
+        WHERE (row_version, id) > (?, ?)
+        ORDER BY row_version, id
+        LIMIT ?
+        ''', (row_version, row_id, remaining + 1)).fetchall()
+        if len(rows) > remaining:
+            rows = rows[:remaining]
+            # After the last row sent, or from the start of this table when
+            # the tables before it filled the page
+            position = [rows[-1]['row_version'], rows[-1]['id']] if rows else [-1, 0]
+            next_cursor = encode_cursor([version, table] + position)
+        changes[table]['rows'] = [list(row)[:-1] for row in rows]
+        if next_cursor:
+            break
+        remaining -= len(rows)
+        row_version, row_id = -1, 0
+    
+    # After the last page, has_more says whether the delta from the snapshot
+    # version has anything in it yet
+    has_more = next_cursor is not None or conn.execute('SELECT version FROM sync_state').fetchone()[0] > version
+    return {'version': version, 'full': True, 'has_more': has_more, 'next_cursor': next_cursor, 'tables': changes}
+
+@app.route('/api/sync')
+@depends_on(*CHANGE_LOG_COLUMNS)
+def sync_changes():
+    tables = requested_tables()
+    
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', app.config['SYNC_MAX_LIMIT']))
+    except ValueError:
+        return jsonify({'error': 'since and limit must be whole numbers'}), 400
+    if since < 0 or not 1 <= limit <= app.config['SYNC_MAX_LIMIT']:
+        return jsonify({'error': f"since must be 0 or more and limit between 1 and {app.config['SYNC_MAX_LIMIT']}"}), 400
+    
+    conn = get_db()
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN')
+        try:
+            delta = read_sync_delta(conn, tables or list(CHANGE_LOG_COLUMNS), since, limit, request.args.get('after'))
+        finally:
+            conn.execute('COMMIT')
+    finally:
+        conn.isolation_level = ''
+    
+    return jsonify(delta)
+
+# Search
+# What each searchable table shows as a result title, and the bm25 weight of
+# each SEARCH_COLUMNS column (matches in names count for more than in emails)
+SEARCH_RESULTS = {
+    'tenant': ('b.name', (10.0, 2.0, 1.0)),
+    'shop': ('b.name', (10.0, 2.0)),
+    'maintenance': ('b.description', (5.0, 1.0)),
+}
+
+# Turn free text into an FTS5 query where every word has to match as a prefix.
+# Quoting each word keeps FTS5 syntax such as AND, NEAR or ":" out of user input.
+def search_query(text):
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text)[:10])
+
+# Escape a snippet for HTML, turning the \x02/\x03 match markers into <mark>
+def snippet_html(snippet):
+    return html.escape(snippet or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+@app.route('/api/search')
+@depends_on(*SEARCH_COLUMNS)
+def search():
+    query = search_query(request.args.get('q', ''))
+    if not query:
+        return jsonify({'error': 'q must contain at least one word'}), 400
+    
+    # ?types=shop,shop would search shops twice and list every match twice
+    types = list(dict.fromkeys(name for name in request.args.get('types', '').split(',') if name)) or list(SEARCH_COLUMNS)
+    unknown = set(types) - set(SEARCH_COLUMNS)
+    if unknown:
+        return jsonify({'error': f"Cannot search '{sorted(unknown)[0]}', use any of: {', '.join(SEARCH_COLUMNS)}"}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    limit = max(1, min(limit, app.config['SEARCH_MAX_LIMIT']))
+    
+    conn = get_db()
+    results = []
+    for table in types:
+        title, weights = SEARCH_RESULTS[table]
+        rows = conn.execute(f'''
+        SELECT b.id, {title} AS title,
+               bm25({table}_fts, {', '.join(map(str, weights))}) AS score,
+               snippet({table}_fts, -1, char(2), char(3), '…', 12) AS snippet
+        FROM {table}_fts
+        JOIN {table} b ON b.id = {table}_fts.rowid
+        WHERE {table}_fts MATCH ?
+        ORDER BY score
+        LIMIT ?
+        ''', (query, limit)).fetchall()
+        results.extend({
+            'type': table,
+            'id': row['id'],
+            'title': row['title'],
+            'snippet': snippet_html(row['snippet']),
+            'score': round(row['score'], 4),
+        } for row in rows)
+    
+    # bm25 scores are lower for better matches
+    results.sort(key=lambda result: result['score'])
+    return jsonify({'query': query, 'results': results[:limit]})
+
+# Analytics
+# Contracted rent per month from the active leases, computed over NumPy
+# arrays: each lease adds its rent from its first month to its last with a
+# difference array (two bincounts and a cumsum), so the cost grows with the
+# number of leases, not leases x months
+def load_rent_roll_leases(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute('''
+    SELECT shop_id,
+           CAST(julianday(start_date) - 2440587.5 AS INTEGER),
+           CAST(julianday(end_date) - 2440587.5 AS INTEGER),
+           rent_amount
+    FROM lease
+    WHERE status = 'Active' AND typeof(rent_amount) IN ('integer', 'real')
+    ''').fetchall()
+    leases = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    # Leases with unparseable dates or no numeric rent can't be projected
+    leases = leases[~np.isnan(leases).any(axis=1)]
+    return leases[:, 0].astype(np.int64), leases[:, 1].astype(np.int64), leases[:, 2].astype(np.int64), leases[:, 3]
+
+# Monthly rent roll for `months` months from first_month (a datetime64[M]).
+# starts and ends are the first and last day of each lease in days since
+# 1970-01-01; rent is prorated by day in a lease's first and last month.
+def compute_rent_roll(shop_ids, starts, ends, rents, first_month, months, total_shops):
+    month_starts = (first_month + np.arange(months + 1)).astype('datetime64[D]').astype(np.int64)
+    days_in_month = np.diff(month_starts)
+    # -1 before the window, months after it
+    start_month = np.searchsorted(month_starts, starts, side='right') - 1
+    end_month = np.searchsorted(month_starts, ends, side='right') - 1
+    
+    # take() with the indices is several times faster than boolean indexing
+    # when the mask is irregular
+    in_window = np.flatnonzero((end_month >= 0) & (start_month < months) & (ends >= starts))
+    shop_ids, starts, ends, rents = (values.take(in_window) for values in (shop_ids, starts, ends, rents))
+    start_month, end_month = start_month.take(in_window), end_month.take(in_window)
+    first = np.maximum(start_month, 0)
+    last = np.minimum(end_month, months - 1)
+    
+    # Add weights to every month from first to last
+    def spread(first, last, weights=None):
+        steps = np.bincount(first, weights, minlength=months + 1) - np.bincount(last + 1, weights, minlength=months + 1)
+        return np.cumsum(steps)[:months]
+    
+    def per_month(index, weights=None):
+        return np.bincount(index, weights, minlength=months)[:months]
+    
+    revenue = spread(first, last, rents)
+    # Days before the start and after the end in a lease's first and last month
+    starting = np.flatnonzero(start_month >= 0)
+    index = start_month.take(starting)
+    revenue -= per_month(index, rents.take(starting) * (starts.take(starting) - month_starts[index]) / days_in_month[index])
+    ending = np.flatnonzero(end_month < months)
+    ending_month = end_month.take(ending)
+    ending_rents = rents.take(ending)
+    revenue -= per_month(
+        ending_month, ending_rents * (month_starts[ending_month + 1] - 1 - ends.take(ending)) / days_in_month[ending_month]
+    )
+    
+    # A shop with overlapping leases is occupied once: sort each shop's leases
+    # by first month and only count the months not covered by an earlier one.
+    # Packing shop, first and last month into the bits of one integer sorts
+    # them with a single np.sort, several times faster than lexsort/argsort.
+    bits = months.bit_length()
+    mask = (1 << bits) - 1
+    packed = np.sort((shop_ids << 2 * bits) | (first << bits) | last)
+    last_sorted = packed & mask
+    first_sorted = (packed >> bits) & mask
+    shop_sorted = packed >> 2 * bits
+    new_shop = np.ones(len(packed), dtype=bool)
+    new_shop[1:] = shop_sorted[1:] != shop_sorted[:-1]
+    # Offsetting each shop's months keeps the running maximum within the shop
+    offset = (np.cumsum(new_shop) - 1) * (months + 1)
+    covered = np.maximum.accumulate(last_sorted + offset) - offset
+    covered_before = np.empty_like(covered)
+    covered_before[1:] = covered[:-1]
+    covered_before[new_shop] = -1
+    uncovered = np.maximum(first_sorted, covered_before + 1)
+    counted = np.flatnonzero(uncovered <= last_sorted)
+    occupied = spread(uncovered.take(counted), last_sorted.take(counted))
+    
+    return {
+        'month': (first_month + np.arange(months)).astype(str).tolist(),
+        'expected_revenue': revenue,
+        'active_leases': spread(first, last),
+        'expiring_leases': per_month(ending_month),
+        'revenue_at_risk': per_month(ending_month, ending_rents),
+        'occupied_shops': occupied,
+        'occupancy_percent': occupied / total_shops * 100 if total_shops else np.zeros(months),
+    }
+
+def get_rent_roll(first_month, months):
+    def compute():
+        conn = get_db()
+        total_shops = conn.execute('SELECT total_shops FROM mall_counters WHERE id = 1').fetchone()[0]
+        shop_ids, starts, ends, rents = load_rent_roll_leases(conn)
+        roll = compute_rent_roll(shop_ids, starts, ends, rents, first_month, months, total_shops)
+        
+        columns = {
+            name: values if name == 'month' else np.round(values, 2).tolist()
+            for name, values in roll.items()
+        }
+        return {
+            'from': str(first_month),
+            'months': [dict(zip(columns, values)) for values in zip(*columns.values())],
+            'totals': {
+                'leases': len(rents),
+                'total_shops': total_shops,
+                'expected_revenue': round(float(roll['expected_revenue'].sum()), 2),
+                'expiring_leases': int(roll['expiring_leases'].sum()),
+                'revenue_at_risk': round(float(roll['revenue_at_risk'].sum()), 2),
+            },
+        }
+    
+    return get_pool().cache.get_or_compute(
+        ('rent_roll', str(first_month), months, g.get('table_versions')), compute
+    )
+
+# Expected rent, expiring leases and occupancy per month from the active
+# leases, assuming nothing is renewed: ?from=YYYY-MM (default this month), ?months=
+@app.route('/api/analytics/rent-roll')
+@depends_on('shop', 'lease')
+def rent_roll():
+    if np is None:
+        return jsonify({'error': 'The rent roll needs NumPy, install it with pip install numpy'}), 501
+    try:
+        months = int(request.args.get('months', 24))
+    except ValueError:
+        raise QueryArgumentError('months must be a number')
+    if not 1 <= months <= app.config['RENT_ROLL_MAX_MONTHS']:
+        raise QueryArgumentError(f"months must be between 1 and {app.config['RENT_ROLL_MAX_MONTHS']}")
+    try:
+        first_month = np.datetime64(request.args.get('from') or date.today().strftime('%Y-%m'), 'M')
+    except ValueError:
+        raise QueryArgumentError('from must be a month like 2025-01')
+    
+    started = time.perf_counter()
+    result = dict(get_rent_roll(first_month, months))
+    result['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return jsonify(result)
+
+# Billing
+# Invoice every active lease that runs during the period, prorated by day
+# when it starts or ends part way through the month. One INSERT ... SELECT
+# per chunk of lease ids; ON CONFLICT skips leases already invoiced for the
+# period, so running a period again only adds the missing invoices.
+INVOICE_INSERT = f'''
+INSERT INTO invoice (run_id, lease_id, tenant_id, shop_id, period, days, amount, due_date)
+SELECT :run_id, id, tenant_id, shop_id, :period, days, ROUND(rent_amount * days / :month_days, 2), :due_date
+FROM (
+    SELECT id, tenant_id, shop_id, rent_amount,
+           MIN({lease_day('end_date')}, :end_day) - MAX({lease_day('start_date')}, :start_day) + 1 AS days
+    FROM lease
+    WHERE id > :after_id AND id <= :last_id AND status IS NOT 'Terminated'
+      AND start_date <= :period_end AND end_date >= :period_start
+)
+WHERE days > 0
+ON CONFLICT (lease_id, period) DO NOTHING
+'''
+
+# Billing runs bump the invoice version with every write to billing_run, so
+# it tags the run list as well as the invoices
+BILLING_VERSION_BUMP = '''
+UPDATE table_versions SET version = version + 1, modified_at = datetime('now')
+WHERE name = 'invoice'
+'''
+
+# A billing period is a month, YYYY-MM
+def parse_billing_period(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except (TypeError, ValueError):
+        raise QueryArgumentError('period must be a month like 2025-01')
+
+# Invoice the leases running during a period, whatever their status short
+# of Terminated, so a lease that expired mid-month is billed its last days.
+# Works chunk by chunk. Each chunk's
+# invoices and the run's progress are committed together, so after a crash
+# the next run for the period carries on from the last committed chunk.
+# Returns the billing_run row.
+def run_billing(first_day):
+    conn = get_db()
+    period = first_day.strftime('%Y-%m')
+    month_days = calendar.monthrange(first_day.year, first_day.month)[1]
+    last_day = first_day.replace(day=month_days)
+    params = {
+        'period': period,
+        'month_days': month_days,
+        # Day numbers as lease_day() computes them
+        'start_day': first_day.toordinal() + 1721425,
+        'end_day': last_day.toordinal() + 1721425,
+        'period_start': first_day.isoformat(),
+        'period_end': last_day.isoformat(),
+        'due_date': (first_day + timedelta(days=app.config['BILLING_DUE_DAYS'])).isoformat(),
+    }
+    chunk_size = app.config['BILLING_CHUNK_SIZE']
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # Resume a run of this period that stopped before finishing
+    run = conn.execute(
+        "SELECT id, last_lease_id FROM billing_run WHERE period = ? AND status = 'Running' ORDER BY id DESC LIMIT 1",
+        (period,)
+    ).fetchone()
+    if run:
+        run_id, last_id = run['id'], run['last_lease_id']
+        conn.execute('UPDATE billing_run SET resumed = resumed + 1 WHERE id = ?', (run_id,))
+    else:
+        cursor = conn.execute('INSERT INTO billing_run (period, started_at) VALUES (?, ?)', (period, now))
+        run_id, last_id = cursor.lastrowid, 0
+    conn.execute(BILLING_VERSION_BUMP)
+    conn.commit()
+    
+    conn.isolation_level = None
+    try:
+        while True:
+            started = time.monotonic()
+            conn.execute('BEGIN IMMEDIATE')
+            chunk_end = conn.execute(
+                'SELECT MAX(id) FROM (SELECT id FROM lease WHERE id > ? ORDER BY id LIMIT ?)',
+                (last_id, chunk_size)
+            ).fetchone()[0]
+            if chunk_end is None:
+                break
+            
+            created = conn.execute(INVOICE_INSERT, dict(params, run_id=run_id, after_id=last_id,
+                                                        last_id=chunk_end)).rowcount
+            conn.execute(BILLING_VERSION_BUMP)
+            conn.execute('''
+            UPDATE billing_run
+            SET last_lease_id = ?, chunks = chunks + 1, invoices_created = invoices_created + ?,
+                duration_ms = duration_ms + ?
+            WHERE id = ?
+            ''', (chunk_end, created, round((time.monotonic() - started) * 1000, 3), run_id))
+            conn.execute('COMMIT')
+            last_id = chunk_end
+        
+        # Still in the transaction the last chunk lookup opened
+        conn.execute('''
+        UPDATE billing_run
+        SET status = 'Completed', finished_at = ?,
+            invoices_total = (SELECT COUNT(*) FROM invoice WHERE period = ?),
+            duration_ms = duration_ms + ?
+        WHERE id = ?
+        ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), period,
+              round((time.monotonic() - started) * 1000, 3), run_id))
+        conn.execute(BILLING_VERSION_BUMP)
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.isolation_level = ''
+    
+    return conn.execute('SELECT * FROM billing_run WHERE id = ?', (run_id,)).fetchone()
+
+def billing_run_to_dict(run):
+    return {
+        'id': run['id'],
+        'period': run['period'],
+        'status': run['status'],
+        'started_at': run['started_at'],
+        'finished_at': run['finished_at'],
+        'last_lease_id': run['last_lease_id'],
+        'chunks': run['chunks'],
+        'invoices_created': run['invoices_created'],
+        'invoices_total': run['invoices_total'],
+        'resumed': run['resumed'],
+        'duration_ms': run['duration_ms'],
+    }
+
+def invoice_to_dict(invoice):
+    return {
+        'id': invoice['id'],
+        'run_id': invoice['run_id'],
+        'lease_id': invoice['lease_id'],
+        'tenant_id': invoice['tenant_id'],
+        'shop_id': invoice['shop_id'],
+        'period': invoice['period'],
+        'days': invoice['days'],
+        'amount': invoice['amount'],
+        'due_date': invoice['due_date'],
+        'created_at': invoice['created_at'],
+    }
+
+# Run billing for {"period": "YYYY-MM"} (default this month)
+@app.route('/api/billing/runs', methods=['POST'])
+def create_billing_run():
+    data = request.get_json(silent=True) or {}
+    period = data.get('period') or request.args.get('period') or date.today().strftime('%Y-%m')
+    first_day = parse_billing_period(period)
+    
+    try:
+        run = run_billing(first_day)
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    
+    return jsonify(billing_run_to_dict(run)), 201
+
+@app.route('/api/billing/runs', methods=['GET'])
+@depends_on('invoice')
+def get_billing_runs():
+    return list_endpoint('billing_runs', billing_run_to_dict)
+
+@app.route('/api/billing/runs/<int:run_id>', methods=['GET'])
+@depends_on('invoice')
+def get_billing_run(run_id):
+    run = get_db().execute('SELECT * FROM billing_run WHERE id = ?', (run_id,)).fetchone()
+    if not run:
+        return jsonify({'error': 'Billing run not found'}), 404
+    return jsonify(billing_run_to_dict(run))
+
+@app.route('/api/invoices', methods=['GET'])
+@depends_on('invoice')
+def get_invoices():
+    return list_endpoint('invoices', invoice_to_dict)
+
+# Dispatch
+# Dispatch order of pending tickets: priority (Critical, High, Medium, Low,
+# then any other value), tickets of occupied shops first, then the oldest report
+PRIORITY_RANKS = {'Critical': 0, 'High': 1, 'Medium': 2, 'Low': 3}
+
+def dispatch_key(row):
+    return (
+        PRIORITY_RANKS.get(row['priority'], len(PRIORITY_RANKS)),
+        0 if row['shop_status'] == 'Occupied' else 1,
+        # Tickets without a reported date go after the dated ones
+        row['reported_date'] or '~',
+    )
+
+# Like maintenance_details, tickets of shops that no longer exist are left out
+DISPATCH_TICKETS_SQL = '''
+SELECT m.id, m.status, m.priority, m.reported_date, s.status AS shop_status
+FROM maintenance m
+JOIN shop s ON s.id = m.shop_id
+'''
+
+# The pending tickets of one database as a binary heap of (key, id), so the
+# next ticket is popped in O(log n). A ticket whose key changes is pushed
+# again and `keys` holds its current key; heap entries that don't match it
+# are stale and skipped when they reach the top. The heap follows change_log,
+# so writes from other requests and processes are applied before each use.
+# It only proposes tickets: claims are checked against the database.
+class DispatchQueue:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heap = []
+        self.keys = {}
+        self.last_change_id = None
+        self.stats = {'rebuilds': 0, 'changes_applied': 0, 'stale_skipped': 0}
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Load every pending ticket. The change_log position is read first, so
+    # anything written while the tickets are read is applied again by sync().
+    def rebuild(self, conn):
+        last_change_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_log').fetchone()[0]
+        rows = conn.execute(DISPATCH_TICKETS_SQL + " WHERE m.status = 'Pending'").fetchall()
+        self.keys = {row['id']: dispatch_key(row) for row in rows}
+        self.heap = [(key, ticket_id) for ticket_id, key in self.keys.items()]
+        heapq.heapify(self.heap)
+        self.last_change_id = last_change_id
+        self.stats['rebuilds'] += 1
+
+    # Apply the maintenance and shop changes logged since the last sync,
+    # or rebuild if they have been pruned or there are too many of them
+    def sync(self, conn):
+        if self.last_change_id is None:
+            self.rebuild(conn)
+            return
+        # Separate subqueries, so each is one step down the primary key
+        oldest, newest = conn.execute(
+            'SELECT (SELECT MIN(id) FROM change_log), (SELECT MAX(id) FROM change_log)'
+        ).fetchone()
+        if newest is None or newest <= self.last_change_id:
+            return
+        if oldest > self.last_change_id + 1 or newest - self.last_change_id > app.config['DISPATCH_MAX_CATCH_UP']:
+            self.rebuild(conn)
+            return
+        
+        ticket_ids = set()
+        shop_ids = set()
+        for row in conn.execute('''
+        SELECT table_name, row_id FROM change_log
+        WHERE id > ? AND id <= ? AND table_name IN ('maintenance', 'shop')
+        ''', (self.last_change_id, newest)):
+            (ticket_ids if row['table_name'] == 'maintenance' else shop_ids).add(row['row_id'])
+        
+        # Re-read the changed tickets and the pending tickets of changed shops
+        for ids, where in ((list(ticket_ids), 'm.id'), (list(shop_ids), 'm.shop_id')):
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = conn.execute(
+                    DISPATCH_TICKETS_SQL + f" WHERE {where} IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                if where == 'm.id':
+                    # Deleted tickets are gone from the table
+                    for ticket_id in ticket_ids.difference(row['id'] for row in rows):
+                        self.keys.pop(ticket_id, None)
+                for row in rows:
+                    if row['status'] == 'Pending':
+                        self.push(row['id'], dispatch_key(row))
+                    else:
+                        self.keys.pop(row['id'], None)
+        
+        self.stats['changes_applied'] += len(ticket_ids) + len(shop_ids)
+        self.last_change_id = newest
+        # Don't let stale entries outgrow the live ones
+        if len(self.heap) > 2 * len(self.keys) + 1024:
+            self.heap = [(key, ticket_id) for ticket_id, key in self.keys.items()]
+            heapq.heapify(self.heap)
+
+    def push(self, ticket_id, key):
+        if self.keys.get(ticket_id) != key:
+            self.keys[ticket_id] = key
+            heapq.heappush(self.heap, (key, ticket_id))
+
+    def discard(self, ticket_id):
+        self.keys.pop(ticket_id, None)
+
+    # Remove and return the first ticket id, or None when the queue is empty
+    def pop(self):
+        while self.heap:
+            key, ticket_id = heapq.heappop(self.heap)
+            if self.keys.get(ticket_id) == key:
+                del self.keys[ticket_id]
+                return ticket_id
+            self.stats['stale_skipped'] += 1
+        return None
+
+    # The first `limit` ticket ids without removing them: walks the heap
+    # from the root with a second heap of candidates, O(limit log limit)
+    def peek(self, limit):
+        ids = []
+        candidates = [(self.heap[0], 0)] if self.heap else []
+        while candidates and len(ids) < limit:
+            (key, ticket_id), index = heapq.heappop(candidates)
+            if self.keys.get(ticket_id) == key:
+                ids.append(ticket_id)
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self.heap):
+                    heapq.heappush(candidates, (self.heap[child], child))
+        return ids
+
+# Dispatch queue of the current database, brought up to date
+def get_dispatch_queue(conn):
+    dispatch = get_pool().dispatch
+    with dispatch.lock:
+        dispatch.sync(conn)
+    return dispatch
+
+def technician_to_dict(technician):
+    return {
+        'id': technician['id'],
+        'name': technician['name'],
+        'contact': technician['contact'],
+        'created_at': technician['created_at'],
+        'active_claims': technician['active_claims'],
+    }
+
+@app.route('/api/technicians', methods=['GET'])
+def get_technicians():
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    SELECT t.*, COUNT(c.maintenance_id) AS active_claims
+    FROM technician t
+    LEFT JOIN maintenance_claim c ON c.technician_id = t.id AND c.expires_at > datetime('now')
+    GROUP BY t.id
+    ORDER BY t.id
+    ''')
+    
+    return jsonify([technician_to_dict(row) for row in cursor.fetchall()])
+
+@app.route('/api/technicians', methods=['POST'])
+def create_technician():
+    data = request.json
+    
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    if not data.get('name'):
+        return jsonify({'error': 'Name is required'}), 400
+    
+    conn = get_db()
+    cursor = conn.execute('INSERT INTO technician (name, contact) VALUES (?, ?)',
+                          (data['name'], data.get('contact')))
+    technician_id = cursor.lastrowid
+    conn.commit()
+    
+    return jsonify({'message': 'Technician created successfully', 'id': technician_id}), 201
+
+# The technician_id a claim request names, or an error response
+def claiming_technician(conn):
+    data = request.get_json(silent=True) or {}
+    try:
+        technician_id = int(data.get('technician_id'))
+    except (TypeError, ValueError):
+        return None, (jsonify({'error': 'technician_id is required'}), 400)
+    if not conn.execute('SELECT 1 FROM technician WHERE id = ?', (technician_id,)).fetchone():
+        return None, (jsonify({'error': 'Technician not found'}), 404)
+    return technician_id, None
+
+# Claim a pending ticket for a technician, or renew the technician's own claim
+def save_claim(conn, ticket_id, technician_id):
+    conn.execute('''
+    INSERT INTO maintenance_claim (maintenance_id, technician_id, claimed_at, expires_at)
+    VALUES (?, ?, datetime('now'), datetime('now', ?))
+    ON CONFLICT (maintenance_id) DO UPDATE SET expires_at = excluded.expires_at
+    ''', (ticket_id, technician_id, f"+{app.config['DISPATCH_CLAIM_TIMEOUT']} seconds"))
+
+def claim_response(conn, ticket_id):
+    ticket = conn.execute('SELECT * FROM maintenance_details WHERE id = ?', (ticket_id,)).fetchone()
+    claim = conn.execute('SELECT * FROM maintenance_claim WHERE maintenance_id = ?', (ticket_id,)).fetchone()
+    return jsonify({
+        'ticket': maintenance_details_to_dict(ticket),
+        'claim': {
+            'technician_id': claim['technician_id'],
+            'claimed_at': claim['claimed_at'],
+            'expires_at': claim['expires_at'],
+        },
+    })
+
+# Pending tickets in dispatch order, without claiming them
+@app.route('/api/maintenance/queue', methods=['GET'])
+def get_maintenance_queue():
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), app.config['LIST_MAX_LIMIT']))
+    except ValueError:
+        raise QueryArgumentError('limit must be a number')
+    
+    conn = get_db()
+    dispatch = get_dispatch_queue(conn)
+    with dispatch.lock:
+        ids = dispatch.peek(limit)
+        pending = len(dispatch)
+    
+    rows = {}
+    if ids:
+        cursor = conn.execute(
+            f"SELECT * FROM maintenance_details WHERE id IN ({', '.join('?' * len(ids))})", ids
+        )
+        rows = {row['id']: row for row in cursor}
+    return jsonify({
+        'pending': pending,
+        'items': [maintenance_details_to_dict(rows[ticket_id]) for ticket_id in ids if ticket_id in rows],
+    })
+
+# Claim the first ticket in dispatch order for {"technician_id": ...}.
+# Tickets the heap offers that the database says are no longer pending
+# (changed since the last sync) are dropped and the next one is tried.
+@app.route('/api/maintenance/next', methods=['POST'])
+def claim_next_maintenance():
+    conn = get_db()
+    technician_id, error = claiming_technician(conn)
+    if error:
+        return error
+    
+    # Requeue expired claims before syncing, so their tickets compete for this one
+    release_expired_claims(conn)
+    conn.commit()
+    dispatch = get_dispatch_queue(conn)
+    claimed = None
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        while claimed is None:
+            with dispatch.lock:
+                ticket_id = dispatch.pop()
+            if ticket_id is None:
+                break
+            cursor = conn.execute(
+                "UPDATE maintenance SET status = 'In Progress' WHERE id = ? AND status = 'Pending'", (ticket_id,)
+            )
+            if cursor.rowcount:
+                save_claim(conn, ticket_id, technician_id)
+                claimed = ticket_id
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        # Tickets popped in a rolled back transaction are still pending
+        with dispatch.lock:
+            dispatch.last_change_id = None
+        raise
+    finally:
+        conn.isolation_level = ''
+    
+    if claimed is None:
+        return jsonify({'ticket': None, 'claim': None})
+    return claim_response(conn, claimed)
+
+# Claim a particular ticket, or renew a claim the technician already holds
+@app.route('/api/maintenance/<int:maintenance_id>/claim', methods=['POST'])
+def claim_maintenance(maintenance_id):
+    conn = get_db()
+    technician_id, error = claiming_technician(conn)
+    if error:
+        return error
+    
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        release_expired_claims(conn)
+        ticket = conn.execute('''
+        SELECT m.status, c.technician_id
+        FROM maintenance m
+        JOIN shop s ON s.id = m.shop_id
+        LEFT JOIN maintenance_claim c ON c.maintenance_id = m.id
+        WHERE m.id = ?
+        ''', (maintenance_id,)).fetchone()
+        if not ticket:
+            conn.execute('ROLLBACK')
+            return jsonify({'error': 'Maintenance request not found'}), 404
+        if ticket['technician_id'] not in (None, technician_id):
+            conn.execute('ROLLBACK')
+            return jsonify({'error': f"Ticket is claimed by technician {ticket['technician_id']}"}), 409
+        if ticket['technician_id'] is None:
+            if ticket['status'] != 'Pending':
+                conn.execute('ROLLBACK')
+                return jsonify({'error': f"Ticket is {ticket['status']}, only pending tickets can be claimed"}), 409
+            conn.execute("UPDATE maintenance SET status = 'In Progress' WHERE id = ?", (maintenance_id,))
+        save_claim(conn, maintenance_id, technician_id)
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
     finally:
-        conn.close()
+        conn.isolation_level = ''
+    
+    dispatch = get_pool().dispatch
+    with dispatch.lock:
+        dispatch.discard(maintenance_id)
+    return claim_response(conn, maintenance_id)
+
+# Give a claimed ticket back to the queue
+@app.route('/api/maintenance/<int:maintenance_id>/release', methods=['POST'])
+def release_maintenance(maintenance_id):
+    conn = get_db()
+    technician_id, error = claiming_technician(conn)
+    if error:
+        return error
+    
+    claim = conn.execute('SELECT technician_id FROM maintenance_claim WHERE maintenance_id = ?',
+                         (maintenance_id,)).fetchone()
+    if not claim:
+        return jsonify({'error': 'Ticket is not claimed'}), 404
+    if claim['technician_id'] != technician_id:
+        return jsonify({'error': f"Ticket is claimed by technician {claim['technician_id']}"}), 409
+    
+    # The maintenance_claim_status trigger drops the claim
+    conn.execute("UPDATE maintenance SET status = 'Pending' WHERE id = ?", (maintenance_id,))
+    conn.commit()
+    
+    return jsonify({'message': 'Ticket released', 'id': maintenance_id})
+
+# Portfolio
+# Cross-mall reports: each mall's database is queried on the portfolio
+# threads (sqlite3 releases the GIL while a query runs) and the results merged
+_portfolio_executors = {}
+_portfolio_lock = threading.Lock()
+
+def portfolio_executor():
+    workers = app.config['PORTFOLIO_WORKERS']
+    with _portfolio_lock:
+        executor = _portfolio_executors.get(workers)
+        if executor is None:
+            executor = ThreadPoolExecutor(workers, thread_name_prefix='portfolio')
+            _portfolio_executors[workers] = executor
+        return executor
+
+# Run query(conn) against every mall's database. Returns ({mall_id: result},
+# {mall_id: error}), so one unavailable mall doesn't fail the whole report.
+def query_malls(query):
+    def run(database):
+        pool = get_pool(database)
+        conn = pool.acquire()
+        try:
+            return query(conn)
+        finally:
+            pool.release(conn)
+    
+    executor = portfolio_executor()
+    futures = {mall_id: executor.submit(run, database) for mall_id, database in mall_databases().items()}
+    results = {}
+    errors = {}
+    for mall_id, future in futures.items():
+        try:
+            results[mall_id] = future.result()
+        except (sqlite3.Error, PoolTimeoutError) as e:
+            errors[mall_id] = str(e)
+    return results, errors
+
+def mall_dashboard(conn):
+    row = conn.execute('''
+    SELECT c.total_shops, c.occupied_shops, c.total_tenants, c.tenants_with_leases, c.pending_maintenance,
+           l.active_leases, l.monthly_rent
+    FROM mall_counters c,
+         (SELECT COUNT(*) AS active_leases, COALESCE(SUM(rent_amount), 0) AS monthly_rent
+          FROM lease WHERE status = 'Active') l
+    WHERE c.id = 1
+    ''').fetchone()
+    return dict(row)
+
+def mall_occupancy(conn):
+    return [dict(row) for row in conn.execute('''
+    SELECT location,
+           COUNT(*) AS shops,
+           SUM(status = 'Occupied') AS occupied,
+           COALESCE(SUM(size), 0) AS area,
+           COALESCE(SUM(CASE WHEN status = 'Occupied' THEN size END), 0) AS occupied_area
+    FROM shop
+    GROUP BY location
+    ''')]
+
+def occupancy_rate(occupied, total):
+    return round(occupied / total * 100, 1) if total else 0
+
+@app.route('/api/malls')
+def list_malls():
+    return jsonify({'sharded': bool(app.config['MALLS_DIR']), 'malls': list(mall_databases())})
+
+# Counters and rent roll of every mall, with portfolio totals
+@app.route('/api/portfolio/dashboard')
+def portfolio_dashboard():
+    started = time.perf_counter()
+    malls, errors = query_malls(mall_dashboard)
+    
+    totals = dict.fromkeys(
+        ['total_shops', 'occupied_shops', 'total_tenants', 'tenants_with_leases', 'pending_maintenance',
+         'active_leases', 'monthly_rent'], 0
+    )
+    for summary in malls.values():
+        for key in totals:
+            totals[key] += summary[key]
+        summary['occupancy_percent'] = occupancy_rate(summary['occupied_shops'], summary['total_shops'])
+    totals['monthly_rent'] = round(totals['monthly_rent'], 2)
+    totals['occupancy_percent'] = occupancy_rate(totals['occupied_shops'], totals['total_shops'])
+    
+    return jsonify({
+        'malls': len(malls),
+        'totals': totals,
+        'by_mall': malls,
+        'errors': errors,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+    })
+
+# Occupied shops and floor area per mall, least occupied first, and per
+# location across the portfolio
+@app.route('/api/portfolio/occupancy')
+def portfolio_occupancy():
+    started = time.perf_counter()
+    results, errors = query_malls(mall_occupancy)
+    
+    malls = []
+    locations = {}
+    for mall_id, rows in results.items():
+        mall = {'mall': mall_id, 'shops': 0, 'occupied': 0, 'area': 0, 'occupied_area': 0}
+        for row in rows:
+            location = locations.setdefault(
+                row['location'], {'location': row['location'], 'shops': 0, 'occupied': 0, 'area': 0, 'occupied_area': 0}
+            )
+            for key in ('shops', 'occupied', 'area', 'occupied_area'):
+                mall[key] += row[key]
+                location[key] += row[key]
+        malls.append(mall)
+    
+    for entry in malls + list(locations.values()):
+        entry['occupancy_percent'] = occupancy_rate(entry['occupied'], entry['shops'])
+        entry['area_occupancy_percent'] = occupancy_rate(entry['occupied_area'], entry['area'])
+    malls.sort(key=lambda mall: (mall['occupancy_percent'], mall['mall']))
+    
+    shops = sum(mall['shops'] for mall in malls)
+    occupied = sum(mall['occupied'] for mall in malls)
+    return jsonify({
+        'totals': {'malls': len(malls), 'shops': shops, 'occupied': occupied,
+                   'occupancy_percent': occupancy_rate(occupied, shops)},
+        'malls': malls,
+        'by_location': sorted(locations.values(), key=lambda location: str(location['location'])),
+        'errors': errors,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+    })
+
+# Export
+# Tables that can be exported with /api/export/<table> and their columns, listed
+# so that internal columns like row_version are left out
+EXPORT_TABLES = {table: CHANGE_LOG_COLUMNS[table] for table in ['shop', 'tenant', 'lease', 'maintenance']}
+
+# Each mall's snapshots go in a directory of their own
+def snapshot_dir():
+    path = app.config['SNAPSHOT_DIR']
+    if 'mall_id' in g:
+        path = os.path.join(path, g.mall_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# Copy the live database to a new file with SQLite's online backup API.
+# The copy is written under a temporary name and renamed once complete.
+def create_snapshot():
+    started = time.monotonic()
+    name = f"emall-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.db"
+    path = os.path.join(snapshot_dir(), name)
+    partial_path = path + '.partial'
+    
+    progress = {'steps': 0, 'pages': 0}
+    def on_progress(status, remaining, total):
+        progress['steps'] += 1
+        progress['pages'] = total
+    
+    # Use a connection of its own so the backup never shares a transaction with a request
+    source = sqlite3.connect(current_database())
+    target = sqlite3.connect(partial_path)
+    try:
+        with target:
+            source.backup(
+                target,
+                pages=app.config['SNAPSHOT_PAGES_PER_STEP'],
+                progress=on_progress,
+                sleep=app.config['SNAPSHOT_STEP_SLEEP'],
+            )
+    finally:
+        target.close()
+        source.close()
+    os.replace(partial_path, path)
+    
+    return {
+        'name': name,
+        'size_bytes': os.path.getsize(path),
+        'pages': progress['pages'],
+        'steps': progress['steps'],
+        'duration_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+
+# Stream a table as CSV, or as NDJSON "row groups" of columns (one line per
+# fetchmany() batch, e.g. {"id": [1, 2], "name": ["A", "B"]}) for columnar tools
+def generate_table_export(table, data_format):
+    cursor = get_db().cursor()
+    columns = EXPORT_TABLES[table]
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    
+    if data_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            row_group = {column: [row[index] for row in rows] for index, column in enumerate(columns)}
+            yield json.dumps(row_group, separators=(',', ':')) + '\n'
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'columnar': 'application/x-ndjson',
+}
+
+@app.route('/api/export/snapshot', methods=['POST'])
+@read_only
+def create_snapshot_endpoint():
+    return jsonify(create_snapshot()), 201
+
+@app.route('/api/export/snapshots', methods=['GET'])
+def list_snapshots():
+    path = snapshot_dir()
+    snapshots = []
+    for name in sorted(os.listdir(path), reverse=True):
+        if name.endswith('.db'):
+            snapshots.append({
+                'name': name,
+                'size_bytes': os.path.getsize(os.path.join(path, name))
+            })
+    return jsonify(snapshots)
+
+@app.route('/api/export/snapshots/<name>', methods=['GET'])
+def download_snapshot(name):
+    return send_from_directory(os.path.abspath(snapshot_dir()), name, as_attachment=True)
+
+@app.route('/api/export/<table>', methods=['GET'])
+@depends_on('shop', 'tenant', 'lease', 'maintenance')
+def export_table(table):
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f"Unknown table '{table}', use one of: {', '.join(EXPORT_TABLES)}"}), 404
+    
+    data_format = request.args.get('format', 'csv')
+    if data_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    extension = 'csv' if data_format == 'csv' else 'ndjson'
+    return Response(
+        stream_with_context(generate_table_export(table, data_format)),
+        mimetype=EXPORT_FORMATS[data_format],
+        headers={'Content-Disposition': f'attachment; filename={table}.{extension}'}
+    )
+
+# Gauges and pool/writer/cache counters read at scrape time
+def collect_metric_gauges():
+    gauges = {name: [] for name, (metric_type, help_text) in METRIC_DEFINITIONS.items()}
+    for pool in list(_pools.values()):
+        stats = pool.snapshot()
+        writer = stats['writer']
+        cache = stats['cache']
+        database = {'database': pool.database}
+        for suffix, name in [('', 'emall_db_size_bytes'), ('-wal', 'emall_db_wal_size_bytes')]:
+            try:
+                size = os.path.getsize(pool.database + suffix)
+            except OSError:
+                size = 0
+            gauges[name].append((database, size))
+        gauges['emall_pool_connections'] += [
+            (dict(database, state='in_use'), stats['in_use_connections']),
+            (dict(database, state='idle'), stats['idle_connections']),
+        ]
+        gauges['emall_pool_checkouts_total'] += [
+            (dict(database, result=result), stats[key])
+            for result, key in [('hit', 'hits'), ('miss', 'misses'), ('wait', 'waits')]
+        ]
+        gauges['emall_pool_wait_seconds_total'].append((database, stats['wait_time']))
+        gauges['emall_pool_timeouts_total'].append((database, stats['timeouts']))
+        gauges['emall_writer_acquisitions_total'].append((database, writer['writes']))
+        gauges['emall_writer_waits_total'].append((database, writer['waits']))
+        gauges['emall_writer_wait_seconds_total'].append((database, writer['wait_time']))
+        gauges['emall_writer_queue_depth'].append((database, writer['queue_depth']))
+        gauges['emall_writer_lock_wait_seconds_total'].append((database, writer['lock_wait_time']))
+        gauges['emall_cache_lookups_total'] += [
+            (dict(database, result='hit'), cache['hits']),
+            (dict(database, result='miss'), cache['misses']),
+        ]
+        gauges['emall_cache_invalidations_total'].append((database, cache['invalidations']))
+        gauges['emall_cache_entries'].append((database, cache['entries']))
+    return {name: values for name, values in gauges.items() if values}
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(collect_metric_gauges()), mimetype='text/plain; version=0.0.4')
+
+# Set by the serve command's workers while they finish their last requests
+draining = threading.Event()
+
+# Liveness: the process is up and answering requests
+@app.route('/healthz')
+def liveness():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+# Readiness: the database answers, its schema is up to date and this
+# process isn't shutting down
+@app.route('/readyz')
+def readiness():
+    problems = []
+    if draining.is_set():
+        problems.append('draining')
+    try:
+        version = get_db().execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+        if version != MIGRATIONS[-1][0]:
+            problems.append(f'schema at version {version}, expected {MIGRATIONS[-1][0]}')
+    except (sqlite3.Error, PoolTimeoutError) as e:
+        problems.append(f'database unavailable: {e}')
+    
+    body = {'status': 'unavailable' if problems else 'ready', 'pid': os.getpid(), 'problems': problems}
+    return jsonify(body), 503 if problems else 200
+
+@app.route('/api/_debug/pool')
+def pool_stats():
+    return jsonify([pool.snapshot() for pool in list(_pools.values())])
+
+@app.route('/api/_debug/profile')
+def profile_stats():
+    route = request.args.get('route')
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        raise QueryArgumentError('limit must be a number')
+    
+    with _profiles_lock:
+        recent = [entry for entry in profile_history if not route or entry['route'] == route]
+        totals = dict(route_profiles)
+    
+    routes = []
+    for name, stats in totals.items():
+        requests = stats['requests']
+        routes.append({
+            'route': name,
+            'requests': requests,
+            'avg_duration_ms': round(stats['duration'] / requests * 1000, 3),
+            'avg_db_time_ms': round(stats['db_time'] / requests * 1000, 3),
+            'max_db_time_ms': round(stats['max_db_time'] * 1000, 3),
+            'total_db_time_ms': round(stats['db_time'] * 1000, 3),
+            'avg_statements': round(stats['statements'] / requests, 2),
+            'max_statements': stats['max_statements'],
+        })
+    # Routes that spend the most time in the database first
+    routes.sort(key=lambda stats: stats['total_db_time_ms'], reverse=True)
+    
+    return jsonify({
+        'slow_query_ms': app.config['SLOW_QUERY_MS'],
+        'routes': routes,
+        'recent': recent[::-1][:max(limit, 0)],
+    })
+
+@app.route('/api/_debug/jobs')
+def job_stats():
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT * FROM job_status')
+    last_runs = {row['name']: row for row in cursor.fetchall()}
+    
+    jobs = []
+    for job in background_jobs:
+        last_run = last_runs.get(job.name)
+        jobs.append({
+            'name': job.name,
+            'interval': job.interval,
+            'running': job.running,
+            'last_run_at': last_run['last_run_at'] if last_run else None,
+            'rows_affected': last_run['rows_affected'] if last_run else None,
+            'duration_ms': last_run['duration_ms'] if last_run else None
+        })
+    
+    return jsonify(jobs)
+
+# Create or migrate DATABASE and every mall's database; returns
+# [(database, applied migrations)]
+def init_all_databases():
+    results = []
+    for database in all_databases():
+        with app.app_context():
+            g.database = database
+            results.append((database, init_db()))
+    return results
+
+@app.cli.command('init-db')
+def init_db_command():
+    for database, applied in init_all_databases():
+        for version, name in applied:
+            click.echo(f'Applied migration {version} to {database}: {name}')
+    click.echo('Database initialized')
+
+@app.cli.command('create-mall')
+@click.argument('mall_id')
+def create_mall_command(mall_id):
+    malls_dir = app.config['MALLS_DIR']
+    if not malls_dir:
+        raise click.UsageError('Set FLASK_MALLS_DIR to the directory mall databases are kept in.')
+    if not MALL_ID_PATTERN.match(mall_id):
+        raise click.BadParameter('use letters, digits, - and _ only', param_hint='MALL_ID')
+    database = os.path.join(malls_dir, f'{mall_id}.db')
+    if os.path.exists(database):
+        raise click.UsageError(f'Mall {mall_id} already exists at {database}')
+    
+    os.makedirs(malls_dir, exist_ok=True)
+    with app.app_context():
+        g.database = database
+        init_db()
+    click.echo(f'Created mall {mall_id} at {database}')
+
+@app.cli.command('expire-leases')
+def expire_leases_command():
+    with get_pool().writer:
+        success, message = expire_leases()
+    click.echo(message)
+
+@app.cli.command('check-counters')
+@click.option('--rebuild', is_flag=True, help='Recompute the counter tables if they are out of date.')
+def check_counters_command(rebuild):
+    conn = get_db()
+    problems = check_counters(conn)
+    for problem in problems:
+        click.echo(f'Counter mismatch in {problem}')
+    if problems and rebuild:
+        with get_pool().writer:
+            rebuild_counters(conn)
+        click.echo('Counter tables rebuilt')
+    elif problems:
+        raise SystemExit(1)
+    else:
+        click.echo('All counters are consistent')
+
+@app.cli.command('bulk-import')
+@click.argument('entity', type=click.Choice(list(BULK_ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'data_format', type=click.Choice(['csv', 'ndjson']),
+              help='Defaults to the file extension.')
+def bulk_import_command(entity, path, data_format):
+    data_format = data_format or ('csv' if path.endswith('.csv') else 'ndjson')
+    try:
+        with open(path, 'rb') as stream, get_pool().writer:
+            result = bulk_import(entity, read_bulk_records(stream, data_format))
+    except UnicodeDecodeError:
+        raise click.ClickException(f'{path} is not UTF-8 encoded')
+    for error in result['errors']:
+        click.echo(f"Row {error['row']}: {error['error']}")
+    click.echo(f"Imported {result['inserted']} {entity}, {result['failed']} failed "
+               f"({result['rows_per_second']} rows/s)")
+    if result['failed']:
+        raise SystemExit(1)
+
+@app.cli.command('billing-run')
+@click.option('--period', help='Month to invoice, YYYY-MM. Defaults to this month.')
+def billing_run_command(period):
+    try:
+        first_day = parse_billing_period(period or date.today().strftime('%Y-%m'))
+    except QueryArgumentError as e:
+        raise click.BadParameter(str(e), param_hint='--period')
+    with get_pool().writer:
+        run = run_billing(first_day)
+    click.echo(f"Billing run {run['id']} for {run['period']}: {run['invoices_created']} invoices created, "
+               f"{run['invoices_total']} in the period ({run['chunks']} chunks, {run['duration_ms']} ms)")
+
+@app.cli.command('snapshot')
+def snapshot_command():
+    snapshot = create_snapshot()
+    click.echo(f"Created {os.path.join(app.config['SNAPSHOT_DIR'], snapshot['name'])} "
+               f"({snapshot['size_bytes']} bytes in {snapshot['duration_ms']} ms)")
+
+@app.cli.command('export-table')
+@click.argument('table', type=click.Choice(list(EXPORT_TABLES)))
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--format', 'data_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv')
+def export_table_command(table, output, data_format):
+    for chunk in generate_table_export(table, data_format):
+        output.write(chunk)
+
+@app.cli.command('check-plans')
+def check_plans_command():
+    problems = check_query_plans(get_db())
+    for problem in problems:
+        click.echo(f'Full table scan in {problem}')
+    if problems:
+        raise SystemExit(1)
+    click.echo(f'All {len(HOT_QUERIES)} hot queries use indexes')
+
+@app.cli.command('serve')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8000, show_default=True)
+@click.option('--workers', default=os.cpu_count() or 2, show_default='CPU count', help='Worker processes.')
+@click.option('--max-requests', default=0, help='Replace a worker after it has served this many requests (0: never).')
+@click.option('--max-requests-jitter', default=0, help='Random extra requests per worker, so they restart at different times.')
+@click.option('--graceful-timeout', default=30.0, show_default=True,
+              help='Seconds a stopping worker gets to finish its requests.')
+def serve_command(host, port, workers, max_requests, max_requests_jitter, graceful_timeout):
+    import logging
+    from server import Master
+    
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s in %(name)s: %(message)s')
+    # Migrations run here once, not in every worker
+    for database, applied in init_all_databases():
+        for version, name in applied:
+            click.echo(f'Applied migration {version} to {database}: {name}')
+    close_pools()
+    
+    malls_dir = app.config['MALLS_DIR']
+    Master(
+        os.path.abspath(app.config['DATABASE']), host, port, workers, max_requests, max_requests_jitter,
+        graceful_timeout, app.config['WRITER_LOCK_FILE'] or None, os.path.abspath(malls_dir) if malls_dir else None
+    ).run()
 
 if __name__ == '__main__':
-    # Initialize database
-    init_db()
+    # Initialize the databases
+    init_all_databases()
+    # The debug reloader imports this file twice, only start jobs in the serving process
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs()
     app.run(debug=True)
 
@@ -0,0 +1,186 @@
+# ASGI entry point for running the API under an asyncio server:
+#
+#   pip install uvicorn
+#   uvicorn asgi:application --host 0.0.0.0 --port 8000
+#
+# The Flask app and sqlite3 stay synchronous. Each request runs start to
+# finish on a worker thread from a bounded pool, and response chunks are
+# handed back to the event loop, so a slow write or a long /api/events
+# stream only ties up its own thread while the loop keeps accepting
+# requests. Reads, writes and event streams each get their own pool
+# (ASGI_READ_THREADS, ASGI_WRITE_THREADS, ASGI_STREAM_THREADS).
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, init_all_databases, start_background_jobs, stop_background_jobs
+
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+# Response chunks buffered per request before the worker thread waits for
+# the client to catch up
+SEND_BUFFER = 16
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class ThreadedWSGIAdapter:
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.executors = {
+            'read': ThreadPoolExecutor(config['ASGI_READ_THREADS'], thread_name_prefix='asgi-read'),
+            'write': ThreadPoolExecutor(config['ASGI_WRITE_THREADS'], thread_name_prefix='asgi-write'),
+            'stream': ThreadPoolExecutor(config['ASGI_STREAM_THREADS'], thread_name_prefix='asgi-stream'),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    init_all_databases()
+                    start_background_jobs()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                stop_background_jobs()
+                for executor in self.executors.values():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_http(self, scope, receive, send):
+        body = io.BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+
+        environ = build_environ(scope, body)
+        if 'text/event-stream' in environ.get('HTTP_ACCEPT', ''):
+            pool = 'stream'
+        elif scope['method'] in READ_METHODS:
+            pool = 'read'
+        else:
+            pool = 'write'
+
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue(SEND_BUFFER)
+        disconnected = threading.Event()
+        worker = loop.run_in_executor(
+            self.executors[pool], self.run_wsgi, environ, loop, messages, disconnected
+        )
+        watcher = asyncio.ensure_future(watch_disconnect(receive, disconnected))
+        try:
+            while True:
+                message = await messages.get()
+                if message is None:
+                    break
+                await send(message)
+        except OSError:
+            disconnected.set()
+        finally:
+            watcher.cancel()
+            disconnected.set()
+            await worker
+
+    # Runs on a worker thread: call the Flask app and pass the status line and
+    # each body chunk to the event loop as ASGI messages
+    def run_wsgi(self, environ, loop, messages, disconnected):
+        def put(message):
+            future = asyncio.run_coroutine_threadsafe(messages.put(message), loop)
+            while True:
+                if disconnected.is_set():
+                    future.cancel()
+                    raise ClientDisconnected()
+                try:
+                    return future.result(timeout=0.5)
+                except TimeoutError:
+                    continue
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+
+        chunks = None
+        try:
+            chunks = self.wsgi_app(environ, start_response)
+            put({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            for chunk in chunks:
+                if chunk:
+                    put({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            put({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except ClientDisconnected:
+            pass
+        finally:
+            # Closing the iterable runs the cleanup of streamed responses,
+            # e.g. an /api/events generator handing back its connection
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            # Always wake the event loop, even if the app raised
+            try:
+                put(None)
+            except ClientDisconnected:
+                pass
+
+
+async def watch_disconnect(receive, disconnected):
+    while not disconnected.is_set():
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+
+
+def build_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        # WSGI carries the raw path bytes as a latin-1 string
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+application = ThreadedWSGIAdapter(app, app.config)
@@ -0,0 +1,2 @@
+# Benchmarks for the E-Mall backend.
+# Run them from the backend directory, e.g. `python -m benchmarks.wal_readers`
@@ -0,0 +1,163 @@
+# Concurrent read throughput of the threaded WSGI server (what app.run()
+# starts) vs asgi.py under uvicorn, while another client keeps the writer
+# busy with slow bulk imports. Each server runs in its own process on a
+# generated mall.
+#
+#   pip install uvicorn
+#   python -m benchmarks.asgi_server --clients 32 --duration 15
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.datagen import generate_mall
+from benchmarks.loadtest import QuietRequestHandler, summarize
+
+READ_PATHS = [
+    '/api/dashboard/summary',
+    '/api/shops?limit=50',
+    '/api/maintenance?limit=50&status=Pending',
+    '/api/leases?limit=50&status=Active&sort=end_date',
+    '/api/search?q=leak',
+]
+
+
+def serve(mode, port):
+    from app import app, init_db
+
+    with app.app_context():
+        init_db()
+    if mode == 'asgi':
+        import uvicorn
+        uvicorn.run('asgi:application', host='127.0.0.1', port=port, log_level='warning')
+    else:
+        from werkzeug.serving import make_server
+        make_server('127.0.0.1', port, app, threaded=True, request_handler=QuietRequestHandler).serve_forever()
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/dashboard/summary')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def run(mode, database, port, clients, duration, write_rows, seed):
+    env = dict(os.environ, FLASK_DATABASE=database, FLASK_LEASE_EXPIRY_INTERVAL='0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.asgi_server', '--serve', mode, '--port', str(port)],
+        env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    try:
+        wait_until_up(port)
+        stop = threading.Event()
+        lock = threading.Lock()
+        latencies = []
+        errors = [0]
+        write_latencies = []
+
+        def reader(reader_id):
+            rng = random.Random(seed + reader_id)
+            local = []
+            failed = 0
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', rng.choice(READ_PATHS))
+                    response = conn.getresponse()
+                    response.read()
+                    failed += response.status >= 400
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                local.append(time.perf_counter() - started)
+            conn.close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        # Bulk imports hold the writer slot for a while each
+        def writer():
+            rows = ''.join(
+                json.dumps({'shop_id': 1 + i % 50, 'description': f'Bulk load ticket {i}', 'priority': 'Low'}) + '\n'
+                for i in range(write_rows)
+            )
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            while not stop.is_set():
+                started = time.perf_counter()
+                conn.request('POST', '/api/bulk/maintenance', body=rows,
+                             headers={'Content-Type': 'application/x-ndjson'})
+                conn.getresponse().read()
+                write_latencies.append(time.perf_counter() - started)
+            conn.close()
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(clients)]
+        threads.append(threading.Thread(target=writer))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        result = summarize(latencies, errors[0], elapsed)
+        result['writes'] = summarize(write_latencies, 0, elapsed)
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Threaded WSGI server vs asgi.py under uvicorn')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent reading clients')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--write-rows', type=int, default=5000, help='Tickets per bulk import request')
+    parser.add_argument('--shops', type=int, default=2000)
+    parser.add_argument('--maintenance', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=8790)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    modes = ['wsgi']
+    try:
+        import uvicorn  # noqa: F401
+        modes.append('asgi')
+    except ImportError:
+        print('uvicorn is not installed, only measuring the WSGI server', file=sys.stderr)
+
+    results = {}
+    for index, mode in enumerate(modes):
+        # A fresh copy of the same mall for each server
+        database = os.path.join(tempfile.mkdtemp(), 'bench_asgi.db')
+        generate_mall(database, args.shops, args.maintenance, seed=args.seed)
+        results[mode] = run(mode, database, args.port + index, args.clients, args.duration,
+                            args.write_rows, args.seed)
+
+    print(json.dumps({'clients': args.clients, 'duration_s': args.duration, 'servers': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
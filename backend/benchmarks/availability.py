@@ -0,0 +1,107 @@
+# Lease overlap checks and shop availability through the lease_interval
+# R*Tree vs the same questions answered from the lease table's B-tree
+# indexes, for date windows of different lengths. Leases ending before they
+# start aren't in the R*Tree, so the B-tree queries skip them too.
+#
+#   python -m benchmarks.availability --shops 100000
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from app import app, lease_day
+from benchmarks.datagen import generate_mall
+
+WINDOWS = [('1 day', 0), ('1 month', 30), ('1 year', 365), ('5 years', 5 * 365)]
+
+RTREE_OVERLAP = f'''
+SELECT id FROM lease_interval
+WHERE shop_from <= ? AND shop_to >= ? AND start_day <= {lease_day('?')} AND end_day >= {lease_day('?')}
+LIMIT 1
+'''
+BTREE_OVERLAP = '''
+SELECT id FROM lease
+WHERE shop_id = ? AND status = 'Active' AND start_date <= ? AND end_date >= ? AND end_date >= start_date
+LIMIT 1
+'''
+RTREE_AVAILABLE = f'''
+SELECT COUNT(*) FROM shop
+WHERE id NOT IN (
+    SELECT shop_from FROM lease_interval WHERE start_day <= {lease_day('?')} AND end_day >= {lease_day('?')}
+)
+'''
+BTREE_AVAILABLE = '''
+SELECT COUNT(*) FROM shop
+WHERE id NOT IN (
+    SELECT shop_id FROM lease
+    WHERE status = 'Active' AND start_date <= ? AND end_date >= ? AND end_date >= start_date
+)
+'''
+
+
+def timed(conn, sql, params_list):
+    started = time.perf_counter()
+    results = [conn.execute(sql, params).fetchall() for params in params_list]
+    return round((time.perf_counter() - started) / len(params_list) * 1000, 4), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='R*Tree vs B-tree lease overlap and availability queries')
+    parser.add_argument('--shops', type=int, default=100000)
+    parser.add_argument('--checks', type=int, default=2000, help='Overlap checks per window')
+    parser.add_argument('--repeat', type=int, default=5, help='Availability queries per window')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench_availability.db')
+    mall = generate_mall(database, args.shops, 0, lease_history=3, seed=args.seed)
+    conn = sqlite3.connect(database)
+    rng = random.Random(args.seed)
+
+    results = {}
+    for label, days in WINDOWS:
+        starts = [f'{rng.randint(2024, 2027)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+                  for _ in range(args.checks)]
+        ends = [conn.execute('SELECT date(?, ?)', (start, f'+{days} days')).fetchone()[0] for start in starts]
+        shops = [rng.randint(1, args.shops) for _ in range(args.checks)]
+
+        rtree_ms, rtree_rows = timed(conn, RTREE_OVERLAP, [
+            (shop, shop, end, start) for shop, start, end in zip(shops, starts, ends)
+        ])
+        btree_ms, btree_rows = timed(conn, BTREE_OVERLAP, [
+            (shop, end, start) for shop, start, end in zip(shops, starts, ends)
+        ])
+        windows = list(zip(starts, ends))[:args.repeat]
+        rtree_available_ms, rtree_available = timed(conn, RTREE_AVAILABLE, [(end, start) for start, end in windows])
+        btree_available_ms, btree_available = timed(conn, BTREE_AVAILABLE, [(end, start) for start, end in windows])
+        results[label] = {
+            'overlap_check_rtree_ms': rtree_ms,
+            'overlap_check_btree_ms': btree_ms,
+            'overlaps_agree': [bool(rows) for rows in rtree_rows] == [bool(rows) for rows in btree_rows],
+            'availability_rtree_ms': rtree_available_ms,
+            'availability_btree_ms': btree_available_ms,
+            'availability_agrees': rtree_available == btree_available,
+            'available_shops': rtree_available[0][0][0],
+        }
+
+    app.config['DATABASE'] = database
+    client = app.test_client()
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        client.get('/api/shops/availability?from=2025-06-01&to=2025-08-31&limit=50').get_data()
+    endpoint_ms = round((time.perf_counter() - started) / args.repeat * 1000, 3)
+
+    conn.close()
+    print(json.dumps({
+        'shops': args.shops,
+        'leases': mall['leases'],
+        'windows': results,
+        'api_availability_page_ms': endpoint_ms,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# Monthly billing run over --leases active leases: run_billing()'s chunked
+# INSERT ... SELECT vs fetching the leases and inserting invoices from a
+# Python loop, then a second run of the same period (nothing to add), and a
+# `flask billing-run` that is killed part way through and resumed, checking
+# every lease ends up with exactly one invoice.
+#
+#   python -m benchmarks.billing --leases 500000
+import argparse
+import calendar
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from app import app, get_pool, run_billing
+from benchmarks.datagen import generate_mall
+
+
+def python_billing(database, first_day):
+    month_days = calendar.monthrange(first_day.year, first_day.month)[1]
+    last_day = first_day.replace(day=month_days)
+    period = first_day.strftime('%Y-%m')
+    due_date = (first_day + timedelta(days=app.config['BILLING_DUE_DAYS'])).isoformat()
+    conn = sqlite3.connect(database)
+    started = time.perf_counter()
+    with conn:
+        run_id = conn.execute("INSERT INTO billing_run (period, started_at) VALUES (?, datetime('now'))",
+                              (period,)).lastrowid
+        rows = []
+        for lease_id, tenant_id, shop_id, start, end, rent in conn.execute(
+            "SELECT id, tenant_id, shop_id, start_date, end_date, rent_amount FROM lease WHERE status = 'Active'"
+        ):
+            days = (min(date.fromisoformat(end[:10]), last_day) - max(date.fromisoformat(start[:10]), first_day)).days + 1
+            if days > 0:
+                rows.append((run_id, lease_id, tenant_id, shop_id, period, days,
+                             round(rent * days / month_days, 2), due_date))
+        conn.executemany('''
+        INSERT OR IGNORE INTO invoice (run_id, lease_id, tenant_id, shop_id, period, days, amount, due_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed, len(rows)
+
+
+def timed_run(first_day):
+    with app.app_context():
+        started = time.perf_counter()
+        with get_pool().writer:
+            run = dict(run_billing(first_day))
+        run['wall_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return run
+
+
+def killed_and_resumed(database, period, chunk_size):
+    env = dict(os.environ, FLASK_DATABASE=database, FLASK_BILLING_CHUNK_SIZE=str(chunk_size))
+    command = [sys.executable, '-m', 'flask', '--app', 'app', 'billing-run', '--period', period]
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(command, env=env, cwd=cwd, stdout=subprocess.DEVNULL)
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    # Kill it once a few chunks are committed
+    killed_after = None
+    while process.poll() is None:
+        time.sleep(0.01)
+        try:
+            killed_after = conn.execute('SELECT chunks, invoices_created, status FROM billing_run').fetchone()
+        except sqlite3.OperationalError:
+            continue
+        if killed_after and killed_after['chunks'] >= 3:
+            process.send_signal(signal.SIGKILL)
+            break
+    process.wait()
+
+    subprocess.run(command, env=env, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+    run = conn.execute('SELECT * FROM billing_run ORDER BY id DESC LIMIT 1').fetchone()
+    duplicates = conn.execute(
+        'SELECT COUNT(*) FROM (SELECT lease_id FROM invoice WHERE period = ? GROUP BY lease_id HAVING COUNT(*) > 1)',
+        (period,)
+    ).fetchone()[0]
+    result = {
+        'killed_after': dict(killed_after) if killed_after else None,
+        'runs': conn.execute('SELECT COUNT(*) FROM billing_run').fetchone()[0],
+        'resumed': run['resumed'],
+        'status': run['status'],
+        'invoices_total': run['invoices_total'],
+        'duplicates': duplicates,
+    }
+    conn.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chunked INSERT ... SELECT billing run vs a Python loop')
+    parser.add_argument('--leases', type=int, default=500000)
+    parser.add_argument('--period', default='2025-01')
+    parser.add_argument('--chunk-size', type=int, default=None, help='BILLING_CHUNK_SIZE (default: the app setting)')
+    parser.add_argument('--resume-chunk-size', type=int, default=20000,
+                        help='Smaller chunks for the killed run, so it is killed part way')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if args.chunk_size:
+        app.config['BILLING_CHUNK_SIZE'] = args.chunk_size
+    first_day = date.fromisoformat(f'{args.period}-01')
+
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'bench_billing.db')
+    # One active lease per shop, current on the generator's anchor date
+    mall = generate_mall(database, args.leases, 0, lease_history=0, occupancy=1.0, seed=args.seed)
+    copies = {}
+    for name in ('loop', 'resume'):
+        copies[name] = os.path.join(directory, f'bench_billing_{name}.db')
+        shutil.copy(database, copies[name])
+
+    loop_s, loop_invoices = python_billing(copies['loop'], first_day)
+
+    app.config['DATABASE'] = database
+    first = timed_run(first_day)
+    again = timed_run(first_day)
+
+    print(json.dumps({
+        'leases': mall['leases'],
+        'period': args.period,
+        'chunk_size': app.config['BILLING_CHUNK_SIZE'],
+        'insert_select': {
+            'wall_ms': first['wall_ms'],
+            'invoices_created': first['invoices_created'],
+            'chunks': first['chunks'],
+            'invoices_per_second': round(first['invoices_created'] / (first['wall_ms'] / 1000)),
+        },
+        'python_loop': {
+            'wall_ms': round(loop_s * 1000, 3),
+            'invoices_created': loop_invoices,
+        },
+        'speedup': round(loop_s * 1000 / first['wall_ms'], 1),
+        'second_run': {'wall_ms': again['wall_ms'], 'invoices_created': again['invoices_created']},
+        'killed_and_resumed': killed_and_resumed(copies['resume'], args.period, args.resume_chunk_size),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
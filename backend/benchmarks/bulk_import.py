@@ -0,0 +1,59 @@
+# Rows per second through POST /api/bulk/<entity> for CSV and NDJSON uploads.
+#
+#   python -m benchmarks.bulk_import --rows 100000
+import argparse
+import json
+import os
+import tempfile
+
+from app import app, init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import throughput')
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    rows = args.rows
+
+    app.config['DATABASE'] = os.path.join(tempfile.mkdtemp(), 'bench_bulk.db')
+    with app.app_context():
+        init_db()
+    client = app.test_client()
+
+    shops = 'name,location,size,rent,status\n' + ''.join(
+        f'Shop {i},Floor {i % 5},{50 + i % 300},{1000 + i % 9000},Vacant\n' for i in range(rows)
+    )
+    tenants = ''.join(
+        json.dumps({'name': f'Tenant {i}', 'email': f'tenant{i}@example.com', 'shop_id': 1 + i}) + '\n'
+        for i in range(rows)
+    )
+    leases = 'tenant_id,shop_id,start_date,end_date,rent_amount,status\n' + ''.join(
+        f'{4 + i},{5 + i},2025-01-01,2026-01-01,{1000 + i % 9000},Active\n' for i in range(rows - 4)
+    )
+    maintenance = ''.join(
+        json.dumps({'shop_id': 1 + i % rows, 'description': 'Leaking pipe', 'priority': 'Low'}) + '\n'
+        for i in range(rows)
+    )
+
+    results = []
+    for entity, data, content_type in [
+        ('shops', shops, 'text/csv'),
+        ('tenants', tenants, 'application/x-ndjson'),
+        ('leases', leases, 'text/csv'),
+        ('maintenance', maintenance, 'application/x-ndjson'),
+    ]:
+        response = client.post(f'/api/bulk/{entity}', data=data, content_type=content_type)
+        report = response.get_json()
+        results.append({
+            'entity': entity,
+            'format': content_type,
+            'inserted': report['inserted'],
+            'failed': report['failed'],
+            'duration_ms': report['duration_ms'],
+            'rows_per_second': report['rows_per_second'],
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
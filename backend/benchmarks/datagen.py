@@ -0,0 +1,198 @@
+# Synthetic mall data for benchmarks: shops over several floors, a current
+# tenant and lease for most shops, past tenants with expired or terminated
+# lease histories, and years of maintenance tickets. The same seed always
+# produces the same database.
+#
+#   python -m benchmarks.datagen mall.db --shops 100000 --maintenance 1000000
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from app import app, init_db
+
+FLOORS = ['Ground Floor', '1st Floor', '2nd Floor', '3rd Floor', '4th Floor']
+WINGS = ['North Wing', 'South Wing', 'East Wing', 'West Wing', 'Atrium']
+# Rent per square unit falls off with each floor up
+FLOOR_RATES = [65, 55, 48, 42, 38]
+BUSINESS_TYPES = ['Retail', 'Food', 'Electronics', 'Books', 'Fashion', 'Jewellery',
+                  'Services', 'Health', 'Entertainment', 'Home']
+SHOP_NAMES = ['Boutique', 'Café', 'Outlet', 'Store', 'Kiosk', 'Studio', 'Corner', 'Emporium', 'Express', 'Gallery']
+FIRST_NAMES = ['Asha', 'Ben', 'Chen', 'Divya', 'Elena', 'Farid', 'Grace', 'Hiro', 'Isla', 'Jamal',
+               'Kavya', 'Liam', 'Maya', 'Noah', 'Omar', 'Priya', 'Quinn', 'Ravi', 'Sara', 'Tomas']
+LAST_NAMES = ['Patel', 'Smith', 'Garcia', 'Kim', 'Nair', 'Okafor', 'Rossi', 'Silva', 'Tanaka', 'Weber']
+ISSUES = ['Leaky pipe in restroom', 'AC not working properly', 'Light fixture replacement needed',
+          'Broken shutter', 'Power outage in unit', 'Water damage on ceiling', 'Fire alarm fault',
+          'Blocked drain', 'Cracked floor tile', 'Door lock jammed', 'Escalator noise nearby',
+          'Signage lighting failure']
+BATCH_SIZE = 10000
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def next_id(conn, table):
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+
+
+def generate_mall(database, shops=1000, maintenance=10000, lease_history=2, occupancy=0.85,
+                  seed=1, anchor='2025-01-01'):
+    rng = random.Random(seed)
+    today = date.fromisoformat(anchor)
+    started = time.perf_counter()
+
+    app.config['DATABASE'] = database
+    with app.app_context():
+        init_db()
+
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA synchronous = OFF')
+    first_shop = next_id(conn, 'shop')
+    first_tenant = next_id(conn, 'tenant')
+    first_lease = next_id(conn, 'lease')
+
+    shop_rows = []
+    tenant_rows = []
+    lease_rows = []
+    tenant_id = first_tenant
+    lease_id = first_lease
+    for shop_id in range(first_shop, first_shop + shops):
+        floor = rng.randrange(len(FLOORS))
+        size = round(min(max(rng.lognormvariate(4.6, 0.5), 30), 800))
+        rent = round(size * FLOOR_RATES[floor] / 50) * 50
+        occupied = rng.random() < occupancy
+        shop_rows.append((
+            shop_id,
+            f'{rng.choice(SHOP_NAMES)} {shop_id}',
+            f'{FLOORS[floor]}, {rng.choice(WINGS)}',
+            size,
+            rent,
+            'Occupied' if occupied else 'Vacant',
+        ))
+
+        # Past leases run back from a few months ago, newest first
+        end = today - timedelta(days=rng.randint(0, 180) if occupied else rng.randint(30, 720))
+        for _ in range(rng.randint(max(lease_history - 1, 0), lease_history + 1)):
+            start = end - timedelta(days=365 * rng.randint(1, 3))
+            tenant_rows.append(make_tenant(rng, tenant_id, None))
+            lease_rows.append((
+                lease_id, tenant_id, shop_id, start.isoformat(), end.isoformat(),
+                round(rent * rng.uniform(0.7, 0.95), 2),
+                'Terminated' if rng.random() < 0.15 else 'Expired',
+            ))
+            tenant_id += 1
+            lease_id += 1
+            end = start - timedelta(days=rng.randint(0, 90))
+
+        if occupied:
+            start = today - timedelta(days=rng.randint(0, 3 * 365))
+            # A few active leases are already past their end date, for the expiry job
+            end = start + timedelta(days=365 * rng.randint(1, 5))
+            if rng.random() < 0.02:
+                end = today - timedelta(days=rng.randint(1, 60))
+            tenant_rows.append(make_tenant(rng, tenant_id, shop_id))
+            lease_rows.append((
+                lease_id, tenant_id, shop_id, start.isoformat(), end.isoformat(),
+                round(rent * rng.uniform(0.95, 1.05), 2), 'Active',
+            ))
+            tenant_id += 1
+            lease_id += 1
+
+    def maintenance_rows():
+        for _ in range(maintenance):
+            shop_id = rng.randrange(first_shop, first_shop + shops) if shops else rng.randint(1, first_shop - 1)
+            reported = datetime_before(rng, today, 3 * 365)
+            roll = rng.random()
+            status = 'Completed' if roll < 0.8 else 'In Progress' if roll < 0.88 else 'Pending'
+            resolved = notes = None
+            if status == 'Completed':
+                resolved = (date.fromisoformat(reported[:10]) + timedelta(days=rng.randint(0, 30))).isoformat()
+                notes = 'Resolved by facilities team'
+            priority = rng.choices(['Low', 'Medium', 'High'], weights=[50, 35, 15])[0]
+            yield (shop_id, rng.choice(ISSUES), reported, status, priority, resolved, notes)
+
+    with conn:
+        conn.executemany(
+            'INSERT INTO shop (id, name, location, size, rent, status) VALUES (?, ?, ?, ?, ?, ?)',
+            shop_rows
+        )
+        conn.executemany(
+            'INSERT INTO tenant (id, name, contact, email, business_type, shop_id) VALUES (?, ?, ?, ?, ?, ?)',
+            tenant_rows
+        )
+        conn.executemany('''
+        INSERT INTO lease (id, tenant_id, shop_id, start_date, end_date, rent_amount, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', lease_rows)
+    for batch in batches(maintenance_rows()):
+        with conn:
+            conn.executemany('''
+            INSERT INTO maintenance (shop_id, description, reported_date, status, priority, resolved_date, resolution_notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+    conn.execute('ANALYZE')
+    conn.close()
+
+    return {
+        'database': database,
+        'seed': seed,
+        'anchor': anchor,
+        'shops': len(shop_rows),
+        'tenants': len(tenant_rows),
+        'leases': len(lease_rows),
+        'maintenance': maintenance,
+        'size_bytes': os.path.getsize(database),
+        'duration_s': round(time.perf_counter() - started, 2),
+    }
+
+
+def make_tenant(rng, tenant_id, shop_id):
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    return (
+        tenant_id,
+        f'{first} {last} {tenant_id}',
+        f'9{rng.randrange(10 ** 9):09d}',
+        f'{first.lower()}.{last.lower()}{tenant_id}@example.com',
+        rng.choice(BUSINESS_TYPES),
+        shop_id,
+    )
+
+
+def datetime_before(rng, today, days):
+    moment = today - timedelta(days=rng.randint(0, days))
+    return f'{moment.isoformat()} {rng.randint(8, 21):02d}:{rng.randrange(60):02d}:00'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic mall database')
+    parser.add_argument('database')
+    parser.add_argument('--shops', type=int, default=1000)
+    parser.add_argument('--maintenance', type=int, default=10000)
+    parser.add_argument('--lease-history', type=int, default=2, help='Average past leases per shop')
+    parser.add_argument('--occupancy', type=float, default=0.85)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--anchor', default='2025-01-01', help="Date the data treats as 'today'")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+    print(json.dumps(generate_mall(
+        os.path.abspath(args.database), args.shops, args.maintenance, args.lease_history,
+        args.occupancy, args.seed, args.anchor,
+    ), indent=2))
+
+
+if __name__ == '__main__':
+    main()
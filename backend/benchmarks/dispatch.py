@@ -0,0 +1,144 @@
+# Technician dispatch over --maintenance tickets (about 12% pending): the
+# time to build the dispatch heap, picking the next ticket from it vs an
+# ORDER BY ... LIMIT 1 over the pending tickets, and --technicians threads
+# claiming with POST /api/maintenance/next and then completing or releasing
+# each ticket, checking no ticket was claimed twice at once.
+#
+#   python -m benchmarks.dispatch --maintenance 1000000 --technicians 32
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from app import DispatchQueue, app
+from benchmarks.datagen import generate_mall
+from benchmarks.loadtest import summarize
+
+# The dispatch order as one query, what /api/maintenance/next would run without the heap
+NEXT_TICKET_SQL = '''
+SELECT m.id
+FROM maintenance m
+JOIN shop s ON s.id = m.shop_id
+WHERE m.status = 'Pending'
+ORDER BY CASE m.priority WHEN 'Critical' THEN 0 WHEN 'High' THEN 1 WHEN 'Medium' THEN 2 WHEN 'Low' THEN 3 ELSE 4 END,
+         s.status != 'Occupied', IFNULL(m.reported_date, '~'), m.id
+LIMIT 1
+'''
+
+
+def selection(database, repeat):
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    dispatch = DispatchQueue()
+    with app.app_context():
+        started = time.perf_counter()
+        dispatch.rebuild(conn)
+        rebuild_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(NEXT_TICKET_SQL).fetchone()
+    sql_ms = (time.perf_counter() - started) / repeat * 1000
+    sql_first = conn.execute(NEXT_TICKET_SQL).fetchone()[0]
+
+    heap_first = dispatch.peek(1)[0]
+    started = time.perf_counter()
+    popped = [dispatch.pop() for _ in range(repeat)]
+    heap_us = (time.perf_counter() - started) / repeat * 1000000
+    conn.close()
+    return {
+        'pending': len(dispatch) + len(popped),
+        'heap_rebuild_ms': round(rebuild_ms, 3),
+        'heap_pop_us': round(heap_us, 3),
+        'sql_next_ms': round(sql_ms, 3),
+        'same_first_ticket': heap_first == sql_first,
+    }
+
+
+def technicians(count, duration, seed):
+    client = app.test_client()
+    ids = [client.post('/api/technicians', json={'name': f'Technician {i}'}).json['id'] for i in range(count)]
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    claimed = []
+    holding = set()
+    double_claims = [0]
+
+    def run(index):
+        rng = random.Random(seed + index)
+        client = app.test_client()
+        technician = {'technician_id': ids[index]}
+        local = []
+        failed = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.post('/api/maintenance/next', json=technician)
+            local.append(time.perf_counter() - started)
+            if response.status_code != 200 or response.json['ticket'] is None:
+                failed += 1
+                continue
+            ticket_id = response.json['ticket']['id']
+            with lock:
+                claimed.append(ticket_id)
+                if ticket_id in holding:
+                    double_claims[0] += 1
+                holding.add(ticket_id)
+            # Give one in five back, complete the rest
+            done = rng.random() < 0.8
+            with lock:
+                holding.discard(ticket_id)
+            if done:
+                response = client.post(f'/api/maintenance/{ticket_id}/complete', json={'resolution_notes': 'Fixed'})
+            else:
+                response = client.post(f'/api/maintenance/{ticket_id}/release', json=technician)
+            failed += response.status_code != 200
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, errors[0], time.perf_counter() - started)
+    result['claims'] = len(claimed)
+    result['double_claims'] = double_claims[0]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dispatch heap vs ORDER BY for the next maintenance ticket')
+    parser.add_argument('--shops', type=int, default=5000)
+    parser.add_argument('--maintenance', type=int, default=1000000)
+    parser.add_argument('--technicians', type=int, default=32, help='Concurrent technician threads')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=200, help='Selections timed for the heap and the query')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench_dispatch.db')
+    mall = generate_mall(database, args.shops, args.maintenance, seed=args.seed)
+    app.config['DATABASE'] = database
+    # Claims are what this measures, not the expiry job
+    app.config['DISPATCH_CLAIM_CHECK_INTERVAL'] = 0
+
+    print(json.dumps({
+        'maintenance': mall['maintenance'],
+        'selection': selection(database, args.repeat),
+        'technicians': args.technicians,
+        'claims': technicians(args.technicians, args.duration, args.seed),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
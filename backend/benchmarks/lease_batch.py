@@ -0,0 +1,80 @@
+# Time to raise the rent on N leases with one PUT /api/leases/<id> per lease
+# vs a single POST /api/leases/batch.
+#
+#   python -m benchmarks.lease_batch --leases 5000
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from app import app, init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-lease updates vs batch lease operations')
+    parser.add_argument('--leases', type=int, default=5000)
+    args = parser.parse_args()
+    count = args.leases
+
+    app.config['DATABASE'] = os.path.join(tempfile.mkdtemp(), 'bench_batch.db')
+    with app.app_context():
+        init_db()
+    client = app.test_client()
+
+    # Shops and tenants 5.. and one active lease each, after the sample data
+    client.post('/api/bulk/shops', content_type='text/csv', data='name,rent\n' + ''.join(
+        f'Shop {i},{1000 + i % 9000}\n' for i in range(count)
+    ))
+    client.post('/api/bulk/tenants', content_type='text/csv', data='name\n' + ''.join(
+        f'Tenant {i}\n' for i in range(count)
+    ))
+    client.post('/api/bulk/leases', content_type='text/csv', data=(
+        'tenant_id,shop_id,start_date,end_date,rent_amount,status\n' + ''.join(
+            f'{4 + i},{5 + i},2025-01-01,2026-01-01,{1000 + i % 9000},Active\n' for i in range(count)
+        )
+    ))
+    leases = client.get('/api/leases').get_json()
+    leases = [lease for lease in leases if lease['shop_id'] >= 5]
+
+    started = time.perf_counter()
+    for lease in leases:
+        client.put(f"/api/leases/{lease['id']}", json={
+            'tenant_id': lease['tenant_id'],
+            'shop_id': lease['shop_id'],
+            'start_date': lease['start_date'],
+            'end_date': lease['end_date'],
+            'rent_amount': round(lease['rent_amount'] * 1.05, 2),
+            'status': lease['status'],
+        })
+    per_lease = time.perf_counter() - started
+
+    started = time.perf_counter()
+    dry_run = client.post('/api/leases/batch', json={
+        'filter': {'start_from': '2025-01-01'},
+        'changes': {'rent_increase_pct': 5},
+        'dry_run': True,
+    }).get_json()
+    dry_run_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = client.post('/api/leases/batch', json={
+        'filter': {'start_from': '2025-01-01'},
+        'changes': {'rent_increase_pct': 5},
+    }).get_json()
+    batch_time = time.perf_counter() - started
+
+    print(json.dumps({
+        'leases': len(leases),
+        'per_lease_put_ms': round(per_lease * 1000, 1),
+        'batch_dry_run_ms': round(dry_run_time * 1000, 1),
+        'batch_ms': round(batch_time * 1000, 1),
+        'batch_reported_ms': batch['duration_ms'],
+        'batch_updated': batch['updated'],
+        'speedup': round(per_lease / batch_time, 1) if batch_time else None,
+        'dry_run_matched': dry_run['matched'],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
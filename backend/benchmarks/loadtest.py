@@ -0,0 +1,394 @@
+# Latency, throughput and memory for every API route on a synthetic mall.
+#
+# Each route is first run sequentially through Flask's test client, then a
+# mix of routes is driven over HTTP by concurrent client threads against a
+# local threaded server. Results are written as JSON so runs can be compared:
+#
+#   python -m benchmarks.loadtest --shops 100000 --maintenance 1000000 --output run.json
+#   python -m benchmarks.loadtest --compare run.json
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import app
+from benchmarks.datagen import generate_mall
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed=None):
+    latencies = sorted(latencies)
+    busy = elapsed if elapsed is not None else sum(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / busy, 1) if busy else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+
+# Rows the write routes can use up: each DELETE, complete or tenant-with-shop
+# request gets a row nobody else touches
+def prepare_rows(database, count):
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    rows = {
+        'shops': [tuple(row) for row in conn.execute(
+            "SELECT id, name, location, size, rent, status FROM shop WHERE name NOT LIKE 'Bench %'")],
+        'tenants': [tuple(row) for row in conn.execute(
+            'SELECT id, name, contact, email, business_type, shop_id FROM tenant WHERE shop_id IS NOT NULL')],
+        'leases': [tuple(row) for row in conn.execute(
+            "SELECT id, tenant_id, shop_id, start_date, end_date, rent_amount, status FROM lease WHERE status = 'Active'")],
+        'maintenance': [tuple(row) for row in conn.execute(
+            'SELECT id, shop_id, description, reported_date, status, priority FROM maintenance')],
+    }
+
+    with conn:
+        first_shop = conn.execute('SELECT MAX(id) + 1 FROM shop').fetchone()[0]
+        first_tenant = conn.execute('SELECT MAX(id) + 1 FROM tenant').fetchone()[0]
+        first_lease = conn.execute('SELECT MAX(id) + 1 FROM lease').fetchone()[0]
+        first_ticket = conn.execute('SELECT MAX(id) + 1 FROM maintenance').fetchone()[0]
+        shop_ids = list(range(first_shop, first_shop + 5 * count))
+        tenant_ids = list(range(first_tenant, first_tenant + 3 * count))
+        conn.executemany("INSERT INTO shop (id, name, rent, status) VALUES (?, 'Bench shop', 1000, 'Vacant')",
+                         [(shop_id,) for shop_id in shop_ids])
+        conn.executemany("INSERT INTO tenant (id, name) VALUES (?, 'Bench tenant')",
+                         [(tenant_id,) for tenant_id in tenant_ids])
+        # Expired leases between spare tenants and spare shops, for DELETE
+        lease_ids = list(range(first_lease, first_lease + count))
+        conn.executemany('''
+        INSERT INTO lease (id, tenant_id, shop_id, start_date, end_date, rent_amount, status)
+        VALUES (?, ?, ?, '2020-01-01', '2021-01-01', 1000, 'Expired')
+        ''', [(lease_id, tenant_ids[i], shop_ids[i]) for i, lease_id in enumerate(lease_ids)])
+        ticket_ids = list(range(first_ticket, first_ticket + 2 * count))
+        conn.executemany('''
+        INSERT INTO maintenance (id, shop_id, description, reported_date, status, priority)
+        VALUES (?, ?, 'Bench ticket', '2024-06-01 10:00:00', 'Pending', 'Low')
+        ''', [(ticket_id, shop_ids[0]) for ticket_id in ticket_ids])
+    conn.close()
+
+    rows['spare_shops'] = {
+        'leases': shop_ids[count:2 * count],
+        'delete': shop_ids[2 * count:3 * count],
+        'tenant_with_lease': shop_ids[3 * count:4 * count],
+        'tenant_simple': shop_ids[4 * count:],
+    }
+    rows['spare_tenants'] = {
+        'delete': tenant_ids[count:2 * count],
+        'update_shop': tenant_ids[2 * count:],
+    }
+    rows['spare_leases'] = lease_ids
+    rows['spare_tickets'] = {'delete': ticket_ids[:count], 'complete': ticket_ids[count:]}
+    return rows
+
+
+# Every route as (name, request factory, weight in the HTTP mix). A factory
+# returns (method, path, json body, raw body, content type); routes that use
+# up rows have no weight so the HTTP mix can run for any length of time.
+def route_cases(rows, rng):
+    def one(key):
+        return rng.choice(rows[key])
+
+    def take(pool):
+        return pool.pop() if pool else 0
+
+    def get(path):
+        return lambda: ('GET', path() if callable(path) else path, None, None, None)
+
+    def shop_body(shop):
+        return {'name': shop[1], 'location': shop[2], 'size': shop[3], 'rent': shop[4], 'status': shop[5]}
+
+    def tenant_body(tenant):
+        return {'name': tenant[1], 'contact': tenant[2], 'email': tenant[3],
+                'business_type': tenant[4], 'shop_id': tenant[5]}
+
+    def lease_body(lease):
+        return {'tenant_id': lease[1], 'shop_id': lease[2], 'start_date': lease[3],
+                'end_date': lease[4], 'rent_amount': lease[5], 'status': lease[6]}
+
+    def ticket_body(ticket):
+        return {'shop_id': ticket[1], 'description': ticket[2], 'reported_date': ticket[3],
+                'status': ticket[4], 'priority': ticket[5]}
+
+    spare_shops = rows['spare_shops']
+    spare_tenants = rows['spare_tenants']
+    spare_tickets = rows['spare_tickets']
+    bulk_tickets = ''.join(
+        json.dumps({'shop_id': rows['shops'][i % len(rows['shops'])][0], 'description': 'Bulk ticket'}) + '\n'
+        for i in range(100)
+    )
+
+    return [
+        ('GET /', get('/'), 1),
+        ('GET /api/dashboard', get('/api/dashboard'), 3),
+        ('GET /api/dashboard/summary', get('/api/dashboard/summary'), 5),
+        ('GET /api/dashboard/tenant-stats', get('/api/dashboard/tenant-stats'), 2),
+        ('GET /api/shops?limit=50', get('/api/shops?limit=50&sort=name'), 8),
+        ('GET /api/shops/<id>', get(lambda: f"/api/shops/{one('shops')[0]}"), 8),
+        ('POST /api/shops', lambda: ('POST', '/api/shops', {'name': 'Bench new shop', 'rent': 1500}, None, None), 2),
+        ('PUT /api/shops/<id>', lambda: (lambda shop: ('PUT', f'/api/shops/{shop[0]}', shop_body(shop), None, None))(one('shops')), 2),
+        ('DELETE /api/shops/<id>', lambda: ('DELETE', f"/api/shops/{take(spare_shops['delete'])}", None, None, None), 0),
+        ('GET /api/tenants?limit=50', get('/api/tenants?limit=50'), 6),
+        ('GET /api/tenants/<id>', get(lambda: f"/api/tenants/{one('tenants')[0]}"), 6),
+        ('POST /api/tenants', lambda: ('POST', '/api/tenants', {'name': 'Bench new tenant'}, None, None), 2),
+        ('PUT /api/tenants/<id>', lambda: (lambda tenant: ('PUT', f'/api/tenants/{tenant[0]}', tenant_body(tenant), None, None))(one('tenants')), 2),
+        ('DELETE /api/tenants/<id>', lambda: ('DELETE', f"/api/tenants/{take(spare_tenants['delete'])}", None, None, None), 0),
+        ('GET /api/leases?limit=50', get('/api/leases?limit=50&status=Active&sort=end_date'), 6),
+        ('GET /api/leases/<id>', get(lambda: f"/api/leases/{one('leases')[0]}"), 6),
+        ('POST /api/leases', lambda: ('POST', '/api/leases', {
+            'tenant_id': rng.choice(spare_tenants['update_shop']), 'shop_id': take(spare_shops['leases']),
+            'start_date': '2025-01-01', 'end_date': '2026-01-01', 'rent_amount': 1000, 'status': 'Expired',
+        }, None, None), 0),
+        ('PUT /api/leases/<id>', lambda: (lambda lease: ('PUT', f'/api/leases/{lease[0]}', lease_body(lease), None, None))(one('leases')), 2),
+        ('DELETE /api/leases/<id>', lambda: ('DELETE', f"/api/leases/{take(rows['spare_leases'])}", None, None, None), 0),
+        ('GET /api/maintenance?limit=50', get('/api/maintenance?limit=50&status=Pending'), 6),
+        ('GET /api/maintenance/<id>', get(lambda: f"/api/maintenance/{one('maintenance')[0]}"), 6),
+        ('POST /api/maintenance', lambda: ('POST', '/api/maintenance', {
+            'shop_id': one('shops')[0], 'description': 'Bench issue', 'priority': 'Low',
+        }, None, None), 3),
+        ('PUT /api/maintenance/<id>', lambda: (lambda ticket: ('PUT', f'/api/maintenance/{ticket[0]}', ticket_body(ticket), None, None))(one('maintenance')), 2),
+        ('DELETE /api/maintenance/<id>', lambda: ('DELETE', f"/api/maintenance/{take(spare_tickets['delete'])}", None, None, None), 0),
+        ('POST /api/maintenance/<id>/complete', lambda: ('POST', f"/api/maintenance/{take(spare_tickets['complete'])}/complete",
+                                                        {'resolution_notes': 'Fixed'}, None, None), 0),
+        ('POST /api/tenants/update-shop', lambda: ('POST', '/api/tenants/update-shop', {
+            'tenant_id': take(spare_tenants['update_shop']), 'shop_id': rng.choice(spare_shops['leases'] or [1]),
+        }, None, None), 0),
+        ('POST /api/leases/expire-check', lambda: ('POST', '/api/leases/expire-check', None, None, None), 1),
+        ('POST /api/tenant-with-lease', lambda: ('POST', '/api/tenant-with-lease', {
+            'tenant': {'name': 'Bench tenant with lease', 'shop_id': take(spare_shops['tenant_with_lease'])},
+            'lease': {'start_date': '2025-01-01', 'end_date': '2027-01-01', 'rent_amount': 1200},
+        }, None, None), 0),
+        ('POST /api/tenant-simple', lambda: ('POST', '/api/tenant-simple', {
+            'name': 'Bench simple tenant', 'shop_id': take(spare_shops['tenant_simple']),
+        }, None, None), 0),
+        ('POST /api/leases/batch (dry run)', lambda: ('POST', '/api/leases/batch', {
+            'filter': {'shop_id': one('leases')[2]}, 'changes': {'rent_increase_pct': 3}, 'dry_run': True,
+        }, None, None), 1),
+        ('POST /api/bulk/maintenance', lambda: ('POST', '/api/bulk/maintenance', None, bulk_tickets, 'application/x-ndjson'), 0),
+        ('GET /api/export/lease', get('/api/export/lease'), 0),
+        ('POST /api/export/snapshot', lambda: ('POST', '/api/export/snapshot', None, None, None), 0),
+        ('GET /api/export/snapshots', get('/api/export/snapshots'), 0),
+        ('GET /metrics', get('/metrics'), 1),
+        ('GET /api/_debug/pool', get('/api/_debug/pool'), 0),
+        ('GET /api/_debug/profile', get('/api/_debug/profile?limit=5'), 0),
+        ('GET /api/_debug/jobs', get('/api/_debug/jobs'), 0),
+    ]
+
+
+# Whole-table exports and snapshots are much slower, so run them less often
+HEAVY_ROUTES = {'GET /api/export/lease', 'POST /api/export/snapshot', 'POST /api/bulk/maintenance'}
+
+
+def client_request(client, method, path, body, data, content_type):
+    response = client.open(path, method=method, json=body, data=data, content_type=content_type)
+    # Read the whole body so streamed responses are timed to the last byte
+    response.get_data()
+    status = response.status_code
+    response.close()
+    return status
+
+
+def run_client(cases, requests):
+    client = app.test_client()
+    results = {}
+    for name, factory, weight in cases:
+        count = max(requests // 20, 3) if name in HEAVY_ROUTES else requests
+        latencies = []
+        errors = 0
+        for _ in range(count):
+            request_args = factory()
+            started = time.perf_counter()
+            status = client_request(client, *request_args)
+            latencies.append(time.perf_counter() - started)
+            errors += status >= 400
+        # One more request under tracemalloc for the memory it allocates
+        tracemalloc.start()
+        client_request(client, *factory())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = summarize(latencies, errors)
+        results[name]['peak_alloc_kb'] = round(peak / 1024, 1)
+    return results
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+def run_http(cases, threads, duration, seed):
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    port = server.server_port
+
+    mix = [(name, factory) for name, factory, weight in cases for _ in range(weight)]
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        local = {}
+        local_errors = {}
+        while not stop.is_set():
+            name, factory = rng.choice(mix)
+            method, path, body, data, content_type = factory()
+            headers = {}
+            if body is not None:
+                data = json.dumps(body)
+                content_type = 'application/json'
+            if content_type:
+                headers['Content-Type'] = content_type
+            started = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                failed = response.status >= 400
+                conn.close()
+            except OSError:
+                failed = True
+            local.setdefault(name, []).append(time.perf_counter() - started)
+            local_errors[name] = local_errors.get(name, 0) + failed
+        with lock:
+            for name, values in local.items():
+                latencies.setdefault(name, []).extend(values)
+                errors[name] = errors.get(name, 0) + local_errors[name]
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    overall = summarize(all_latencies, sum(errors.values()), elapsed)
+    overall.update({'threads': threads, 'duration_s': round(elapsed, 2)})
+    overall['routes'] = {
+        name: summarize(values, errors[name], elapsed) for name, values in sorted(latencies.items())
+    }
+    return overall
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# Routes whose client-mode p95 grew by more than threshold since the baseline run
+def compare(baseline, current, threshold):
+    regressions = []
+    for name, stats in current['client'].items():
+        before = baseline.get('client', {}).get(name)
+        if not before or not before.get('p95_ms') or not stats.get('p95_ms'):
+            continue
+        change = stats['p95_ms'] / before['p95_ms'] - 1
+        if change > threshold:
+            regressions.append({'route': name, 'before_p95_ms': before['p95_ms'],
+                                'after_p95_ms': stats['p95_ms'], 'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-route latency, throughput and memory benchmark')
+    parser.add_argument('--database', help='Benchmark an existing database generated by benchmarks.datagen')
+    parser.add_argument('--shops', type=int, default=2000)
+    parser.add_argument('--maintenance', type=int, default=20000)
+    parser.add_argument('--lease-history', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route in client mode')
+    parser.add_argument('--threads', type=int, default=8, help='Client threads in HTTP mode')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of HTTP load, 0 to skip')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    parser.add_argument('--compare', help='Baseline report; exit 1 if a route regressed')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed p95 growth for --compare')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    app.config['SNAPSHOT_DIR'] = os.path.join(workdir, 'snapshots')
+    app.config['SLOW_QUERY_LOG'] = ''
+    app.config['LEASE_EXPIRY_INTERVAL'] = 0
+    app.logger.disabled = True
+    if args.database:
+        database = os.path.abspath(args.database)
+        dataset = {'database': database}
+    else:
+        database = os.path.join(workdir, 'bench_mall.db')
+        dataset = generate_mall(database, args.shops, args.maintenance, args.lease_history, seed=args.seed)
+    app.config['DATABASE'] = database
+    app.config['DB_POOL_SIZE'] = max(app.config['DB_POOL_SIZE'], args.threads + 1)
+
+    rng = random.Random(args.seed)
+    # Enough spare rows for the client run plus the heavy-route retries
+    rows = prepare_rows(database, args.requests + 1)
+    cases = route_cases(rows, rng)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'requests_per_route': args.requests,
+        },
+        'dataset': dataset,
+        'client': run_client(cases, args.requests),
+    }
+    if args.duration > 0:
+        report['http'] = run_http(cases, args.threads, args.duration, args.seed)
+    report['meta']['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"p95 regression in {regression['route']}: {regression['before_p95_ms']} ms -> "
+                  f"{regression['after_p95_ms']} ms ({regression['change']:+.0%})", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# Rent roll over --leases synthetic active leases: compute_rent_roll() on
+# NumPy arrays vs the same projection as a per-lease Python loop over
+# months, checking that both agree. Then times /api/analytics/rent-roll on a
+# generated mall, cold (loading the leases) and cached.
+#
+#   python -m benchmarks.rent_roll --leases 1000000
+import argparse
+import calendar
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from app import app, compute_rent_roll
+from benchmarks.datagen import generate_mall
+
+EPOCH = date(1970, 1, 1)
+
+
+def synthetic_leases(count, shops, seed):
+    rng = np.random.default_rng(seed)
+    # Several leases per shop, some overlapping, starting 2018-2027
+    shop_ids = rng.integers(1, shops + 1, count)
+    starts = (np.datetime64('2018-01-01') - np.datetime64('1970-01-01')).astype(np.int64) + rng.integers(0, 10 * 365, count)
+    ends = starts + rng.integers(180, 6 * 365, count)
+    rents = np.round(rng.uniform(1000, 20000, count), 2)
+    return shop_ids, starts, ends, rents
+
+
+# Reference implementation: walk every month each lease overlaps
+def python_rent_roll(leases, first_month, months, total_shops):
+    year, month = first_month.year, first_month.month
+    month_starts = []
+    for _ in range(months + 1):
+        month_starts.append(date(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    window_start, window_end = month_starts[0], month_starts[-1] - timedelta(days=1)
+
+    revenue = [0.0] * months
+    active = [0] * months
+    expiring = [0] * months
+    at_risk = [0.0] * months
+    occupied = [set() for _ in range(months)]
+    for shop_id, start, end, rent in leases:
+        if end < window_start or start > window_end or end < start:
+            continue
+        for index in range(months):
+            month_start, next_start = month_starts[index], month_starts[index + 1]
+            if start >= next_start or end < month_start:
+                continue
+            days = calendar.monthrange(month_start.year, month_start.month)[1]
+            overlap = (min(end, next_start - timedelta(days=1)) - max(start, month_start)).days + 1
+            revenue[index] += rent * overlap / days
+            active[index] += 1
+            occupied[index].add(shop_id)
+            if end < next_start:
+                expiring[index] += 1
+                at_risk[index] += rent
+    return {
+        'expected_revenue': revenue,
+        'active_leases': active,
+        'expiring_leases': expiring,
+        'revenue_at_risk': at_risk,
+        'occupied_shops': [len(shops) for shops in occupied],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectorized rent roll vs a per-lease Python loop')
+    parser.add_argument('--leases', type=int, default=1000000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--from', dest='first_month', default='2025-01')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db-shops', type=int, default=50000, help='Shops in the mall generated for the endpoint timing')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    shops = max(args.leases // 3, 1)
+    shop_ids, starts, ends, rents = synthetic_leases(args.leases, shops, args.seed)
+    first_month = np.datetime64(args.first_month, 'M')
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        roll = compute_rent_roll(shop_ids, starts, ends, rents, first_month, args.months, shops)
+    numpy_s = (time.perf_counter() - started) / args.repeat
+
+    # The loop gets the leases as Python objects, as rows from the database would be
+    leases = [
+        (shop_id, EPOCH + timedelta(days=start), EPOCH + timedelta(days=end), rent)
+        for shop_id, start, end, rent in zip(shop_ids.tolist(), starts.tolist(), ends.tolist(), rents.tolist())
+    ]
+    started = time.perf_counter()
+    expected = python_rent_roll(leases, date.fromisoformat(f'{args.first_month}-01'), args.months, shops)
+    python_s = time.perf_counter() - started
+
+    mismatches = [name for name, values in expected.items() if not np.allclose(roll[name], values)]
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench_rent_roll.db')
+    mall = generate_mall(database, args.db_shops, 0, seed=args.seed)
+    client = app.test_client()
+    path = f'/api/analytics/rent-roll?months={args.months}&from={args.first_month}'
+    started = time.perf_counter()
+    client.get(path).get_data()
+    cold_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        client.get(path).get_data()
+    cached_ms = (time.perf_counter() - started) / args.repeat * 1000
+
+    print(json.dumps({
+        'leases': args.leases,
+        'months': args.months,
+        'numpy_ms': round(numpy_s * 1000, 3),
+        'python_loop_ms': round(python_s * 1000, 3),
+        'speedup': round(python_s / numpy_s, 1),
+        'mismatches': mismatches,
+        'endpoint': {
+            'leases_in_mall': mall['leases'],
+            'cold_ms': round(cold_ms, 3),
+            'cached_ms': round(cached_ms, 3),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# FTS5 search vs LIKE scans over maintenance tickets: time to the top 20
+# results and to count every match, for common, prefix, multi-word and rare
+# terms. LIKE can stop after 20 rows for common words but has to read the
+# whole table for rare ones and can't rank.
+#
+#   python -m benchmarks.search --maintenance 1000000
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from app import SEARCH_RESULTS, app, search_query
+from benchmarks.datagen import generate_mall
+
+TERMS = ['leak', 'alarm', 'escal', 'water damage', 'sprinkler']
+RARE_TICKETS = 50
+
+
+def timed(conn, sql, params, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        rows = conn.execute(sql, params).fetchall()
+    return round((time.perf_counter() - started) / repeat * 1000, 3), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FTS5 search vs LIKE scans')
+    parser.add_argument('--maintenance', type=int, default=200000)
+    parser.add_argument('--shops', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+    generate_mall(database, args.shops, args.maintenance)
+    conn = sqlite3.connect(database)
+    # A handful of tickets mention a word nothing else does
+    with conn:
+        conn.executemany(
+            'INSERT INTO maintenance (shop_id, description, priority) VALUES (?, ?, ?)',
+            [(1, f'Sprinkler head {i} dripping', 'Low') for i in range(RARE_TICKETS)]
+        )
+
+    _, weights = SEARCH_RESULTS['maintenance']
+    fts_top = f'''
+    SELECT rowid, bm25(maintenance_fts, {', '.join(map(str, weights))}) AS score
+    FROM maintenance_fts WHERE maintenance_fts MATCH ? ORDER BY score LIMIT 20
+    '''
+    fts_count = 'SELECT COUNT(*) FROM maintenance_fts WHERE maintenance_fts MATCH ?'
+
+    results = {}
+    for term in TERMS:
+        words = term.split()
+        like = ' AND '.join(['(description LIKE ? OR resolution_notes LIKE ?)'] * len(words))
+        like_params = [f'%{word}%' for word in words for _ in range(2)]
+        query = search_query(term)
+
+        fts_top_ms, rows = timed(conn, fts_top, (query,), args.repeat)
+        fts_count_ms, count = timed(conn, fts_count, (query,), args.repeat)
+        like_top_ms, _ = timed(conn, f'SELECT id FROM maintenance WHERE {like} LIMIT 20', like_params, args.repeat)
+        like_count_ms, like_count = timed(conn, f'SELECT COUNT(*) FROM maintenance WHERE {like}', like_params, args.repeat)
+        results[term] = {
+            'matches': count[0][0],
+            'like_matches': like_count[0][0],
+            'fts_top20_ms': fts_top_ms,
+            'like_first20_ms': like_top_ms,
+            'fts_count_ms': fts_count_ms,
+            'like_count_ms': like_count_ms,
+        }
+
+    app.config['DATABASE'] = database
+    client = app.test_client()
+    started = time.perf_counter()
+    for term in TERMS:
+        client.get('/api/search', query_string={'q': term}).get_data()
+    endpoint_ms = round((time.perf_counter() - started) / len(TERMS) * 1000, 3)
+
+    conn.close()
+    print(json.dumps({
+        'tickets': args.maintenance + RARE_TICKETS,
+        'database_bytes': os.path.getsize(database),
+        'terms': results,
+        'api_search_avg_ms': endpoint_ms,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# Per-mall databases at portfolio scale: generates --malls small malls in a
+# MALLS_DIR, then times the /api/portfolio endpoints with different numbers
+# of PORTFOLIO_WORKERS threads fanning out over them, and measures routed
+# per-mall requests (/malls/<mall_id>/... and the X-Mall-Id header) from
+# concurrent clients.
+#
+#   python -m benchmarks.shards --malls 100 --shops 200 --maintenance 1000
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from app import app, close_pools
+from benchmarks.datagen import generate_mall
+from benchmarks.loadtest import summarize
+
+MALL_PATHS = [
+    '/api/dashboard/summary',
+    '/api/shops?limit=50',
+    '/api/maintenance?limit=50&status=Pending',
+]
+
+
+def time_endpoint(client, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.json
+        assert not response.json['errors'], response.json['errors']
+    timings.sort()
+    return {
+        'avg_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'p50_ms': round(timings[len(timings) // 2] * 1000, 3),
+        'max_ms': round(timings[-1] * 1000, 3),
+    }
+
+
+def routed_requests(mall_ids, clients, duration, seed):
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def run(client_id):
+        rng = random.Random(seed + client_id)
+        client = app.test_client()
+        local = []
+        failed = 0
+        while not stop.is_set():
+            mall_id = rng.choice(mall_ids)
+            path = rng.choice(MALL_PATHS)
+            started = time.perf_counter()
+            if rng.random() < 0.5:
+                response = client.get(f'/malls/{mall_id}{path}')
+            else:
+                response = client.get(path, headers={app.config['MALL_HEADER']: mall_id})
+            response.get_data()
+            local.append(time.perf_counter() - started)
+            failed += response.status_code != 200
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Portfolio fan-out and routed requests over many mall databases')
+    parser.add_argument('--malls', type=int, default=100)
+    parser.add_argument('--shops', type=int, default=200, help='Shops per mall')
+    parser.add_argument('--maintenance', type=int, default=1000, help='Tickets per mall')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16], help='PORTFOLIO_WORKERS values to time')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent clients for routed requests')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    malls_dir = os.path.join(tempfile.mkdtemp(), 'malls')
+    os.makedirs(malls_dir)
+    started = time.perf_counter()
+    for index in range(args.malls):
+        generate_mall(os.path.join(malls_dir, f'mall-{index:03d}.db'), args.shops, args.maintenance,
+                      seed=args.seed + index)
+    generate_s = round(time.perf_counter() - started, 1)
+
+    app.config['DATABASE'] = os.path.join(malls_dir, 'mall-000.db')
+    app.config['MALLS_DIR'] = malls_dir
+    # One pool per mall; keep them small so 100 malls don't hold 500 connections
+    app.config['DB_POOL_SIZE'] = 2
+    close_pools()
+    client = app.test_client()
+    mall_ids = client.get('/api/malls').json['malls']
+
+    portfolio = {}
+    for workers in args.workers:
+        app.config['PORTFOLIO_WORKERS'] = workers
+        # The first request opens each mall's pool, the rest reuse them
+        client.get('/api/portfolio/dashboard').get_data()
+        portfolio[workers] = {
+            'dashboard': time_endpoint(client, '/api/portfolio/dashboard', args.repeat),
+            'occupancy': time_endpoint(client, '/api/portfolio/occupancy', args.repeat),
+        }
+
+    totals = client.get('/api/portfolio/occupancy').json['totals']
+    print(json.dumps({
+        'malls': len(mall_ids),
+        'shops': totals['shops'],
+        'generate_s': generate_s,
+        'portfolio_by_workers': portfolio,
+        'routed_requests': routed_requests(mall_ids, args.clients, args.duration, args.seed),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
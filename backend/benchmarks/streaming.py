@@ -0,0 +1,96 @@
+# Peak memory and time-to-first-byte of GET /api/maintenance as a single
+# jsonify() response versus the streamed JSON array and NDJSON modes.
+#
+#   python -m benchmarks.streaming --rows 100000
+#
+# Each mode runs in its own process so peak RSS is measured independently.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = {
+    'jsonify': '/api/maintenance',
+    'stream_json': '/api/maintenance?stream=json',
+    'stream_ndjson': '/api/maintenance?stream=ndjson',
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def create_database(path, rows):
+    from app import app, init_db, get_db
+
+    app.config['DATABASE'] = path
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        conn.executemany(
+            'INSERT INTO maintenance (shop_id, description, reported_date, status, priority) VALUES (?, ?, ?, ?, ?)',
+            ((1 + i % 4, f'Benchmark ticket {i} - replace the light fixture on the east wall',
+              '2024-01-01 09:00:00', 'Completed', 'Low') for i in range(rows))
+        )
+        conn.commit()
+
+
+def measure(path, mode):
+    from app import app
+
+    app.config['DATABASE'] = path
+    client = app.test_client()
+    baseline = peak_rss_mb()
+
+    started = time.perf_counter()
+    response = client.get(MODES[mode], buffered=False)
+    chunks = response.iter_encoded()
+    size = len(next(chunks))
+    first_byte = time.perf_counter() - started
+    for chunk in chunks:
+        size += len(chunk)
+    total = time.perf_counter() - started
+    response.close()
+
+    return {
+        'mode': mode,
+        'time_to_first_byte_ms': round(first_byte * 1000, 1),
+        'total_time_ms': round(total * 1000, 1),
+        'response_bytes': size,
+        'peak_rss_growth_mb': round(peak_rss_mb() - baseline, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='jsonify vs streamed list responses')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--measure', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.database, args.measure)))
+        return
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench_streaming.db')
+    create_database(database, args.rows)
+
+    results = []
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.streaming', '--measure', mode, '--database', database],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output)
+        result['rows'] = args.rows
+        results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
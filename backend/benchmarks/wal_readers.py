@@ -0,0 +1,75 @@
+# Read throughput while a writer is continuously inserting rows.
+# Compares the default rollback journal against WAL mode.
+#
+#   python -m benchmarks.wal_readers --duration 5 --readers 4
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from app import app, init_db
+
+
+def run(journal_mode, duration, readers):
+    workdir = tempfile.mkdtemp()
+    app.config['DATABASE'] = os.path.join(workdir, f'bench_{journal_mode.lower()}.db')
+    app.config['DB_JOURNAL_MODE'] = journal_mode
+    app.config['DB_POOL_SIZE'] = readers + 1
+    with app.app_context():
+        init_db()
+
+    client = app.test_client()
+    stop = threading.Event()
+    counts = {'reads': 0, 'read_errors': 0, 'writes': 0, 'write_errors': 0}
+    lock = threading.Lock()
+
+    def writer():
+        while not stop.is_set():
+            response = client.post('/api/maintenance', json={
+                'shop_id': 1,
+                'description': 'Benchmark ticket',
+                'priority': 'Low',
+            })
+            with lock:
+                counts['writes' if response.status_code == 201 else 'write_errors'] += 1
+
+    def reader():
+        while not stop.is_set():
+            response = client.get('/api/shops')
+            with lock:
+                counts['reads' if response.status_code == 200 else 'read_errors'] += 1
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'journal_mode': journal_mode,
+        'readers': readers,
+        'duration': duration,
+        'reads_per_second': round(counts['reads'] / duration, 1),
+        'writes_per_second': round(counts['writes'] / duration, 1),
+        'read_errors': counts['read_errors'],
+        'write_errors': counts['write_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read throughput during sustained writes')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    results = [run(mode, args.duration, args.readers) for mode in ('DELETE', 'WAL')]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
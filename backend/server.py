@@ -0,0 +1,272 @@
+# Pre-fork production server behind `flask --app app serve`.
+#
+# The master process applies migrations once, opens the listening socket and
+# starts WORKERS worker processes that all accept connections from it. Each
+# worker is a fresh interpreter running the threaded WSGI server, so a reload
+# picks up new code. Workers queue their writes on a lock file per database,
+# so only one process at a time writes to each shared WAL database.
+#
+# Signals to the master:
+#   TERM/INT - stop: workers finish in-flight requests, then exit
+#   HUP      - graceful reload: start new workers, wait until they're ready,
+#              then stop the old ones
+#
+# The worker in slot 0 runs the background jobs. On a reload its replacement
+# starts without them and the master sends it USR1 to take them over once the
+# old worker has stopped, so two workers never run the jobs at once.
+#
+# A worker that has served --max-requests requests (plus up to
+# --max-requests-jitter more, so they don't all restart together) finishes
+# and is replaced, as is any worker that dies.
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+logger = logging.getLogger('emall.server')
+
+
+class Worker:
+    def __init__(self, slot, process, ready_fd):
+        self.slot = slot
+        self.process = process
+        self.ready_fd = ready_fd
+        self.started = time.monotonic()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+class Master:
+    def __init__(self, database, host='127.0.0.1', port=8000, workers=2, max_requests=0,
+                 max_requests_jitter=0, graceful_timeout=30.0, writer_lock=None, malls_dir=None):
+        self.database = database
+        self.host = host
+        self.port = port
+        self.worker_count = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.writer_lock = writer_lock or '{database}.writer-lock'
+        self.malls_dir = malls_dir
+        self.workers = {}
+        self.socket = None
+        self._stopping = False
+        self._reloading = False
+
+    def run(self):
+        self.socket = socket.create_server((self.host, self.port), backlog=1024)
+        # Non-blocking, so a worker that loses the race for a connection
+        # goes back to select() instead of hanging in accept()
+        self.socket.setblocking(False)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        logger.info('Listening on http://%s:%s with %s workers (master pid %s)',
+                    self.host, self.socket.getsockname()[1], self.worker_count, os.getpid())
+
+        started = [self.spawn(slot) for slot in range(self.worker_count)]
+        self.wait_ready(started)
+        self.workers = {worker.slot: worker for worker in started}
+        try:
+            while not self._stopping:
+                if self._reloading:
+                    self._reloading = False
+                    self.reload()
+                self.replace_exited()
+                time.sleep(0.5)
+        finally:
+            self.stop(list(self.workers.values()))
+            self.socket.close()
+        logger.info('Shut down')
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self._reloading = True
+
+    def spawn(self, slot, run_jobs=None):
+        if run_jobs is None:
+            run_jobs = slot == 0
+        ready_read, ready_write = os.pipe()
+        env = dict(
+            os.environ,
+            FLASK_DATABASE=self.database,
+            FLASK_WRITER_LOCK_FILE=self.writer_lock,
+            FLASK_MALLS_DIR=self.malls_dir or '',
+            EMALL_LISTEN_FD=str(self.socket.fileno()),
+            EMALL_LISTEN_ADDRESS=f'{self.host}:{self.socket.getsockname()[1]}',
+            EMALL_READY_FD=str(ready_write),
+            EMALL_MAX_REQUESTS=str(self.max_requests + random.randint(0, self.max_requests_jitter)
+                                   if self.max_requests else 0),
+            EMALL_GRACEFUL_TIMEOUT=str(self.graceful_timeout),
+            EMALL_RUN_JOBS='1' if run_jobs else '',
+        )
+        here = os.path.dirname(os.path.abspath(__file__))
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(here, 'server.py'), 'worker'],
+            env=env, cwd=here, pass_fds=(self.socket.fileno(), ready_write)
+        )
+        os.close(ready_write)
+        logger.info('Started worker %s (pid %s)', slot, process.pid)
+        return Worker(slot, process, ready_read)
+
+    # Wait until each worker says it's serving, or exits; returns the ready ones
+    def wait_ready(self, workers, timeout=30.0):
+        pending = {worker.ready_fd: worker for worker in workers}
+        ready = []
+        deadline = time.monotonic() + timeout
+        while pending and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(pending), [], [], max(0, deadline - time.monotonic()))
+            for fd in readable:
+                worker = pending.pop(fd)
+                if os.read(fd, 1):
+                    ready.append(worker)
+                else:
+                    logger.error('Worker %s (pid %s) exited before it was ready', worker.slot, worker.pid)
+                os.close(fd)
+        for fd, worker in pending.items():
+            logger.error('Worker %s (pid %s) was not ready after %ss', worker.slot, worker.pid, timeout)
+            os.close(fd)
+        return ready
+
+    # Start a full set of new workers and only stop the old ones once all of
+    # them are serving; if any fail, keep the old set. The background jobs
+    # move to the new slot 0 worker after the old one has stopped.
+    def reload(self):
+        logger.info('Reloading workers')
+        fresh = [self.spawn(slot, run_jobs=False) for slot in range(self.worker_count)]
+        ready = self.wait_ready(fresh)
+        if len(ready) < len(fresh):
+            logger.error('Reload failed, keeping the current workers')
+            self.stop(fresh)
+            return
+        old = list(self.workers.values())
+        self.workers = {worker.slot: worker for worker in fresh}
+        self.stop(old)
+        if fresh[0].process.poll() is None:
+            fresh[0].process.send_signal(signal.SIGUSR1)
+        logger.info('Reload complete')
+
+    def replace_exited(self):
+        for slot, worker in list(self.workers.items()):
+            code = worker.process.poll()
+            if code is None or self._stopping:
+                continue
+            if code == 0:
+                logger.info('Worker %s (pid %s) recycled', slot, worker.pid)
+            else:
+                logger.warning('Worker %s (pid %s) exited with status %s', slot, worker.pid, code)
+                # Don't spin if a worker keeps dying straight after starting
+                if time.monotonic() - worker.started < 1:
+                    time.sleep(1)
+            replacement = self.spawn(slot)
+            self.wait_ready([replacement])
+            self.workers[slot] = replacement
+
+    def stop(self, workers):
+        for worker in workers:
+            if worker.process.poll() is None:
+                worker.process.terminate()
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        for worker in workers:
+            try:
+                worker.process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.warning('Worker %s (pid %s) did not stop in time, killing it', worker.slot, worker.pid)
+                worker.process.kill()
+                worker.process.wait()
+
+
+# Counts requests in flight and served, and asks the worker to finish once
+# it has served max_requests
+class RequestCounter:
+    def __init__(self, wsgi_app, max_requests, on_limit):
+        self.wsgi_app = wsgi_app
+        self.max_requests = max_requests
+        self.on_limit = on_limit
+        self.served = 0
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        with self._cond:
+            self.active += 1
+        try:
+            response = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        # Streamed responses count as in flight until they are closed
+        return ClosingIterator(response, self._finished)
+
+    def _finished(self):
+        with self._cond:
+            self.active -= 1
+            self.served += 1
+            limit_reached = self.max_requests and self.served == self.max_requests
+            self._cond.notify_all()
+        if limit_reached:
+            self.on_limit()
+
+    def wait_idle(self, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: self.active == 0, timeout)
+
+
+def run_worker():
+    from app import app, close_pools, draining, start_background_jobs, stop_background_jobs
+
+    graceful_timeout = float(os.environ['EMALL_GRACEFUL_TIMEOUT'])
+    shutdown_started = threading.Event()
+
+    def shutdown():
+        if shutdown_started.is_set():
+            return
+        shutdown_started.set()
+        # /readyz reports 503 from here on; shutdown() blocks until
+        # serve_forever() returns, so it can't run on the serving thread
+        draining.set()
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    counter = RequestCounter(app, int(os.environ['EMALL_MAX_REQUESTS']), shutdown)
+    host, port = os.environ['EMALL_LISTEN_ADDRESS'].rsplit(':', 1)
+    server = make_server(host, int(port), counter, threaded=True, fd=int(os.environ['EMALL_LISTEN_FD']))
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: shutdown())
+    # The master decides when to reload
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    # USR1 hands this worker the background jobs after a reload
+    def take_jobs(signum, frame):
+        if not shutdown_started.is_set():
+            start_background_jobs()
+
+    signal.signal(signal.SIGUSR1, take_jobs)
+    if os.environ.get('EMALL_RUN_JOBS'):
+        start_background_jobs()
+    ready_fd = int(os.environ['EMALL_READY_FD'])
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+
+    server.serve_forever()
+    if not counter.wait_idle(graceful_timeout):
+        logger.warning('Worker %s stopping with %s requests still in flight', os.getpid(), counter.active)
+    stop_background_jobs()
+    close_pools()
+
+
+if __name__ == '__main__' and sys.argv[1:] == ['worker']:
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s in %(name)s: %(message)s')
+    run_worker()
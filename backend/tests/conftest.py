@@ -0,0 +1,63 @@
+import pytest
+
+from app import app, close_pools, get_pool, init_db
+
+
+# A freshly migrated database in a temporary directory for each test
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'emall.db')
+    monkeypatch.setitem(app.config, 'DATABASE', path)
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_LOG', '')
+    monkeypatch.setitem(app.config, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    close_pools()
+    with app.app_context():
+        init_db()
+    yield path
+    close_pools()
+
+
+@pytest.fixture
+def client(database):
+    return app.test_client()
+
+
+# A pooled connection to the test database, outside any app context so
+# requests made by the test client don't share it
+@pytest.fixture
+def conn(database):
+    pool = get_pool()
+    conn = pool.acquire()
+    yield conn
+    conn.rollback()
+    pool.release(conn)
+
+
+@pytest.fixture
+def make_shop(client):
+    def make(name='Shop', **fields):
+        response = client.post('/api/shops', json={'name': name, 'rent': 1000, **fields})
+        assert response.status_code == 201, response.json
+        return response.json['id']
+    return make
+
+
+@pytest.fixture
+def make_tenant(client):
+    def make(name='Tenant', **fields):
+        response = client.post('/api/tenants', json={'name': name, **fields})
+        assert response.status_code == 201, response.json
+        return response.json['id']
+    return make
+
+
+@pytest.fixture
+def make_lease(client):
+    def make(tenant_id, shop_id, start_date='2025-01-01', end_date='2099-12-31', **fields):
+        response = client.post('/api/leases', json={
+            'tenant_id': tenant_id, 'shop_id': shop_id, 'start_date': start_date,
+            'end_date': end_date, 'rent_amount': 1000, **fields,
+        })
+        assert response.status_code == 201, response.json
+        return response.json['id']
+    return make
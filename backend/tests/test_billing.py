@@ -0,0 +1,83 @@
+def invoices_by_lease(conn, period):
+    rows = conn.execute('SELECT lease_id, days, amount FROM invoice WHERE period = ?', (period,))
+    return {row['lease_id']: (row['days'], row['amount']) for row in rows}
+
+
+def test_billing_run_is_idempotent(client, conn, make_shop, make_tenant, make_lease):
+    tenant = make_tenant()
+    full = make_lease(tenant, make_shop('Full month'))
+    partial = make_lease(tenant, make_shop('From the 16th'), start_date='2026-03-16')
+    ended = make_lease(tenant, make_shop('Ended'), end_date='2026-02-28')
+
+    first = client.post('/api/billing/runs', json={'period': '2026-03'})
+    assert first.status_code == 201
+    assert first.json['status'] == 'Completed'
+    invoices = invoices_by_lease(conn, '2026-03')
+    assert invoices[full] == (31, 1000)
+    assert invoices[partial] == (16, round(1000 * 16 / 31, 2))
+    assert ended not in invoices
+    assert first.json['invoices_created'] == first.json['invoices_total'] == len(invoices)
+
+    second = client.post('/api/billing/runs', json={'period': '2026-03'})
+    assert second.status_code == 201
+    assert second.json['id'] != first.json['id']
+    assert second.json['invoices_created'] == 0
+    assert second.json['invoices_total'] == len(invoices)
+    assert invoices_by_lease(conn, '2026-03') == invoices
+
+
+def test_interrupted_run_resumes(client, conn, make_shop, make_tenant, make_lease, monkeypatch):
+    from app import app
+    tenant = make_tenant()
+    for i in range(6):
+        make_lease(tenant, make_shop(f'Shop {i}'))
+    monkeypatch.setitem(app.config, 'BILLING_CHUNK_SIZE', 2)
+    run = client.post('/api/billing/runs', json={'period': '2026-04'}).json
+    expected = invoices_by_lease(conn, '2026-04')
+
+    # Put the database back the way a run killed after its second chunk leaves it
+    last_id = conn.execute('SELECT id FROM lease ORDER BY id LIMIT 1 OFFSET 3').fetchone()[0]
+    conn.execute("DELETE FROM invoice WHERE period = '2026-04' AND lease_id > ?", (last_id,))
+    conn.execute('''
+    UPDATE billing_run SET status = 'Running', finished_at = NULL, last_lease_id = ?, chunks = 2
+    WHERE id = ?
+    ''', (last_id, run['id']))
+    conn.commit()
+
+    resumed = client.post('/api/billing/runs', json={'period': '2026-04'}).json
+    assert resumed['id'] == run['id']
+    assert resumed['resumed'] == 1
+    assert resumed['status'] == 'Completed'
+    assert invoices_by_lease(conn, '2026-04') == expected
+    assert conn.execute('SELECT COUNT(*) FROM billing_run').fetchone()[0] == 1
+
+
+def test_billing_period_is_validated(client):
+    response = client.post('/api/billing/runs', json={'period': 'March'})
+    assert response.status_code == 400
+
+
+def test_billing_run_invoices_leases_by_period(client, conn, make_shop, make_tenant, make_lease):
+    tenant = make_tenant()
+    expired = make_lease(tenant, make_shop('Expired mid-month'), end_date='2026-03-10', status='Expired')
+    pending = make_lease(tenant, make_shop('Pending'), start_date='2026-03-21', status='Pending')
+    terminated = make_lease(tenant, make_shop('Terminated'), status='Terminated')
+
+    client.post('/api/billing/runs', json={'period': '2026-03'})
+    invoices = invoices_by_lease(conn, '2026-03')
+    assert invoices[expired] == (10, round(1000 * 10 / 31, 2))
+    assert invoices[pending] == (11, round(1000 * 11 / 31, 2))
+    assert terminated not in invoices
+
+
+def test_billing_run_list_changes_etag(client):
+    first = client.get('/api/billing/runs')
+    assert client.get('/api/billing/runs', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # A run that invoices nothing still changes the run list
+    run = client.post('/api/billing/runs', json={'period': '2026-03'}).json
+    assert run['invoices_created'] == 0
+    second = client.get('/api/billing/runs', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert [entry['id'] for entry in second.json] == [run['id']]
+    assert client.get(f"/api/billing/runs/{run['id']}").json['status'] == 'Completed'
@@ -0,0 +1,22 @@
+def test_csv_import(client, conn):
+    response = client.post('/api/bulk/shops', data='name,location,rent\nKiosk A,Level 1,900\n,Level 2,800\n',
+                           content_type='text/csv')
+    assert response.status_code == 200
+    assert (response.json['inserted'], response.json['failed']) == (1, 1)
+    assert response.json['errors'] == [{'row': 2, 'error': 'name is required'}]
+    assert conn.execute("SELECT rent FROM shop WHERE name = 'Kiosk A'").fetchone()[0] == 900
+
+
+def test_csv_that_isnt_utf8_is_rejected(client):
+    response = client.post('/api/bulk/shops', data='name,location\nCafé,Level 1\n'.encode('latin-1'),
+                           content_type='text/csv')
+    assert response.status_code == 400
+    assert response.json['error'] == 'CSV data must be UTF-8 encoded'
+
+
+def test_invalid_ndjson_lines_are_reported(client):
+    response = client.post('/api/bulk/shops', data='{"name": "Kiosk B"}\nnot json\n[1]\n',
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.json['inserted'] == 1
+    assert [error['row'] for error in response.json['errors']] == [2, 3]
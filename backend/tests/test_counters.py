@@ -0,0 +1,39 @@
+from app import check_counters
+
+
+def test_counters_follow_writes(client, conn, make_shop, make_tenant, make_lease):
+    before = client.get('/api/dashboard/summary').json
+    shops = [make_shop(f'Shop {i}') for i in range(3)]
+    tenants = [make_tenant(f'Tenant {i}') for i in range(2)]
+    lease_id = make_lease(tenants[0], shops[0])
+    make_lease(tenants[1], shops[1])
+    ticket = client.post('/api/maintenance', json={'shop_id': shops[2], 'description': 'Leak', 'priority': 'High'})
+    assert ticket.status_code == 201
+    assert check_counters(conn) == []
+
+    assert client.post(f"/api/maintenance/{ticket.json['id']}/complete",
+                       json={'resolution_notes': 'Fixed'}).status_code == 200
+    lease = client.get(f'/api/leases/{lease_id}').json
+    assert client.put(f'/api/leases/{lease_id}', json={**lease, 'status': 'Terminated'}).status_code == 200
+    assert client.delete(f'/api/tenants/{tenants[1]}?cascade=true').status_code == 200
+    assert client.delete(f'/api/shops/{shops[2]}?cascade=true').status_code == 200
+    assert check_counters(conn) == []
+
+    after = client.get('/api/dashboard/summary').json
+    assert after['total_shops'] == before['total_shops'] + 2
+    assert after['total_tenants'] == before['total_tenants'] + 1
+    assert after['pending_maintenance'] == before['pending_maintenance']
+
+
+def test_check_counters_reports_drift(conn):
+    shops = conn.execute('SELECT COUNT(*) FROM shop').fetchone()[0]
+    conn.execute('UPDATE mall_counters SET total_shops = total_shops + 5')
+    conn.commit()
+    assert check_counters(conn) == [f'mall_counters[total_shops]: stored {shops + 5}, expected {shops}']
+
+
+def test_completing_maintenance_sets_resolved_date(client, make_shop):
+    ticket_id = client.post('/api/maintenance', json={'shop_id': make_shop(), 'description': 'Door'}).json['id']
+    ticket = client.get(f'/api/maintenance/{ticket_id}').json
+    assert client.put(f'/api/maintenance/{ticket_id}', json={**ticket, 'status': 'Completed'}).status_code == 200
+    assert client.get(f'/api/maintenance/{ticket_id}').json['resolved_date']
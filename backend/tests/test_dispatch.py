@@ -0,0 +1,76 @@
+import pytest
+
+
+@pytest.fixture
+def tickets(client, conn, make_shop):
+    # Only this test's tickets are pending
+    conn.execute("UPDATE maintenance SET status = 'Completed' WHERE status != 'Completed'")
+    conn.commit()
+    shops = [make_shop('North'), make_shop('South')]
+
+    def ticket(shop_id, priority, reported_date='2026-01-01'):
+        response = client.post('/api/maintenance', json={
+            'shop_id': shop_id, 'description': f'{priority} ticket', 'priority': priority,
+            'reported_date': reported_date,
+        })
+        assert response.status_code == 201
+        return response.json['id']
+
+    low = ticket(shops[0], 'Low')
+    high = ticket(shops[1], 'High', '2026-01-02')
+    high_old = ticket(shops[0], 'High', '2025-12-15')
+    critical = ticket(shops[1], 'Critical')
+    medium = ticket(shops[0], 'Medium')
+    medium_same_day = ticket(shops[1], 'Medium')
+    # Priority first, then the oldest report, then the first reported
+    return [critical, high_old, high, medium, medium_same_day, low]
+
+
+@pytest.fixture
+def technicians(client):
+    return [client.post('/api/technicians', json={'name': f'Technician {i}'}).json['id'] for i in range(2)]
+
+
+def test_next_claims_in_dispatch_order(client, tickets, technicians):
+    queue = client.get('/api/maintenance/queue?limit=10').json
+    assert queue['pending'] == len(tickets)
+    assert [item['id'] for item in queue['items']] == tickets
+
+    claimed = []
+    for i in range(len(tickets)):
+        response = client.post('/api/maintenance/next', json={'technician_id': technicians[i % 2]})
+        assert response.status_code == 200
+        assert response.json['ticket']['status'] == 'In Progress'
+        assert response.json['claim']['technician_id'] == technicians[i % 2]
+        claimed.append(response.json['ticket']['id'])
+    assert claimed == tickets
+    assert client.post('/api/maintenance/next', json={'technician_id': technicians[0]}).json['ticket'] is None
+
+
+def test_claims_are_exclusive(client, tickets, technicians):
+    first, second = technicians
+    assert client.post(f'/api/maintenance/{tickets[2]}/claim', json={'technician_id': first}).status_code == 200
+    assert client.post(f'/api/maintenance/{tickets[2]}/claim', json={'technician_id': second}).status_code == 409
+    # Claimed directly, so /next skips it
+    assert client.post('/api/maintenance/next', json={'technician_id': second}).json['ticket']['id'] == tickets[0]
+    assert client.post('/api/maintenance/next', json={'technician_id': second}).json['ticket']['id'] == tickets[1]
+    assert client.post('/api/maintenance/next', json={'technician_id': second}).json['ticket']['id'] == tickets[3]
+
+    assert client.post(f'/api/maintenance/{tickets[0]}/release', json={'technician_id': first}).status_code == 409
+    assert client.post(f'/api/maintenance/{tickets[0]}/release', json={'technician_id': second}).status_code == 200
+    assert client.post('/api/maintenance/next', json={'technician_id': first}).json['ticket']['id'] == tickets[0]
+
+
+def test_expired_claim_goes_back_in_order(client, conn, tickets, technicians):
+    first, second = technicians
+    assert client.post('/api/maintenance/next', json={'technician_id': first}).json['ticket']['id'] == tickets[0]
+    assert client.post('/api/maintenance/next', json={'technician_id': first}).json['ticket']['id'] == tickets[1]
+    conn.execute("UPDATE maintenance_claim SET expires_at = datetime('now', '-1 second') WHERE maintenance_id = ?",
+                 (tickets[0],))
+    conn.commit()
+
+    # The requeued ticket comes before the lower priority ones still waiting
+    response = client.post('/api/maintenance/next', json={'technician_id': second})
+    assert response.json['ticket']['id'] == tickets[0]
+    assert response.json['claim']['technician_id'] == second
+    assert client.post('/api/maintenance/next', json={'technician_id': second}).json['ticket']['id'] == tickets[2]
@@ -0,0 +1,27 @@
+import csv
+import io
+import json
+
+from app import CHANGE_LOG_COLUMNS
+
+
+def test_csv_export_has_only_data_columns(client, conn):
+    response = client.get('/api/export/lease?format=csv')
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == CHANGE_LOG_COLUMNS['lease']
+    assert 'row_version' not in rows[0]
+    assert len(rows) - 1 == conn.execute('SELECT COUNT(*) FROM lease').fetchone()[0]
+
+
+def test_columnar_export(client, conn):
+    response = client.get('/api/export/shop?format=columnar')
+    assert response.status_code == 200
+    groups = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert all(list(group) == CHANGE_LOG_COLUMNS['shop'] for group in groups)
+    ids = [shop_id for group in groups for shop_id in group['id']]
+    assert ids == [row[0] for row in conn.execute('SELECT id FROM shop ORDER BY id')]
+
+
+def test_unknown_table(client):
+    assert client.get('/api/export/change_log').status_code == 404
@@ -0,0 +1,52 @@
+from app import check_counters
+
+
+def tenant_shop(client, tenant_id):
+    return client.get(f'/api/tenants/{tenant_id}').json['shop_id']
+
+
+def test_status_change_moves_tenants(client, conn, make_shop, make_tenant, make_lease):
+    shops = [make_shop(f'Shop {i}') for i in range(3)]
+    moving, staying = make_tenant('Moving'), make_tenant('Staying')
+    second = make_lease(moving, shops[1], status='Expired')
+    first = make_lease(moving, shops[0])
+    kept = make_lease(staying, shops[2])
+    assert tenant_shop(client, moving) == shops[0]
+
+    response = client.post('/api/leases/batch', json={'filter': {'ids': [first]}, 'changes': {'status': 'Terminated'}})
+    assert response.status_code == 200
+    assert response.json['updated'] == 1
+    assert tenant_shop(client, moving) is None
+
+    response = client.post('/api/leases/batch', json={'filter': {'ids': [second, kept]}, 'changes': {'status': 'Active'}})
+    assert response.status_code == 200
+    assert tenant_shop(client, moving) == shops[1]
+    assert tenant_shop(client, staying) == shops[2]
+    assert check_counters(conn) == []
+
+
+def test_tenant_keeps_a_shop_they_still_lease(client, make_shop, make_tenant, make_lease):
+    shops = [make_shop(f'Shop {i}') for i in range(2)]
+    tenant = make_tenant()
+    make_lease(tenant, shops[0])
+    ending = make_lease(tenant, shops[1])
+    assert tenant_shop(client, tenant) == shops[1]
+
+    client.post('/api/leases/batch', json={'filter': {'ids': [ending]}, 'changes': {'status': 'Expired'}})
+    assert tenant_shop(client, tenant) == shops[0]
+
+
+def test_dry_run_and_other_changes_leave_tenants(client, make_shop, make_tenant, make_lease):
+    shop = make_shop()
+    tenant = make_tenant()
+    lease_id = make_lease(tenant, shop)
+
+    response = client.post('/api/leases/batch', json={
+        'filter': {'ids': [lease_id]}, 'changes': {'status': 'Terminated'}, 'dry_run': True,
+    })
+    assert response.status_code == 200, response.json
+    assert response.json['diff'][0]['changes']['status'] == {'old': 'Active', 'new': 'Terminated'}
+    assert tenant_shop(client, tenant) == shop
+
+    client.post('/api/leases/batch', json={'filter': {'ids': [lease_id]}, 'changes': {'rent_increase_pct': 5}})
+    assert tenant_shop(client, tenant) == shop
@@ -0,0 +1,142 @@
+import pytest
+
+import app as emall
+from app import LEASE_OVERLAP_ERROR
+
+
+def test_overlapping_active_lease_is_rejected(client, make_shop, make_tenant, make_lease):
+    shop = make_shop()
+    tenant = make_tenant()
+    existing = make_lease(tenant, shop, start_date='2026-01-01', end_date='2026-12-31')
+
+    response = client.post('/api/leases', json={
+        'tenant_id': make_tenant('Other'), 'shop_id': shop, 'start_date': '2026-12-31',
+        'end_date': '2027-06-30', 'rent_amount': 900,
+    })
+    assert response.status_code == 400
+    assert str(existing) in response.json['error']
+
+    # Back to back is fine, and so is an overlapping lease that isn't active
+    make_lease(make_tenant('Next'), shop, start_date='2027-01-01', end_date='2027-12-31')
+    make_lease(make_tenant('Draft'), shop, start_date='2026-06-01', end_date='2026-06-30', status='Pending')
+
+
+def test_lease_dates_are_validated(client, make_shop, make_tenant):
+    response = client.post('/api/leases', json={
+        'tenant_id': make_tenant(), 'shop_id': make_shop(), 'start_date': '2026-05-01',
+        'end_date': '2026-04-01', 'rent_amount': 900,
+    })
+    assert response.status_code == 400
+
+
+def test_tenant_with_lease_rejects_overlap(client, conn, make_shop, make_tenant, make_lease):
+    shop = make_shop()
+    existing = make_lease(make_tenant(), shop, start_date='2026-01-01', end_date='2026-12-31')
+    payload = {
+        'tenant': {'name': 'Newcomer', 'shop_id': shop},
+        'lease': {'start_date': '2026-06-01', 'end_date': '2027-05-31', 'rent_amount': 800},
+    }
+
+    response = client.post('/api/tenant-with-lease', json=payload)
+    assert response.status_code == 400
+    assert f'(lease {existing})' in response.json['error']
+    assert conn.execute("SELECT COUNT(*) FROM tenant WHERE name = 'Newcomer'").fetchone()[0] == 0
+
+    # A lease starting after the current one ends is accepted
+    payload['lease'].update(start_date='2027-01-01', end_date='2027-12-31')
+    response = client.post('/api/tenant-with-lease', json=payload)
+    assert response.status_code == 200
+    lease = client.get(f"/api/leases/{response.json['lease_id']}").json
+    assert (lease['shop_id'], lease['start_date'], lease['status']) == (shop, '2027-01-01', 'Active')
+
+    payload['lease'].update(end_date='2026-12-01')
+    assert client.post('/api/tenant-with-lease', json=payload).status_code == 400
+
+
+def test_tenant_with_lease_moves_existing_lease(client, make_shop, make_tenant, make_lease):
+    taken, free = make_shop('Taken'), make_shop('Free')
+    make_lease(make_tenant(), taken, start_date='2026-01-01', end_date='2026-12-31')
+    tenant = make_tenant('Mover')
+    lease_id = make_lease(tenant, free, start_date='2026-01-01', end_date='2026-12-31')
+    payload = {
+        'tenant': {'name': 'Mover', 'shop_id': taken},
+        'lease': {'start_date': '2026-03-01', 'end_date': '2026-12-31', 'rent_amount': 800},
+    }
+
+    response = client.post(f'/api/tenant-with-lease/{tenant}', json=payload)
+    assert response.status_code == 400
+    assert client.get(f'/api/leases/{lease_id}').json['shop_id'] == free
+
+    # Its own lease doesn't count as a conflict
+    payload['tenant']['shop_id'] = free
+    response = client.post(f'/api/tenant-with-lease/{tenant}', json=payload)
+    assert response.status_code == 200
+    assert response.json['lease_id'] == lease_id
+
+
+def test_tenant_simple_rejects_overlap(client, make_shop, make_tenant, make_lease):
+    shop = make_shop()
+    existing = make_lease(make_tenant(), shop)
+
+    response = client.post('/api/tenant-simple', json={'name': 'Newcomer', 'shop_id': shop})
+    assert response.status_code == 400
+    assert f'(lease {existing})' in response.json['error']
+
+    # Only active leases overlapping the default year block it
+    client.put(f'/api/leases/{existing}', json={**client.get(f'/api/leases/{existing}').json, 'status': 'Terminated'})
+    response = client.post('/api/tenant-simple', json={'name': 'Newcomer', 'shop_id': shop})
+    assert response.status_code == 201
+
+
+def test_lease_id_in_the_payload_doesnt_skip_the_check(client, make_shop, make_tenant, make_lease):
+    shop = make_shop()
+    existing = make_lease(make_tenant(), shop, start_date='2026-01-01', end_date='2026-12-31')
+    response = client.post('/api/leases', json={
+        'id': existing, 'tenant_id': make_tenant('Other'), 'shop_id': shop, 'start_date': '2026-06-01',
+        'end_date': '2026-06-30', 'rent_amount': 900,
+    })
+    assert response.status_code == 400
+    assert f'(lease {existing})' in response.json['error']
+
+
+@pytest.mark.parametrize('start_date', ['2026-5-01', '2026-05-01T00:00', '2026-05-01 garbage', 20260501])
+def test_lease_dates_must_be_exactly_yyyy_mm_dd(client, make_shop, make_tenant, start_date):
+    response = client.post('/api/leases', json={
+        'tenant_id': make_tenant(), 'shop_id': make_shop(), 'start_date': start_date,
+        'end_date': '2026-12-31', 'rent_amount': 900,
+    })
+    assert response.status_code == 400
+    assert response.json['error'] == 'Dates must be YYYY-MM-DD'
+
+
+# A write that gets past the check, e.g. racing another writer, is stopped by
+# the lease_overlap_* triggers and answered the same way
+@pytest.mark.parametrize('route', ['create', 'update', 'tenant-with-lease', 'tenant-simple'])
+def test_overlap_caught_by_the_trigger(client, conn, make_shop, make_tenant, make_lease, monkeypatch, route):
+    shop = make_shop()
+    make_lease(make_tenant(), shop, start_date='2025-01-01', end_date='2099-12-31')
+    tenant = make_tenant('Other')
+    pending = make_lease(tenant, shop, start_date='2026-06-01', end_date='2026-06-30', status='Pending')
+    monkeypatch.setattr(emall, 'overlapping_lease', lambda *args: None)
+    leases = conn.execute('SELECT COUNT(*) FROM lease').fetchone()[0]
+
+    if route == 'create':
+        response = client.post('/api/leases', json={
+            'tenant_id': tenant, 'shop_id': shop, 'start_date': '2026-06-01', 'end_date': '2026-06-30',
+            'rent_amount': 900,
+        })
+    elif route == 'update':
+        response = client.put(f'/api/leases/{pending}', json={**client.get(f'/api/leases/{pending}').json,
+                                                               'status': 'Active'})
+    elif route == 'tenant-with-lease':
+        response = client.post('/api/tenant-with-lease', json={
+            'tenant': {'name': 'Newcomer', 'shop_id': shop},
+            'lease': {'start_date': '2026-06-01', 'end_date': '2026-06-30', 'rent_amount': 800},
+        })
+    else:
+        response = client.post('/api/tenant-simple', json={'name': 'Newcomer', 'shop_id': shop})
+
+    assert response.status_code == 400
+    assert response.json['error'] == LEASE_OVERLAP_ERROR
+    assert conn.execute('SELECT COUNT(*) FROM lease').fetchone()[0] == leases
+    assert client.get(f'/api/leases/{pending}').json['status'] == 'Pending'
@@ -0,0 +1,91 @@
+import os
+import re
+import shutil
+
+import pytest
+
+from app import CHANGE_LOG_COLUMNS, MIGRATIONS, app, check_counters, close_pools, get_pool, init_db
+
+LEGACY_DATABASE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'emall.db')
+
+
+def applied_versions(conn):
+    return [row[0] for row in conn.execute('SELECT version FROM schema_version ORDER BY version')]
+
+
+# A copy of the database shipped with the repository, from before migrations,
+# with the migrations applied by the first init_db()
+@pytest.fixture
+def legacy_database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'legacy.db')
+    shutil.copy(LEGACY_DATABASE, path)
+    monkeypatch.setitem(app.config, 'DATABASE', path)
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_LOG', '')
+    close_pools()
+    with app.app_context():
+        applied = init_db()
+    yield applied
+    close_pools()
+
+
+@pytest.fixture
+def legacy_conn(legacy_database):
+    pool = get_pool()
+    conn = pool.acquire()
+    yield conn
+    conn.rollback()
+    pool.release(conn)
+
+
+def test_fresh_database_has_every_migration(conn):
+    assert applied_versions(conn) == [version for version, name, statements in MIGRATIONS]
+
+
+def test_migrations_run_once(database):
+    with app.app_context():
+        assert init_db() == []
+
+
+def test_legacy_database_is_migrated(legacy_database, legacy_conn):
+    conn = legacy_conn
+    assert [version for version, name in legacy_database] == [version for version, name, statements in MIGRATIONS]
+    assert applied_versions(conn) == [version for version, name in legacy_database]
+    assert check_counters(conn) == []
+    # Existing rows are carried over, with search indexes built for them
+    shops = conn.execute('SELECT COUNT(*) FROM shop').fetchone()[0]
+    assert shops > 0
+    assert conn.execute('SELECT COUNT(*) FROM shop_fts').fetchone()[0] == shops
+
+
+@pytest.mark.parametrize('connection', ['conn', 'legacy_conn'])
+def test_update_triggers_skip_row_version_stamps(connection, request):
+    conn = request.getfixturevalue(connection)
+    tables = ', '.join(f"'{table}'" for table in CHANGE_LOG_COLUMNS)
+    for name, sql in conn.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ({tables})"):
+        if re.search(r'\bUPDATE\s+ON\s', sql, re.IGNORECASE):
+            assert 'row_version' in sql, f'{name} fires on row_version stamps'
+
+
+def test_legacy_triggers_ignore_the_stamp(legacy_conn):
+    conn = legacy_conn
+    client = app.test_client()
+    # auto_expire_leases expires an active lease that has ended when it is updated
+    shop = client.post('/api/shops', json={'name': 'Kiosk'}).json['id']
+    tenant = client.post('/api/tenants', json={'name': 'Seasonal'}).json['id']
+    response = client.post('/api/leases', json={
+        'tenant_id': tenant, 'shop_id': shop, 'start_date': '2020-01-01', 'end_date': '2020-12-31',
+        'rent_amount': 500,
+    })
+    lease_id = response.json['id']
+    lease = conn.execute('SELECT status, row_version FROM lease WHERE id = ?', (lease_id,)).fetchone()
+    assert lease['status'] == 'Active'
+    assert lease['row_version'] > 0
+    ops = [row[0] for row in conn.execute(
+        "SELECT op FROM change_log WHERE table_name = 'lease' AND row_id = ? ORDER BY id", (lease_id,)
+    )]
+    assert ops == ['insert']
+
+    # A real update still fires it
+    conn.execute('UPDATE lease SET rent_amount = 550 WHERE id = ?', (lease_id,))
+    conn.commit()
+    assert conn.execute('SELECT status FROM lease WHERE id = ?', (lease_id,)).fetchone()[0] == 'Expired'
@@ -0,0 +1,51 @@
+import pytest
+
+from app import ConnectionPool, PoolTimeoutError, app, get_db, get_pool
+
+
+def test_one_connection_per_app_context(database):
+    pool = get_pool()
+    with app.app_context():
+        conn = get_db()
+        assert get_db() is conn
+        assert pool.snapshot()['in_use_connections'] == 1
+    assert pool.snapshot()['in_use_connections'] == 0
+
+    with app.app_context():
+        assert get_db() is conn
+
+
+def test_requests_reuse_pooled_connections(client):
+    pool = get_pool()
+    hits = pool.stats['hits']
+    for _ in range(3):
+        assert client.get('/api/shops').status_code == 200
+    assert pool.stats['hits'] == hits + 3
+
+    stats = client.get('/api/_debug/pool').json
+    assert pool.database in [entry['database'] for entry in stats]
+
+
+def test_exhausted_pool_times_out(database):
+    pool = ConnectionPool(database, size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats['timeouts'] == 1
+
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.release(conn)
+    pool.close()
+
+
+def test_release_rolls_back_uncommitted_work(database):
+    pool = ConnectionPool(database, size=1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO shop (name) VALUES ('Uncommitted')")
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM shop WHERE name = 'Uncommitted'").fetchone()[0] == 0
+    pool.release(conn)
+    pool.close()
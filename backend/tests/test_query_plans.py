@@ -0,0 +1,20 @@
+import app as emall
+from app import check_query_plans
+
+
+def test_hot_queries_use_indexes(conn):
+    assert check_query_plans(conn) == []
+
+
+def test_unexpected_scans_are_reported(conn, monkeypatch):
+    monkeypatch.setattr(emall, 'HOT_QUERIES', [
+        # No index on size
+        ('shops_by_size', 'SELECT id FROM shop WHERE size > ?', (100,), None),
+        # The driving table is scanned, but so is lease for every tenant
+        ('tenant_rent', '''
+         SELECT t.id, (SELECT SUM(rent_amount) FROM lease WHERE lease.rent_amount > t.id)
+         FROM tenant t
+         ''', (), 't'),
+        ('shop_summary', 'SELECT * FROM shop_summary', (), 's'),
+    ])
+    assert check_query_plans(conn) == ['shops_by_size: SCAN shop', 'tenant_rent: SCAN lease']
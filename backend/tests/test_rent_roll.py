@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+
+def test_rent_roll_prorates_by_day(client, make_shop, make_tenant, make_lease):
+    make_lease(make_tenant(), make_shop(), start_date='2031-01-16', end_date='2031-02-28', rent_amount=3100)
+    roll = client.get('/api/analytics/rent-roll?from=2031-01&months=3').json
+    assert [month['month'] for month in roll['months']] == ['2031-01', '2031-02', '2031-03']
+    assert [month['expected_revenue'] for month in roll['months']] == [1600, 3100, 0]
+
+
+def test_leases_without_numeric_rent_are_skipped(client, conn, make_shop, make_tenant, make_lease):
+    before = client.get('/api/analytics/rent-roll?from=2031-01&months=1').json
+    lease_id = make_lease(make_tenant(), make_shop(), start_date='2031-01-01', end_date='2031-12-31')
+    conn.execute("UPDATE lease SET rent_amount = 'tbc' WHERE id = ?", (lease_id,))
+    conn.commit()
+
+    response = client.get('/api/analytics/rent-roll?from=2031-01&months=1')
+    assert response.status_code == 200
+    assert response.json['totals']['leases'] == before['totals']['leases']
+    assert response.json['months'] == before['months']
@@ -0,0 +1,17 @@
+def test_search_ranks_across_types(client, make_shop, make_tenant):
+    make_shop('Acme Kiosk', location='North Wing')
+    make_tenant('Acme Trading', business_type='Retail')
+    results = client.get('/api/search?q=acm').json['results']
+    assert {(result['type'], result['title']) for result in results} >= {('shop', 'Acme Kiosk'), ('tenant', 'Acme Trading')}
+    assert '<mark>Acme</mark>' in results[0]['snippet']
+
+
+def test_repeated_types_are_searched_once(client, make_shop):
+    shop = make_shop('Zephyr Books')
+    response = client.get('/api/search?q=zephyr&types=shop,shop,shop')
+    assert response.status_code == 200
+    assert [(result['type'], result['id']) for result in response.json['results']] == [('shop', shop)]
+
+
+def test_unknown_type_is_rejected(client):
+    assert client.get('/api/search?q=acme&types=shop,lease').status_code == 400
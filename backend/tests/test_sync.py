@@ -0,0 +1,243 @@
+# /api/sync: full copies paged by (row_version, id), deltas from a version,
+# and replicas built from them matching the database while writers and
+# tombstone pruning run at the same time.
+import random
+import threading
+import time
+
+import pytest
+
+from app import CHANGE_LOG_COLUMNS, app, background_jobs
+
+
+class Replica:
+    def __init__(self, limit, tables=None):
+        self.limit = limit
+        self.tables = {table: {} for table in tables or CHANGE_LOG_COLUMNS}
+        self.query = f"&tables={','.join(tables)}" if tables else ''
+        self.client = app.test_client()
+        self.since = 0
+        self.cursor = None
+        self.full_syncs = 0
+        self.received = []
+
+    # Fetch and apply one response; returns whether there is more to fetch
+    def pull(self):
+        url = f'/api/sync?since={self.since}&limit={self.limit}{self.query}'
+        if self.cursor:
+            url += f'&after={self.cursor}'
+        response = self.client.get(url)
+        assert response.status_code == 200, response.json
+        delta = response.json
+
+        if delta['full'] and not self.cursor:
+            self.full_syncs += 1
+            self.tables = {table: {} for table in self.tables}
+        for table, changes in delta['tables'].items():
+            rows = self.tables[table]
+            for row in changes['rows']:
+                rows[row[0]] = row
+                self.received.append((table, row[0]))
+            for row_id in changes['deleted']:
+                rows.pop(row_id, None)
+        assert sum(len(changes['rows']) + len(changes['deleted']) for changes in delta['tables'].values()) <= self.limit
+        self.since = delta['version']
+        self.cursor = delta['next_cursor']
+        return delta['has_more']
+
+    def drain(self):
+        while self.pull():
+            pass
+
+    def restart(self):
+        self.since = 0
+        self.cursor = None
+
+    def differences(self, conn):
+        problems = []
+        for table, replica_rows in self.tables.items():
+            columns = CHANGE_LOG_COLUMNS[table]
+            expected = {row[0]: list(row) for row in conn.execute(f"SELECT {', '.join(columns)} FROM {table}")}
+            missing = expected.keys() - replica_rows.keys()
+            extra = replica_rows.keys() - expected.keys()
+            stale = [row_id for row_id in expected.keys() & replica_rows.keys() if expected[row_id] != replica_rows[row_id]]
+            for label, ids in (('missing', missing), ('extra', extra), ('stale', stale)):
+                if ids:
+                    problems.append(f'{table}: {len(ids)} {label} rows, e.g. {sorted(ids)[:5]}')
+        return problems
+
+
+@pytest.fixture
+def tickets(conn, make_shop):
+    shops = [make_shop(f'Shop {i}') for i in range(10)]
+    conn.executemany(
+        "INSERT INTO maintenance (shop_id, description, reported_date, status, priority) VALUES (?, ?, '2026-01-01', 'Pending', 'Low')",
+        [(shops[i % len(shops)], f'Ticket {i}') for i in range(200)]
+    )
+    conn.commit()
+    return shops
+
+
+@pytest.mark.parametrize('limit', [1, 7, 5000])
+def test_full_sync_pages_every_row_once(client, conn, tickets, limit):
+    replica = Replica(limit)
+    replica.drain()
+    assert replica.full_syncs == 1
+    assert len(replica.received) == len(set(replica.received))
+    assert len(replica.received) == sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                                        for table in CHANGE_LOG_COLUMNS)
+    assert replica.differences(conn) == []
+
+
+def test_full_sync_respects_limit(client, tickets):
+    response = client.get('/api/sync?limit=25')
+    delta = response.json
+    assert delta['full'] and delta['has_more'] and delta['next_cursor']
+    assert sum(len(changes['rows']) for changes in delta['tables'].values()) == 25
+
+    # The next page carries on at the same snapshot version whatever since says
+    following = client.get(f"/api/sync?since=0&limit=25&after={delta['next_cursor']}").json
+    assert following['version'] == delta['version']
+    first_ids = {(table, row[0]) for table, changes in delta['tables'].items() for row in changes['rows']}
+    next_ids = {(table, row[0]) for table, changes in following['tables'].items() for row in changes['rows']}
+    assert first_ids and next_ids and not first_ids & next_ids
+
+
+def test_writes_between_pages_are_not_lost(client, conn, tickets):
+    replica = Replica(30, tables=['shop', 'maintenance'])
+    replica.pull()
+    sent = sorted(replica.tables['maintenance'])
+    unsent = conn.execute('SELECT MAX(id) FROM maintenance').fetchone()[0]
+    assert unsent not in replica.tables['maintenance']
+
+    # Change rows already sent and rows still to come, then finish the copy
+    client.put(f'/api/shops/{tickets[0]}', json={**client.get(f'/api/shops/{tickets[0]}').json, 'rent': 1234})
+    conn.execute("UPDATE maintenance SET priority = 'High' WHERE id = ?", (sent[0],))
+    conn.execute('DELETE FROM maintenance WHERE id IN (?, ?)', (sent[1], unsent))
+    conn.execute(
+        "INSERT INTO maintenance (shop_id, description, status, priority) VALUES (?, 'Late', 'Pending', 'Low')",
+        (tickets[1],)
+    )
+    conn.commit()
+    replica.drain()
+
+    assert replica.full_syncs == 1
+    assert replica.differences(conn) == []
+    assert client.get(f'/api/sync?since={replica.since}').json['has_more'] is False
+
+
+def test_delta_pages_split_on_versions(client, conn, tickets):
+    replica = Replica(5000)
+    replica.drain()
+    conn.execute("UPDATE maintenance SET priority = 'Medium' WHERE id IN (SELECT id FROM maintenance LIMIT 40)")
+    conn.execute('DELETE FROM maintenance WHERE id IN (SELECT id FROM maintenance ORDER BY id DESC LIMIT 5)')
+    conn.commit()
+
+    replica.limit = 8
+    requests = 0
+    while replica.pull():
+        requests += 1
+    assert requests == 5
+    assert replica.full_syncs == 1
+    assert replica.differences(conn) == []
+
+
+def test_pruned_tombstones_force_a_full_sync(client, conn, tickets, monkeypatch):
+    replica = Replica(5000)
+    replica.drain()
+    conn.execute('DELETE FROM maintenance WHERE id = (SELECT MIN(id) FROM maintenance)')
+    conn.execute("UPDATE sync_tombstone SET deleted_at = datetime('now', '-1 day')")
+    conn.commit()
+    monkeypatch.setitem(app.config, 'SYNC_TOMBSTONE_DAYS', 0)
+    next(job for job in background_jobs if job.name == 'prune_sync_tombstones').run_once()
+
+    replica.drain()
+    assert replica.full_syncs == 2
+    assert replica.differences(conn) == []
+
+
+@pytest.mark.parametrize('after', ['nonsense', 'WzEsICJub3BlIiwgMCwgMF0'])
+def test_invalid_cursor(client, after):
+    assert client.get(f'/api/sync?after={after}').status_code == 400
+
+
+def write_loop(worker_id, stop, ticket_ids, shop_ids, lock):
+    rng = random.Random(worker_id)
+    client = app.test_client()
+    done = 0
+    while not stop.is_set():
+        with lock:
+            ticket_id = rng.choice(ticket_ids)
+        shop_id = rng.choice(shop_ids)
+        op = rng.random()
+
+        if op < 0.3:
+            response = client.post('/api/maintenance', json={
+                'shop_id': shop_id, 'description': f'Sync check {worker_id}-{done}', 'priority': 'Low',
+            })
+            if response.status_code == 201:
+                with lock:
+                    ticket_ids.append(response.json['id'])
+        elif op < 0.5:
+            ticket = client.get(f'/api/maintenance/{ticket_id}').json
+            if ticket and 'id' in ticket:
+                ticket['priority'] = rng.choice(['Low', 'Medium', 'High'])
+                client.put(f'/api/maintenance/{ticket_id}', json=ticket)
+        elif op < 0.6:
+            client.post(f'/api/maintenance/{ticket_id}/complete', json={'resolution_notes': 'Fixed'})
+        elif op < 0.75:
+            if client.delete(f'/api/maintenance/{ticket_id}').status_code == 200:
+                with lock:
+                    if ticket_id in ticket_ids and len(ticket_ids) > 1:
+                        ticket_ids.remove(ticket_id)
+        elif op < 0.9:
+            shop = client.get(f'/api/shops/{shop_id}').json
+            if shop and 'id' in shop:
+                shop['rent'] = (shop.get('rent') or 0) + 1
+                client.put(f'/api/shops/{shop_id}', json=shop)
+        else:
+            # Several leases in one transaction
+            client.post('/api/leases/batch', json={
+                'filter': {'shop_id': shop_id}, 'changes': {'rent_increase_pct': 1},
+            })
+        done += 1
+
+
+def test_replicas_match_under_concurrent_writes(client, conn, tickets, monkeypatch):
+    monkeypatch.setitem(app.config, 'SYNC_TOMBSTONE_DAYS', 0)
+    prune = next(job for job in background_jobs if job.name == 'prune_sync_tombstones')
+    ticket_ids = [row[0] for row in conn.execute('SELECT id FROM maintenance')]
+    shop_ids = [row[0] for row in conn.execute('SELECT id FROM shop')]
+    replicas = [Replica(7), Replica(50), Replica(app.config['SYNC_MAX_LIMIT'])]
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def follow(replica, restart_at):
+        started = time.monotonic()
+        while not stop.is_set():
+            if restart_at is not None and time.monotonic() - started > restart_at:
+                replica.restart()
+                restart_at = None
+            if not replica.pull():
+                time.sleep(0.01)
+
+    def pruner():
+        # Tombstones are dated to the second, so each run drops the ones from earlier seconds
+        while not stop.wait(0.3):
+            prune.run_once()
+
+    threads = [threading.Thread(target=write_loop, args=(i, stop, ticket_ids, shop_ids, lock)) for i in range(3)]
+    threads += [threading.Thread(target=follow, args=(replica, 1.0 if i == 1 else None))
+                for i, replica in enumerate(replicas)]
+    threads.append(threading.Thread(target=pruner))
+    for thread in threads:
+        thread.start()
+    time.sleep(3)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    for replica in replicas:
+        replica.drain()
+        assert replica.differences(conn) == []
+    assert replicas[1].full_syncs >= 2
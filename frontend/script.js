@@ -43,6 +43,66 @@ function safeRequest(url, options = {}) {
     });
 }
 
+// Last response body and ETag for each GET URL, so unchanged data is
+// revalidated with If-None-Match instead of downloaded again
+const responseCache = new Map();
+
+// fetch() for GET requests that honors the server's ETags. A 304 is turned
+// back into a 200 carrying the cached body, so callers use it like fetch().
+function cachedFetch(url) {
+  const cached = responseCache.get(url);
+  const headers = cached ? { 'If-None-Match': cached.etag } : {};
+  
+  return fetch(url, { headers, cache: 'no-store' })
+    .then(response => {
+      if (response.status === 304 && cached) {
+        return new Response(cached.body, {
+          status: 200,
+          headers: { 'Content-Type': cached.contentType, 'ETag': cached.etag }
+        });
+      }
+      
+      const etag = response.headers.get('ETag');
+      if (!response.ok || !etag) {
+        return response;
+      }
+      return response.clone().text().then(body => {
+        responseCache.set(url, {
+          etag,
+          body,
+          contentType: response.headers.get('Content-Type')
+        });
+        return response;
+      });
+    });
+}
+
+// Number of rows each list table loads at a time
+const PAGE_SIZE = 50;
+
+// Build the URL for one page of a list endpoint, continuing after cursor if given
+function pageUrl(url, cursor) {
+  let pagedUrl = `${url}?limit=${PAGE_SIZE}`;
+  if (cursor) {
+    pagedUrl += `&after=${encodeURIComponent(cursor)}`;
+  }
+  return pagedUrl;
+}
+
+// Show the "Load more" button under a table while there are more pages
+function updateLoadMoreButton(buttonId, nextCursor, loadPage) {
+  const button = document.getElementById(buttonId);
+  if (!button) return;
+  
+  if (nextCursor) {
+    button.style.display = 'block';
+    button.onclick = () => loadPage(nextCursor);
+  } else {
+    button.style.display = 'none';
+    button.onclick = null;
+  }
+}
+
 function showPage(pageId) {
     // Update active sidebar item
     const menuItems = document.querySelectorAll('.sidebar li');
@@ -71,28 +131,16 @@ function showPage(pageId) {
   
   // Function to load dashboard data
   function loadDashboardData() {
-    // Load main dashboard stats
-    fetch('/api/dashboard')
+    // Load all dashboard stats in one request
+    cachedFetch('/api/dashboard/summary')
       .then(response => response.json())
       .then(data => {
         document.getElementById('total-shops').textContent = data.total_shops;
         document.getElementById('occupied-shops').textContent = data.occupied_shops;
         document.getElementById('total-tenants').textContent = data.total_tenants;
         document.getElementById('pending-maintenance').textContent = data.pending_maintenance;
-      })
-      .catch(error => {
-        console.error('Error loading dashboard data:', error);
-        document.getElementById('total-shops').textContent = 'Error';
-        document.getElementById('occupied-shops').textContent = 'Error';
-        document.getElementById('total-tenants').textContent = 'Error';
-        document.getElementById('pending-maintenance').textContent = 'Error';
-      });
-      
-    // Load tenant-lease statistics
-    fetch('/api/dashboard/tenant-stats')
-      .then(response => response.json())
-      .then(data => {
-        // Update the numeric values
+        
+        // Update the tenant-lease numeric values
         document.getElementById('tenants-with-leases').textContent = data.tenants_with_leases;
         document.getElementById('tenants-without-leases').textContent = data.tenants_without_leases;
         document.getElementById('lease-coverage-percent').textContent = data.lease_coverage_percent + '%';
@@ -111,7 +159,11 @@ function showPage(pageId) {
         }
       })
       .catch(error => {
-        console.error('Error loading tenant-lease statistics:', error);
+        console.error('Error loading dashboard data:', error);
+        document.getElementById('total-shops').textContent = 'Error';
+        document.getElementById('occupied-shops').textContent = 'Error';
+        document.getElementById('total-tenants').textContent = 'Error';
+        document.getElementById('pending-maintenance').textContent = 'Error';
         document.getElementById('tenants-with-leases').textContent = 'Error';
         document.getElementById('tenants-without-leases').textContent = 'Error';
         document.getElementById('lease-coverage-percent').textContent = 'Error';
@@ -121,7 +173,7 @@ function showPage(pageId) {
   // Function to load recent data for dashboard
   function loadRecentData() {
     // Load recent leases
-    fetch('/api/leases')
+    cachedFetch('/api/leases')
       .then(response => response.json())
       .then(leases => {
         const recentLeasesContainer = document.getElementById('recent-leases');
@@ -153,7 +205,7 @@ function showPage(pageId) {
       });
     
     // Load maintenance alerts
-    fetch('/api/maintenance')
+    cachedFetch('/api/maintenance')
       .then(response => response.json())
       .then(maintenance => {
         const maintenanceAlertsContainer = document.getElementById('maintenance-alerts');
@@ -193,47 +245,58 @@ function showPage(pageId) {
       });
   }
   
+  // Fill a shop list row; also used to re-render a row when it changes
+  function renderShopRow(row, shop) {
+    row.innerHTML = '';
+    row.dataset.id = shop.id;
+    row.dataset.tenantId = shop.tenant_id || '';
+    row.insertCell().textContent = shop.id;
+    row.insertCell().textContent = shop.name;
+    row.insertCell().textContent = shop.location || 'N/A';
+    row.insertCell().textContent = shop.size ? shop.size.toFixed(2) : 'N/A';
+    row.insertCell().textContent = shop.rent ? `$${shop.rent.toFixed(2)}` : 'N/A';
+    
+    const statusCell = row.insertCell();
+    statusCell.textContent = shop.status;
+    statusCell.className = `status ${shop.status.toLowerCase()}`;
+    
+    const actionsCell = row.insertCell();
+    const editButton = document.createElement('button');
+    editButton.textContent = 'Edit';
+    editButton.className = 'edit-btn';
+    editButton.onclick = () => editShop(shop.id);
+    actionsCell.appendChild(editButton);
+    
+    const deleteButton = document.createElement('button');
+    deleteButton.textContent = 'Delete';
+    deleteButton.className = 'delete-btn';
+    deleteButton.onclick = () => deleteShop(shop.id, shop.name);
+    actionsCell.appendChild(deleteButton);
+  }
+  
   // Function to load shops data
-  function loadShopsData() {
-    fetch('/api/shops')
+  function loadShopsData(cursor) {
+    // Without a cursor the table is reloaded from the first page
+    cachedFetch(pageUrl('/api/shops', cursor))
       .then(response => response.json())
-      .then(shops => {
+      .then(page => {
+        const shops = page.items;
         const tableBody = document.getElementById('shops-table-body');
-        tableBody.innerHTML = '';
+        if (!cursor) {
+          tableBody.innerHTML = '';
+        }
         
-        if (shops.length === 0) {
+        if (shops.length === 0 && !cursor) {
           const row = tableBody.insertRow();
           const cell = row.insertCell();
           cell.colSpan = 7;
           cell.textContent = 'No shops available.';
         } else {
           // Add rows for each shop
-          shops.forEach(shop => {
-            const row = tableBody.insertRow();
-            row.insertCell().textContent = shop.id;
-            row.insertCell().textContent = shop.name;
-            row.insertCell().textContent = shop.location || 'N/A';
-            row.insertCell().textContent = shop.size ? shop.size.toFixed(2) : 'N/A';
-            row.insertCell().textContent = shop.rent ? `$${shop.rent.toFixed(2)}` : 'N/A';
-            
-            const statusCell = row.insertCell();
-            statusCell.textContent = shop.status;
-            statusCell.className = `status ${shop.status.toLowerCase()}`;
-            
-            const actionsCell = row.insertCell();
-            const editButton = document.createElement('button');
-            editButton.textContent = 'Edit';
-            editButton.className = 'edit-btn';
-            editButton.onclick = () => editShop(shop.id);
-            actionsCell.appendChild(editButton);
-            
-            const deleteButton = document.createElement('button');
-            deleteButton.textContent = 'Delete';
-            deleteButton.className = 'delete-btn';
-            deleteButton.onclick = () => deleteShop(shop.id, shop.name);
-            actionsCell.appendChild(deleteButton);
-          });
+          shops.forEach(shop => renderShopRow(tableBody.insertRow(), shop));
         }
+        
+        updateLoadMoreButton('shops-load-more', page.next_cursor, loadShopsData);
       })
       .catch(error => {
         console.error('Error loading shops data:', error);
@@ -246,46 +309,57 @@ function showPage(pageId) {
       });
   }
   
+  // Fill a tenant list row; also used to re-render a row when it changes
+  function renderTenantRow(row, tenant) {
+    row.innerHTML = '';
+    row.dataset.id = tenant.id;
+    row.dataset.shopId = tenant.shop_id || '';
+    row.insertCell().textContent = tenant.id;
+    row.insertCell().textContent = tenant.name;
+    row.insertCell().textContent = tenant.shop_name || 'N/A';
+    row.insertCell().textContent = tenant.contact || 'N/A';
+    row.insertCell().textContent = tenant.email || 'N/A';
+    row.insertCell().textContent = tenant.business_type || 'N/A';
+    
+    // Add action buttons
+    const actionsCell = row.insertCell();
+    
+    const editButton = document.createElement('button');
+    editButton.textContent = 'Edit';
+    editButton.className = 'edit-btn';
+    editButton.onclick = () => editTenant(tenant.id);
+    actionsCell.appendChild(editButton);
+    
+    const deleteButton = document.createElement('button');
+    deleteButton.textContent = 'Delete';
+    deleteButton.className = 'delete-btn';
+    deleteButton.onclick = () => deleteTenant(tenant.id, tenant.name);
+    actionsCell.appendChild(deleteButton);
+  }
+  
   // Function to load tenants data
-  function loadTenantsData() {
-    fetch('/api/tenants')
+  function loadTenantsData(cursor) {
+    // Without a cursor the table is reloaded from the first page
+    cachedFetch(pageUrl('/api/tenants', cursor))
       .then(response => response.json())
-      .then(tenants => {
+      .then(page => {
+        const tenants = page.items;
         const tableBody = document.getElementById('tenants-table-body');
-        tableBody.innerHTML = '';
+        if (!cursor) {
+          tableBody.innerHTML = '';
+        }
         
-        if (tenants.length === 0) {
+        if (tenants.length === 0 && !cursor) {
           const row = tableBody.insertRow();
           const cell = row.insertCell();
           cell.colSpan = 7;
           cell.textContent = 'No tenants available.';
         } else {
           // Add rows for each tenant
-          tenants.forEach(tenant => {
-            const row = tableBody.insertRow();
-            row.insertCell().textContent = tenant.id;
-            row.insertCell().textContent = tenant.name;
-            row.insertCell().textContent = tenant.shop_name || 'N/A';
-            row.insertCell().textContent = tenant.contact || 'N/A';
-            row.insertCell().textContent = tenant.email || 'N/A';
-            row.insertCell().textContent = tenant.business_type || 'N/A';
-            
-            // Add action buttons
-            const actionsCell = row.insertCell();
-            
-            const editButton = document.createElement('button');
-            editButton.textContent = 'Edit';
-            editButton.className = 'edit-btn';
-            editButton.onclick = () => editTenant(tenant.id);
-            actionsCell.appendChild(editButton);
-            
-            const deleteButton = document.createElement('button');
-            deleteButton.textContent = 'Delete';
-            deleteButton.className = 'delete-btn';
-            deleteButton.onclick = () => deleteTenant(tenant.id, tenant.name);
-            actionsCell.appendChild(deleteButton);
-          });
+          tenants.forEach(tenant => renderTenantRow(tableBody.insertRow(), tenant));
         }
+        
+        updateLoadMoreButton('tenants-load-more', page.next_cursor, loadTenantsData);
       })
       .catch(error => {
         console.error('Error loading tenants data:', error);
@@ -298,50 +372,62 @@ function showPage(pageId) {
       });
   }
   
+  // Fill a lease list row; also used to re-render a row when it changes
+  function renderLeaseRow(row, lease) {
+    row.innerHTML = '';
+    row.dataset.id = lease.id;
+    row.dataset.tenantId = lease.tenant_id;
+    row.dataset.shopId = lease.shop_id;
+    row.insertCell().textContent = lease.id;
+    row.insertCell().textContent = lease.tenant_name;
+    row.insertCell().textContent = lease.shop_name;
+    row.insertCell().textContent = lease.start_date;
+    row.insertCell().textContent = lease.end_date;
+    row.insertCell().textContent = `$${lease.rent_amount.toFixed(2)}`;
+    
+    const statusCell = row.insertCell();
+    statusCell.textContent = lease.status;
+    statusCell.className = `status ${lease.status.toLowerCase()}`;
+    
+    // Add action buttons
+    const actionsCell = row.insertCell();
+    
+    const editButton = document.createElement('button');
+    editButton.textContent = 'Edit';
+    editButton.className = 'edit-btn';
+    editButton.onclick = () => editLease(lease.id);
+    actionsCell.appendChild(editButton);
+    
+    const deleteButton = document.createElement('button');
+    deleteButton.textContent = 'Delete';
+    deleteButton.className = 'delete-btn';
+    deleteButton.onclick = () => deleteLease(lease.id);
+    actionsCell.appendChild(deleteButton);
+  }
+  
   // Function to load leases data
-  function loadLeasesData() {
-    fetch('/api/leases')
+  function loadLeasesData(cursor) {
+    // Without a cursor the table is reloaded from the first page
+    cachedFetch(pageUrl('/api/leases', cursor))
       .then(response => response.json())
-      .then(leases => {
+      .then(page => {
+        const leases = page.items;
         const tableBody = document.getElementById('leases-table-body');
-        tableBody.innerHTML = '';
+        if (!cursor) {
+          tableBody.innerHTML = '';
+        }
         
-        if (leases.length === 0) {
+        if (leases.length === 0 && !cursor) {
           const row = tableBody.insertRow();
           const cell = row.insertCell();
           cell.colSpan = 8;
           cell.textContent = 'No leases available.';
         } else {
           // Add rows for each lease
-          leases.forEach(lease => {
-            const row = tableBody.insertRow();
-            row.insertCell().textContent = lease.id;
-            row.insertCell().textContent = lease.tenant_name;
-            row.insertCell().textContent = lease.shop_name;
-            row.insertCell().textContent = lease.start_date;
-            row.insertCell().textContent = lease.end_date;
-            row.insertCell().textContent = `$${lease.rent_amount.toFixed(2)}`;
-            
-            const statusCell = row.insertCell();
-            statusCell.textContent = lease.status;
-            statusCell.className = `status ${lease.status.toLowerCase()}`;
-            
-            // Add action buttons
-            const actionsCell = row.insertCell();
-            
-            const editButton = document.createElement('button');
-            editButton.textContent = 'Edit';
-            editButton.className = 'edit-btn';
-            editButton.onclick = () => editLease(lease.id);
-            actionsCell.appendChild(editButton);
-            
-            const deleteButton = document.createElement('button');
-            deleteButton.textContent = 'Delete';
-            deleteButton.className = 'delete-btn';
-            deleteButton.onclick = () => deleteLease(lease.id);
-            actionsCell.appendChild(deleteButton);
-          });
+          leases.forEach(lease => renderLeaseRow(tableBody.insertRow(), lease));
         }
+        
+        updateLoadMoreButton('leases-load-more', page.next_cursor, loadLeasesData);
       })
       .catch(error => {
         console.error('Error loading leases data:', error);
@@ -354,54 +440,62 @@ function showPage(pageId) {
       });
   }
   
+  // Fill a maintenance list row; also used to re-render a row when it changes
+  function renderMaintenanceRow(row, maintenance) {
+    row.innerHTML = '';
+    row.dataset.id = maintenance.id;
+    row.dataset.shopId = maintenance.shop_id;
+    
+    // Format the date to YYYY-MM-DD
+    const reportedDate = new Date(maintenance.reported_date).toISOString().split('T')[0];
+    const resolvedDate = maintenance.resolved_date ? new Date(maintenance.resolved_date).toISOString().split('T')[0] : '';
+    
+    // Create priority label with appropriate class
+    const priorityClass = maintenance.priority.toLowerCase();
+    const priorityLabel = `<span class="priority-label ${priorityClass}">${maintenance.priority}</span>`;
+    
+    // Create status label with appropriate class
+    const statusClass = maintenance.status.toLowerCase().replace(' ', '-');
+    const statusLabel = `<span class="status-label ${statusClass}">${maintenance.status}</span>`;
+    
+    row.innerHTML = `
+      <td>${maintenance.id}</td>
+      <td>${maintenance.shop_name}</td>
+      <td>${maintenance.description}</td>
+      <td>${priorityLabel}</td>
+      <td>${statusLabel}</td>
+      <td>${reportedDate}</td>
+      <td>${resolvedDate || '-'}</td>
+      <td>
+        <button class="edit-btn" onclick="editMaintenance(${maintenance.id})">Edit</button>
+        <button class="delete-btn" onclick="deleteMaintenance(${maintenance.id})">Delete</button>
+      </td>
+    `;
+  }
+  
   // Function to load maintenance data
-  function loadMaintenanceData() {
+  function loadMaintenanceData(cursor) {
     showLoader();
-    fetch('/api/maintenance')
+    // Without a cursor the table is reloaded from the first page
+    cachedFetch(pageUrl('/api/maintenance', cursor))
       .then(response => response.json())
-      .then(data => {
+      .then(page => {
+        const data = page.items;
         const tableBody = document.getElementById('maintenance-table-body');
-        tableBody.innerHTML = '';
+        if (!cursor) {
+          tableBody.innerHTML = '';
+        }
         
-        if (data.length === 0) {
+        if (data.length === 0 && !cursor) {
           const row = tableBody.insertRow();
           const cell = row.insertCell();
           cell.colSpan = 8;
           cell.textContent = 'No maintenance requests available.';
         } else {
-          data.forEach(maintenance => {
-            const row = tableBody.insertRow();
-            
-            // Format the date to YYYY-MM-DD
-            const reportedDate = new Date(maintenance.reported_date).toISOString().split('T')[0];
-            const resolvedDate = maintenance.resolved_date ? new Date(maintenance.resolved_date).toISOString().split('T')[0] : '';
-            
-            // Create priority label with appropriate class
-            const priorityClass = maintenance.priority.toLowerCase();
-            const priorityLabel = `<span class="priority-label ${priorityClass}">${maintenance.priority}</span>`;
-            
-            // Create status label with appropriate class
-            const statusClass = maintenance.status.toLowerCase().replace(' ', '-');
-            const statusLabel = `<span class="status-label ${statusClass}">${maintenance.status}</span>`;
-            
-            row.innerHTML = `
-              <td>${maintenance.id}</td>
-              <td>${maintenance.shop_name}</td>
-              <td>${maintenance.description}</td>
-              <td>${priorityLabel}</td>
-              <td>${statusLabel}</td>
-              <td>${reportedDate}</td>
-              <td>${resolvedDate || '-'}</td>
-              <td>
-                <button class="edit-btn" onclick="editMaintenance(${maintenance.id})">Edit</button>
-                <button class="delete-btn" onclick="deleteMaintenance(${maintenance.id})">Delete</button>
-              </td>
-            `;
-            
-            tableBody.appendChild(row);
-          });
+          data.forEach(maintenance => renderMaintenanceRow(tableBody.insertRow(), maintenance));
         }
         
+        updateLoadMoreButton('maintenance-load-more', page.next_cursor, loadMaintenanceData);
         hideLoader();
       })
       .catch(error => {
@@ -478,7 +572,7 @@ function showPage(pageId) {
   }
   
   function loadShopsForDropdown(dropdownId) {
-    fetch('/api/shops')
+    cachedFetch('/api/shops')
       .then(response => response.json())
       .then(shops => {
         const dropdown = document.getElementById(dropdownId);
@@ -512,7 +606,7 @@ function showPage(pageId) {
   
   function editMaintenance(maintenanceId) {
     showLoader();
-    fetch(`/api/maintenance/${maintenanceId}`)
+    cachedFetch(`/api/maintenance/${maintenanceId}`)
       .then(response => {
         if (!response.ok) {
           throw new Error('Maintenance request not found');
@@ -669,14 +763,14 @@ function showPage(pageId) {
     // Refresh maintenance button
     const refreshMaintenanceBtn = document.getElementById('refresh-maintenance-btn');
     if (refreshMaintenanceBtn) {
-      refreshMaintenanceBtn.addEventListener('click', loadMaintenanceData);
+      refreshMaintenanceBtn.addEventListener('click', () => loadMaintenanceData());
     }
   });
   
   // Shop Modal Functions
   function editShop(shopId) {
     // Get shop data from API
-    fetch(`/api/shops/${shopId}`)
+    cachedFetch(`/api/shops/${shopId}`)
       .then(response => response.json())
       .then(shop => {
         // Populate form with shop data
@@ -854,12 +948,197 @@ function showPage(pageId) {
     }
   }
   
+  // List tables kept up to date from the change feed. newestFirst tables
+  // get inserted rows at the top, the others at the bottom.
+  const LIVE_TABLES = {
+    shop: { bodyId: 'shops-table-body', url: '/api/shops', render: renderShopRow, load: loadShopsData, loadMore: 'shops-load-more' },
+    tenant: { bodyId: 'tenants-table-body', url: '/api/tenants', render: renderTenantRow, load: loadTenantsData, loadMore: 'tenants-load-more' },
+    lease: { bodyId: 'leases-table-body', url: '/api/leases', render: renderLeaseRow, load: loadLeasesData, loadMore: 'leases-load-more' },
+    maintenance: { bodyId: 'maintenance-table-body', url: '/api/maintenance', render: renderMaintenanceRow, load: loadMaintenanceData, loadMore: 'maintenance-load-more', newestFirst: true }
+  };
+  
+  // Rows in other tables that show columns from a changed row: the table,
+  // the row attribute holding the changed id, and the list filter for it
+  const DEPENDENT_ROWS = {
+    shop: [['tenant', 'shop-id', 'shop_id'], ['lease', 'shop-id', 'shop_id'], ['maintenance', 'shop-id', 'shop_id']],
+    tenant: [['shop', 'tenant-id', 'tenant_id'], ['lease', 'tenant-id', 'tenant_id']]
+  };
+  
+  let changeFeed = null;
+  let dashboardRefresh = null;
+  
+  // Fetch rows of a table again through a list filter and re-render the ones on screen
+  function refreshRows(table, attr, filter, value) {
+    const live = LIVE_TABLES[table];
+    const tableBody = document.getElementById(live.bodyId);
+    const shown = tableBody.querySelectorAll(`tr[data-${attr}="${value}"]`);
+    if (shown.length === 0) return Promise.resolve([]);
+    
+    return cachedFetch(`${live.url}?${filter}=${encodeURIComponent(value)}&limit=${PAGE_SIZE}`)
+      .then(response => response.json())
+      .then(page => {
+        const items = new Map(page.items.map(item => [String(item.id), item]));
+        shown.forEach(row => {
+          const item = items.get(row.dataset.id);
+          if (item) live.render(row, item);
+        });
+        return page.items;
+      });
+  }
+  
+  // Apply one change from /api/events to the tables on screen
+  function applyChange(change) {
+    const live = LIVE_TABLES[change.table];
+    if (!live) return;
+    const tableBody = document.getElementById(live.bodyId);
+    const existing = tableBody.querySelector(`tr[data-id="${change.id}"]`);
+    
+    if (change.op === 'delete') {
+      if (existing) existing.remove();
+    } else if (existing) {
+      refreshRows(change.table, 'id', 'id', change.id);
+    } else if (change.op === 'insert' && tableBody.rows.length > 0) {
+      // Only add the row if the table is showing that end of the list
+      const loadMore = document.getElementById(live.loadMore);
+      const atEnd = live.newestFirst || !loadMore || loadMore.style.display === 'none';
+      if (atEnd) {
+        cachedFetch(`${live.url}?id=${change.id}&limit=1`)
+          .then(response => response.json())
+          .then(page => {
+            if (page.items.length === 0 || tableBody.querySelector(`tr[data-id="${change.id}"]`)) return;
+            if (!tableBody.rows[0].dataset.id) tableBody.innerHTML = '';
+            const row = live.newestFirst ? tableBody.insertRow(0) : tableBody.insertRow();
+            live.render(row, page.items[0]);
+          });
+      }
+    }
+    
+    (DEPENDENT_ROWS[change.table] || []).forEach(([table, attr, filter]) => {
+      refreshRows(table, attr, filter, change.id);
+    });
+    // A tenant or lease moving into a shop changes what that shop's row shows
+    if (change.row && change.row.shop_id && change.table !== 'shop') {
+      refreshRows('shop', 'id', 'id', change.row.shop_id);
+    }
+    
+    // Many changes arrive together from one save, so refresh the dashboard once
+    clearTimeout(dashboardRefresh);
+    dashboardRefresh = setTimeout(() => {
+      loadDashboardData();
+      loadRecentData();
+    }, 500);
+  }
+  
+  // Subscribe to the server's change feed. The browser reconnects on its own
+  // and resumes from the last event it saw.
+  function startChangeFeed() {
+    if (!window.EventSource || changeFeed) return;
+    
+    changeFeed = new EventSource('/api/events');
+    changeFeed.addEventListener('change', event => {
+      applyChange(JSON.parse(event.data));
+    });
+    changeFeed.addEventListener('reset', () => {
+      // Changes were missed, so reload everything from scratch
+      responseCache.clear();
+      loadDashboardData();
+      loadRecentData();
+      Object.values(LIVE_TABLES).forEach(live => {
+        if (document.getElementById(live.bodyId).rows.length > 0) {
+          live.load();
+        }
+      });
+    });
+  }
+  
+  // Open the edit form for a search result
+  const SEARCH_ACTIONS = {
+    shop: editShop,
+    tenant: editTenant,
+    maintenance: editMaintenance
+  };
+  
+  let searchTimer = null;
+  
+  // Search as the user types, once they pause for a moment
+  function setupSearch() {
+    const input = document.getElementById('global-search');
+    const panel = document.getElementById('search-results');
+    if (!input || !panel) return;
+    
+    input.addEventListener('input', () => {
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(() => runSearch(input.value.trim(), panel), 250);
+    });
+    input.addEventListener('keydown', event => {
+      if (event.key === 'Escape') {
+        input.value = '';
+        panel.classList.remove('open');
+      }
+    });
+    // Let a click on a result land before the panel closes
+    input.addEventListener('blur', () => setTimeout(() => panel.classList.remove('open'), 200));
+    input.addEventListener('focus', () => {
+      if (panel.children.length > 0 && input.value.trim()) panel.classList.add('open');
+    });
+  }
+  
+  function runSearch(text, panel) {
+    if (!text) {
+      panel.innerHTML = '';
+      panel.classList.remove('open');
+      return;
+    }
+    
+    cachedFetch(`/api/search?q=${encodeURIComponent(text)}&limit=10`)
+      .then(response => response.json())
+      .then(data => {
+        panel.innerHTML = '';
+        const results = data.results || [];
+        if (results.length === 0) {
+          const empty = document.createElement('div');
+          empty.className = 'search-result';
+          empty.textContent = data.error || 'No matches';
+          panel.appendChild(empty);
+        }
+        results.forEach(result => {
+          const item = document.createElement('div');
+          item.className = 'search-result';
+          
+          const type = document.createElement('div');
+          type.className = 'result-type';
+          type.textContent = result.type;
+          const title = document.createElement('div');
+          title.textContent = result.title;
+          // The server escapes snippets and only adds <mark> tags
+          const snippet = document.createElement('div');
+          snippet.className = 'result-snippet';
+          snippet.innerHTML = result.snippet;
+          
+          item.append(type, title, snippet);
+          item.onclick = () => {
+            panel.classList.remove('open');
+            SEARCH_ACTIONS[result.type](result.id);
+          };
+          panel.appendChild(item);
+        });
+        panel.classList.add('open');
+      })
+      .catch(error => {
+        console.error('Error searching:', error);
+      });
+  }
+  
   // Initialize
   document.addEventListener('DOMContentLoaded', function() {
     // Load initial data
     loadDashboardData();
     loadRecentData();
     
+    // Keep the tables up to date with changes made elsewhere
+    startChangeFeed();
+    setupSearch();
+    
     // Check for expired leases on page load
     checkExpiredLeases();
     
@@ -871,9 +1150,9 @@ function showPage(pageId) {
   function editTenant(tenantId) {
     // First load shop data for the dropdown
     Promise.all([
-      fetch('/api/shops'),
-      fetch('/api/tenants'),
-      fetch('/api/leases')
+      cachedFetch('/api/shops'),
+      cachedFetch('/api/tenants'),
+      cachedFetch('/api/leases')
     ])
       .then(responses => Promise.all(responses.map(res => res.json())))
       .then(([shops, tenants, leases]) => {
@@ -888,7 +1167,7 @@ function showPage(pageId) {
         });
         
         // Then get tenant data
-        return fetch(`/api/tenants/${tenantId}`)
+        return cachedFetch(`/api/tenants/${tenantId}`)
           .then(response => response.json())
           .then(tenant => {
             // Find existing lease for this tenant
@@ -964,7 +1243,7 @@ function showPage(pageId) {
     leaseSection.style.display = 'none';
     
     // Load shops for the dropdown
-    fetch('/api/shops')
+    cachedFetch('/api/shops')
       .then(response => response.json())
       .then(shops => {
         const shopSelect = document.getElementById('tenant-modal-shop');
@@ -1268,8 +1547,8 @@ function showPage(pageId) {
   function editLease(leaseId) {
     // First load shops and tenants data for the dropdowns
     Promise.all([
-      fetch('/api/shops'),
-      fetch('/api/tenants')
+      cachedFetch('/api/shops'),
+      cachedFetch('/api/tenants')
     ])
       .then(responses => Promise.all(responses.map(res => res.json())))
       .then(([shops, tenants]) => {
@@ -1296,7 +1575,7 @@ function showPage(pageId) {
         });
         
         // Get lease data
-        return fetch(`/api/leases/${leaseId}`);
+        return cachedFetch(`/api/leases/${leaseId}`);
       })
       .then(response => response.json())
       .then(lease => {
@@ -1324,8 +1603,8 @@ function showPage(pageId) {
   function showAddLeaseForm() {
     // Load shops and tenants data for the dropdowns
     Promise.all([
-      fetch('/api/shops'),
-      fetch('/api/tenants')
+      cachedFetch('/api/shops'),
+      cachedFetch('/api/tenants')
     ])
       .then(responses => Promise.all(responses.map(res => res.json())))
       .then(([shops, tenants]) => {
@@ -1468,7 +1747,7 @@ function showPage(pageId) {
     if (confirm(`Are you sure you want to delete this lease? This will also remove the associated tenant.`)) {
       showLoader();
       
-      fetch(`/api/leases/${leaseId}`)
+      cachedFetch(`/api/leases/${leaseId}`)
         .then(response => {
           if (!response.ok) {
             throw new Error('Failed to fetch lease details');